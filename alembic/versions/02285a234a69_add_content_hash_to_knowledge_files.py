@@ -0,0 +1,30 @@
+"""Add content_hash to knowledge_files
+
+Revision ID: 02285a234a69
+Revises: 23d33bca99ee
+Create Date: 2026-10-19 13:40:26.551902
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '02285a234a69'
+down_revision: Union[str, Sequence[str], None] = '23d33bca99ee'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('knowledge_files', sa.Column('content_hash', sa.String(length=64), nullable=True))
+    op.create_index('ix_knowledge_files_companion_id_content_hash', 'knowledge_files', ['companion_id', 'content_hash'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_knowledge_files_companion_id_content_hash', table_name='knowledge_files')
+    op.drop_column('knowledge_files', 'content_hash')
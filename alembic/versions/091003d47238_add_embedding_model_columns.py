@@ -0,0 +1,34 @@
+"""Add embedding model columns for re-embedding migrations
+
+Revision ID: 091003d47238
+Revises: 1eefa93f62f8
+Create Date: 2026-10-19 15:03:47.286119
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '091003d47238'
+down_revision: Union[str, Sequence[str], None] = '1eefa93f62f8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('companions', sa.Column('embedding_model', sa.String(length=255), nullable=True))
+    op.add_column('companions', sa.Column('reindex_model', sa.String(length=255), nullable=True))
+    op.create_index(op.f('ix_companions_reindex_model'), 'companions', ['reindex_model'], unique=False)
+    op.add_column('knowledge_files', sa.Column('reindexed_model', sa.String(length=255), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('knowledge_files', 'reindexed_model')
+    op.drop_index(op.f('ix_companions_reindex_model'), table_name='companions')
+    op.drop_column('companions', 'reindex_model')
+    op.drop_column('companions', 'embedding_model')
@@ -0,0 +1,28 @@
+"""Add committed_chunks checkpoint to knowledge_file_parts
+
+Revision ID: 17b64f98b676
+Revises: 9ec6cbd41f56
+Create Date: 2026-10-19 11:48:09.615204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '17b64f98b676'
+down_revision: Union[str, Sequence[str], None] = '9ec6cbd41f56'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('knowledge_file_parts', sa.Column('committed_chunks', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('knowledge_file_parts', 'committed_chunks')
@@ -0,0 +1,30 @@
+"""Add deleted_at to companions
+
+Revision ID: 1eefa93f62f8
+Revises: 02285a234a69
+Create Date: 2026-10-19 14:22:08.417305
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '1eefa93f62f8'
+down_revision: Union[str, Sequence[str], None] = '02285a234a69'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('companions', sa.Column('deleted_at', sa.DateTime(), nullable=True))
+    op.create_index(op.f('ix_companions_deleted_at'), 'companions', ['deleted_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_companions_deleted_at'), table_name='companions')
+    op.drop_column('companions', 'deleted_at')
@@ -0,0 +1,28 @@
+"""Add chunk_manifest to knowledge_file_parts
+
+Revision ID: 23d33bca99ee
+Revises: 17b64f98b676
+Create Date: 2026-10-19 12:31:52.877140
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '23d33bca99ee'
+down_revision: Union[str, Sequence[str], None] = '17b64f98b676'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('knowledge_file_parts', sa.Column('chunk_manifest', sa.LargeBinary(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('knowledge_file_parts', 'chunk_manifest')
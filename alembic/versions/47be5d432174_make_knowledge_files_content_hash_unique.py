@@ -0,0 +1,53 @@
+"""Make knowledge_files (companion_id, content_hash) unique for non-failed files
+
+Revision ID: 47be5d432174
+Revises: cdcbe4dfc1c2
+Create Date: 2026-10-19 18:02:14.318450
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '47be5d432174'
+down_revision: Union[str, Sequence[str], None] = 'cdcbe4dfc1c2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # 并发上传留下的重复文件：保留最早的一个，其余清空 content_hash（不再参与去重），否则唯一索引无法创建
+    op.execute(
+        """
+        UPDATE knowledge_files SET content_hash = NULL
+        WHERE id IN (
+            SELECT id FROM (
+                SELECT id, row_number() OVER (
+                    PARTITION BY companion_id, content_hash ORDER BY created_at, id
+                ) AS rn
+                FROM knowledge_files
+                WHERE content_hash IS NOT NULL AND status <> 'FAILED'
+            ) ranked
+            WHERE rn > 1
+        )
+        """
+    )
+    op.drop_index('ix_knowledge_files_companion_id_content_hash', table_name='knowledge_files')
+    # 处理失败的文件不算重复（允许重新上传），所以是部分唯一索引
+    op.create_index(
+        'ix_knowledge_files_companion_id_content_hash',
+        'knowledge_files',
+        ['companion_id', 'content_hash'],
+        unique=True,
+        postgresql_where=sa.text("status <> 'FAILED'"),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_knowledge_files_companion_id_content_hash', table_name='knowledge_files')
+    op.create_index('ix_knowledge_files_companion_id_content_hash', 'knowledge_files', ['companion_id', 'content_hash'], unique=False)
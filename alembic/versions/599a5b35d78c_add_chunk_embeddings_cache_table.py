@@ -0,0 +1,35 @@
+"""Add chunk_embeddings cache table
+
+Revision ID: 599a5b35d78c
+Revises: 9bc3c17cce4f
+Create Date: 2026-10-19 10:12:31.418260
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '599a5b35d78c'
+down_revision: Union[str, Sequence[str], None] = '9bc3c17cce4f'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('chunk_embeddings',
+    sa.Column('model_id', sa.String(length=255), nullable=False),
+    sa.Column('content_hash', sa.LargeBinary(length=32), nullable=False),
+    sa.Column('dimension', sa.SmallInteger(), nullable=False),
+    sa.Column('embedding', sa.LargeBinary(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+    sa.PrimaryKeyConstraint('model_id', 'content_hash')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('chunk_embeddings')
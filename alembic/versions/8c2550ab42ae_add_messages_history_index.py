@@ -0,0 +1,41 @@
+"""Add composite index for chat history keyset pagination
+
+Revision ID: 8c2550ab42ae
+Revises: 091003d47238
+Create Date: 2026-10-19 16:12:08.437215
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8c2550ab42ae'
+down_revision: Union[str, Sequence[str], None] = '091003d47238'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # messages 是写入最频繁的表：CONCURRENTLY 建索引不阻塞写入（不能在事务中执行）
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_messages_companion_id_user_id_created_at_id',
+            'messages',
+            ['companion_id', 'user_id', 'created_at', 'id'],
+            unique=False,
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'ix_messages_companion_id_user_id_created_at_id',
+            table_name='messages',
+            postgresql_concurrently=True,
+        )
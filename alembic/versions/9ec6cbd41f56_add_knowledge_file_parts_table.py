@@ -0,0 +1,40 @@
+"""Add knowledge_file_parts table
+
+Revision ID: 9ec6cbd41f56
+Revises: 599a5b35d78c
+Create Date: 2026-10-19 11:05:47.203918
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9ec6cbd41f56'
+down_revision: Union[str, Sequence[str], None] = '599a5b35d78c'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('knowledge_file_parts',
+    sa.Column('file_id', sa.UUID(), nullable=False),
+    sa.Column('part_no', sa.Integer(), nullable=False),
+    sa.Column('start_page', sa.Integer(), nullable=False),
+    sa.Column('end_page', sa.Integer(), nullable=True),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('chunk_count', sa.Integer(), nullable=False),
+    sa.Column('error_message', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), server_default=sa.text('now()'), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), server_default=sa.text('now()'), nullable=True),
+    sa.ForeignKeyConstraint(['file_id'], ['knowledge_files.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('file_id', 'part_no')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('knowledge_file_parts')
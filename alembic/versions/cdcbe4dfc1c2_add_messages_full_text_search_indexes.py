@@ -0,0 +1,62 @@
+"""Add full-text search indexes on messages.content
+
+Revision ID: cdcbe4dfc1c2
+Revises: 8c2550ab42ae
+Create Date: 2026-10-19 16:48:31.902544
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'cdcbe4dfc1c2'
+down_revision: Union[str, Sequence[str], None] = '8c2550ab42ae'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _has_zhparser() -> bool:
+    bind = op.get_bind()
+    return bool(bind.execute(sa.text("SELECT 1 FROM pg_available_extensions WHERE name = 'zhparser'")).scalar())
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # pg_trgm 随 PostgreSQL 发行（contrib），在 UTF-8 locale 下按字符切分三元组，中文同样适用
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_messages_content_trgm',
+            'messages',
+            ['content'],
+            unique=False,
+            postgresql_using='gin',
+            postgresql_ops={'content': 'gin_trgm_ops'},
+            postgresql_concurrently=True,
+        )
+
+    # 安装了 zhparser 的数据库额外建立中文分词的全文索引（MESSAGE_SEARCH_BACKEND=zhparser 时使用）
+    if _has_zhparser():
+        op.execute("CREATE EXTENSION IF NOT EXISTS zhparser")
+        op.execute(
+            "DO $$ BEGIN "
+            "IF NOT EXISTS (SELECT 1 FROM pg_ts_config WHERE cfgname = 'zh') THEN "
+            "CREATE TEXT SEARCH CONFIGURATION zh (PARSER = zhparser); "
+            "ALTER TEXT SEARCH CONFIGURATION zh ADD MAPPING FOR n, v, a, i, e, l WITH simple; "
+            "END IF; END $$"
+        )
+        with op.get_context().autocommit_block():
+            op.execute(
+                "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_messages_content_zh "
+                "ON messages USING gin (to_tsvector('zh', content))"
+            )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_messages_content_zh")
+        op.drop_index('ix_messages_content_trgm', table_name='messages', postgresql_concurrently=True)
@@ -13,8 +13,9 @@ import redis.asyncio as redis
 
 from app.core.config import settings
 from app.db.session import SessionLocal, AsyncSessionLocal # 导入异步会话
-from app.models.user import User
+from app.core.metrics import metrics
 from app.crud import crud_user
+from app.schemas.user import UserPrincipal
 
 reusable_oauth2 = OAuth2PasswordBearer(
     tokenUrl=f"{settings.API_V1_STR}/auth/login" # 将 'wechat' 修改为 'login'
@@ -51,11 +52,25 @@ async def get_redis_client_ws(websocket: WebSocket) -> redis.Redis:
     # 直接返回在启动时创建的那个共享的客户端实例
     return websocket.app.state.redis_client
 
+async def _resolve_principal(db: AsyncSession, payload: dict, user_id: UUID) -> UserPrincipal:
+    """
+    token 中带有用户声明（AUTH_TOKEN_EMBED_CLAIMS）时直接构造，不访问缓存和数据库；
+    否则读取缓存的用户快照，缓存未命中时才查询数据库。
+    """
+    if settings.AUTH_TOKEN_EMBED_CLAIMS and "email" in payload:
+        metrics.incr("auth_principal_from_claims")
+        return UserPrincipal(id=user_id, email=payload["email"], nickname=payload.get("nickname"))
+
+    user = await crud_user.get_user_principal(db=db, user_id=user_id)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    return user
+
 async def get_current_user(
     db: AsyncSession = Depends(get_async_db), token: str = Depends(reusable_oauth2)
-) -> User:
+) -> UserPrincipal:
     """
-    用于普通 REST API 的依赖项 (异步)。
+    用于普通 REST API 的依赖项 (异步)，返回只读的用户快照。
     """
     try:
         payload = jwt.decode(
@@ -73,18 +88,14 @@ async def get_current_user(
             detail="Could not validate credentials",
         )
     
-    user = await crud_user.get_user(db=db, user_id=user_id)
-
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    return user
+    return await _resolve_principal(db, payload, user_id)
 
 async def get_current_user_from_token(
     token: str = Query(...),
     db: AsyncSession = Depends(get_async_db)
-) -> User:
+) -> UserPrincipal:
     """
-    专门为 WebSocket 创建的认证函数 (异步)。
+    专门为 WebSocket 创建的认证函数 (异步)，返回只读的用户快照。
     """
     try:
         payload = jwt.decode(
@@ -103,8 +114,4 @@ async def get_current_user_from_token(
             detail="Could not validate credentials",
         )
     
-    user = await crud_user.get_user(db=db, user_id=user_id)
-
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    return user
\ No newline at end of file
+    return await _resolve_principal(db, payload, user_id)
\ No newline at end of file
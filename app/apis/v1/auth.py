@@ -9,10 +9,25 @@ from app.schemas import user as user_schema
 from app.crud import crud_user
 from app.apis.dependencies import get_async_db
 # 2. 导入我们刚刚创建的所有新工具函数
-from app.core.security import create_jwt_for_user, verify_password, get_password_hash
+from app.core.config import settings
+from app.core.security import (
+    PasswordHashingBusy,
+    create_jwt_for_user,
+    get_password_hash_async,
+    user_principal_claims,
+    verify_password_async,
+)
 
 router = APIRouter()
 
+
+def _password_hashing_busy() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="登录请求过多，请稍后重试。",
+        headers={"Retry-After": "1"},
+    )
+
 # class WechatLoginRequest(BaseModel): # <--- 删除旧的模型
 #     code: str
 
@@ -45,8 +60,11 @@ async def register_new_user(
             detail="该邮箱已被注册，请直接登录或使用其他邮箱。",
         )
     
-    # 将明文密码哈希化
-    hashed_password = get_password_hash(user_in.password)
+    # 将明文密码哈希化（在密码哈希线程池中执行，不阻塞事件循环）
+    try:
+        hashed_password = await get_password_hash_async(user_in.password)
+    except PasswordHashingBusy:
+        raise _password_hashing_busy()
     
     # 在数据库中创建用户
     user = await crud_user.create_user(
@@ -70,8 +88,12 @@ async def login_for_access_token(
     # 通过 email (在表单中是 username 字段) 查找用户
     user = await crud_user.get_user_by_email(db=db, email=form_data.username)
     
-    # 验证用户是否存在以及密码是否正确
-    if not user or not verify_password(form_data.password, user.hashed_password):
+    # 验证用户是否存在以及密码是否正确（在密码哈希线程池中执行，不阻塞事件循环）
+    try:
+        password_ok = user is not None and await verify_password_async(form_data.password, user.hashed_password)
+    except PasswordHashingBusy:
+        raise _password_hashing_busy()
+    if not password_ok:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="邮箱或密码错误",
@@ -79,7 +101,8 @@ async def login_for_access_token(
         )
     
     # 如果验证成功，为用户创建 JWT (这部分逻辑完全复用)
-    access_token = create_jwt_for_user(user.id)
+    claims = user_principal_claims(user) if settings.AUTH_TOKEN_EMBED_CLAIMS else None
+    access_token = create_jwt_for_user(user.id, claims)
     return {"access_token": access_token, "token_type": "bearer"}
 
 # --- ▲▲▲ 修改完成 ▲▲▲ ---
\ No newline at end of file
@@ -1,18 +1,22 @@
 # app/apis/v1/chat.py
 import traceback
-from typing import List
+from datetime import datetime
+from typing import Optional
 from uuid import UUID
 from fastapi import (
     APIRouter,
     WebSocket,
     WebSocketDisconnect,
     Depends,
+    HTTPException,
+    Query,
     status,
 )
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 import redis.asyncio as redis
 
-from app.models.user import User
+from app.schemas.user import UserPrincipal
 from app.schemas import message as message_schema
 from app.crud import crud_message, crud_companion
 from app.apis.dependencies import (
@@ -22,48 +26,139 @@ from app.apis.dependencies import (
     get_current_user
 )
 from app.services.chat_service import ChatService
+from app.services.chat_export import export_filename, export_media_type, iter_export
+from app.core.pagination import decode_cursor, encode_cursor, page_cursors
 
 router = APIRouter()
 
 @router.get(
     "/messages/{companion_id}",
-    response_model=List[message_schema.MessageRead],
+    response_model=message_schema.MessagePage,
     summary="获取历史聊天记录"
 )
 async def read_messages(
     companion_id: UUID,
-    skip: int = 0,
-    limit: int = 50,
+    limit: int = Query(50, ge=1, le=200),
+    before: Optional[str] = Query(None, description="上一页返回的 before_cursor：加载更早的记录"),
+    after: Optional[str] = Query(None, description="上一页返回的 after_cursor：加载更新的记录"),
     db: AsyncSession = Depends(get_async_db),
-    current_user: User = Depends(get_current_user),
+    current_user: UserPrincipal = Depends(get_current_user),
 ):
-    messages = await crud_message.get_messages_by_companion_ascending(
+    """
+    键集分页：不传游标时返回最新的 limit 条，页内按时间正序。
+    """
+    if before and after:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="before 与 after 不能同时使用")
+    try:
+        before_key = decode_cursor(before, (datetime, UUID)) if before else None
+        after_key = decode_cursor(after, (datetime, UUID)) if after else None
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="无效的分页游标")
+
+    messages, has_more = await crud_message.get_messages_page(
         db=db,
         companion_id=companion_id,
         user_id=current_user.id,
-        skip=skip,
-        limit=limit
+        limit=limit,
+        before=before_key,
+        after=after_key,
+    )
+    before_cursor, after_cursor = page_cursors(
+        messages,
+        lambda message: (message.created_at, message.id),
+        has_more=has_more,
+        before=before_key is not None,
+        after=after_key is not None,
+    )
+    return message_schema.MessagePage(items=messages, before_cursor=before_cursor, after_cursor=after_cursor)
+
+
+@router.get(
+    "/messages/{companion_id}/search",
+    response_model=message_schema.MessageSearchPage,
+    summary="搜索聊天记录"
+)
+async def search_messages(
+    companion_id: UUID,
+    q: str = Query(..., min_length=1, max_length=100, description="搜索词"),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="上一页返回的 next_cursor"),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UserPrincipal = Depends(get_current_user),
+):
+    """
+    在当前用户与指定伙伴的聊天记录中搜索，按相关度降序返回，键集分页。
+    """
+    companion = await crud_companion.get_companion_snapshot(db=db, companion_id=companion_id)
+    if not companion or companion.owner_id != current_user.id:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Companion not found")
+    query = q.strip()
+    if not query:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="搜索词不能为空")
+    try:
+        after = decode_cursor(cursor, (float, datetime, UUID)) if cursor else None
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="无效的分页游标")
+
+    hits, has_more = await crud_message.search_messages(
+        db=db, companion_id=companion_id, user_id=current_user.id, query=query, limit=limit, after=after
+    )
+    items = [
+        message_schema.MessageSearchHit(**message_schema.MessageRead.model_validate(message).model_dump(), rank=rank)
+        for message, rank in hits
+    ]
+    next_cursor = None
+    if has_more and hits:
+        last, last_rank = hits[-1]
+        next_cursor = encode_cursor([last_rank, last.created_at, last.id])
+    return message_schema.MessageSearchPage(items=items, next_cursor=next_cursor)
+
+
+@router.get(
+    "/export",
+    summary="导出聊天记录",
+    response_class=StreamingResponse,
+)
+async def export_messages(
+    companion_id: Optional[UUID] = Query(None, description="只导出与该伙伴的会话；不传则导出全部会话"),
+    format: str = Query("ndjson", pattern="^(ndjson|json)$", description="ndjson: 每行一条消息；json: 一个数组"),
+    gzip: bool = Query(False, description="是否 gzip 压缩"),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UserPrincipal = Depends(get_current_user),
+):
+    """
+    流式导出当前用户的聊天记录（按伙伴、时间正序）。服务端游标逐批读取，内存占用与消息总数无关。
+    """
+    if companion_id is not None:
+        companion = await crud_companion.get_companion_snapshot(db=db, companion_id=companion_id)
+        if not companion or companion.owner_id != current_user.id:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Companion not found")
+
+    filename = export_filename(format, gzip, companion_id)
+    return StreamingResponse(
+        iter_export(current_user.id, companion_id, format, gzip),
+        media_type=export_media_type(format, gzip),
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
     )
-    return messages
 
 
 @router.websocket("/ws/{companion_id}")
 async def websocket_endpoint(
     websocket: WebSocket,
     companion_id: UUID,
-    current_user: User = Depends(get_current_user_from_token),
+    current_user: UserPrincipal = Depends(get_current_user_from_token),
     db: AsyncSession = Depends(get_async_db),
     redis_client: redis.Redis = Depends(get_redis_client_ws)
 ):
     # 校验：确保伙伴存在且用户有权限连接
-    companion = await crud_companion.get_companion_by_id(db=db, companion_id=companion_id)
-    if not companion or companion.user_id != current_user.id:
+    companion = await crud_companion.get_companion_snapshot(db=db, companion_id=companion_id)
+    if not companion or companion.owner_id != current_user.id:
         await websocket.close(code=status.WS_1007_INVALID_FRAMEWORK_PAYLOAD, reason="Companion not found or access denied")
         return
 
     await websocket.accept()
 
-    # 只传递 companion_id（标量）给 ChatService，避免持有 ORM 实例导致干扰
+    # 只传递 companion_id（标量）给 ChatService，每条消息都重新读取（缓存的）最新人设
     chat_service = ChatService(
         db=db,
         redis_client=redis_client,
@@ -1,18 +1,18 @@
 # app/apis/v1/companions.py (最终修正版，修复了CompanionRead引用)
 
+import logging
 from typing import List, Any
 from uuid import UUID
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from sqlalchemy.ext.asyncio import AsyncSession
-import redis.asyncio as redis
+from arq.connections import ArqRedis
 
 # 🚀 1. 导入修正后的 Schema
 from app.schemas import companion as companion_schema
 from app.crud import crud_companion
-from app.models.user import User
-from app.services.rag_service import rag_service
-from app.services.memory_manager import MemoryManager
-from app.apis.dependencies import get_async_db, get_current_user, get_redis_client 
+from app.schemas.user import UserPrincipal
+from app.apis.dependencies import get_async_db, get_current_user
+from app.core.job_queues import enqueue_task
 
 router = APIRouter()
 
@@ -28,7 +28,7 @@ async def create_new_companion(
     *,
     companion_in: companion_schema.CompanionCreate,
     db: AsyncSession = Depends(get_async_db),
-    current_user: User = Depends(get_current_user),
+    current_user: UserPrincipal = Depends(get_current_user),
 ) -> Any:
     companion = await crud_companion.create_companion(
         db=db, companion_in=companion_in, user_id=current_user.id
@@ -47,7 +47,7 @@ async def read_user_companions(
     skip: int = 0,
     limit: int = 100,
     db: AsyncSession = Depends(get_async_db),
-    current_user: User = Depends(get_current_user),
+    current_user: UserPrincipal = Depends(get_current_user),
 ) -> Any:
     companions = await crud_companion.get_multi_companions_by_owner(
         db=db, user_id=current_user.id, skip=skip, limit=limit
@@ -70,7 +70,7 @@ async def read_single_companion(
     # 但从安全角度讲，任何需要 companion_id 的操作都应验证用户身份。
     # 我们暂时保持原样，但在未来的重构中这是一个值得优化的地方。
 ) -> Any:
-    companion = await crud_companion.get_companion_by_id(db=db, companion_id=companion_id)
+    companion = await crud_companion.get_companion_snapshot(db=db, companion_id=companion_id)
     if not companion:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Companion not found")
     # 理想情况下，这里应该检查 companion.owner_id 是否等于 current_user.id
@@ -89,7 +89,7 @@ async def update_existing_companion(
     companion_id: UUID,
     companion_in: companion_schema.CompanionUpdate,
     db: AsyncSession = Depends(get_async_db),
-    current_user: User = Depends(get_current_user),
+    current_user: UserPrincipal = Depends(get_current_user),
 ) -> Any:
     db_companion = await crud_companion.get_companion_by_id(db=db, companion_id=companion_id)
     if not db_companion:
@@ -107,50 +107,30 @@ async def update_existing_companion(
 @router.delete(
     "/{companion_id}",
     response_model=dict,
-    status_code=status.HTTP_200_OK, 
+    status_code=status.HTTP_202_ACCEPTED,
     summary="彻底删除 AI 伙伴及其所有数据",
-    description="删除一个AI伙伴，并联动删除其在向量数据库、Redis缓存和数据库中的所有关联数据。",
+    description="立即将AI伙伴标记为已删除（之后不再可见），其在向量数据库、Redis缓存和数据库中的所有关联数据由后台任务清理。",
 )
 async def delete_companion_fully(
     *,
+    request: Request,
     companion_id: UUID,
     db: AsyncSession = Depends(get_async_db),
-    current_user: User = Depends(get_current_user),
-    redis_client: redis.Redis = Depends(get_redis_client),
+    current_user: UserPrincipal = Depends(get_current_user),
 ) -> dict:
     db_companion = await crud_companion.get_companion_by_id(db=db, companion_id=companion_id)
     if not db_companion:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="AI伙伴不存在")
-    # ‼️ 原代码中 user_id 字段名有误，根据您的 crud_companion.py 和 models, 应该是 owner_id
     if db_companion.owner_id != current_user.id:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="没有权限删除此AI伙伴")
 
     companion_name = db_companion.name
-    companion_id_str = str(companion_id)
-    user_id_str = str(current_user.id)
-    
-    print(f"开始彻底删除AI伙伴: {companion_name} (ID: {companion_id_str})")
-
-    try:
-        await rag_service.delete_vectors_by_companion_id(companion_id=companion_id_str)
-        
-        memory_manager = MemoryManager(
-            redis_client=redis_client,
-            companion_name=db_companion.name,
-            user_id=user_id_str
-        )
-        await memory_manager.delete_memory()
-        
-        await crud_companion.delete_companion(db=db, db_companion=db_companion)
-        
-        # ‼️ 注意: 在您的原代码中，db.commit() 在 delete_companion 之后，
-        # 而 crud_companion.delete_companion 内部已经 commit 了。这可能会导致问题。
-        # 最好的实践是在 crud 层 commit，或者在 api 层统一 commit/rollback。
-        # 我们暂时保持原样，但这是未来重构的要点。
-
-        return {"message": f"AI伙伴 '{companion_name}' 已被彻底删除。"}
-
-    except Exception as e:
-        await db.rollback()
-        print(f"删除过程中发生严重错误: {e}")
-        raise HTTPException(status_code=500, detail=f"删除伙伴时发生内部错误: {str(e)}")
\ No newline at end of file
+    await crud_companion.soft_delete_companion(db=db, db_companion=db_companion)
+
+    # 向量、所有用户的对话记忆、上传文件和数据库记录都在 worker 中批量清理；
+    # 任务 ID 由 companion_id 决定，重复请求不会产生多个清理任务
+    arq_pool: ArqRedis = request.app.state.arq_pool
+    await enqueue_task(arq_pool, "cleanup_companion_task", companion_id)
+    logging.info(f"AI伙伴 {companion_name} (ID: {companion_id}) 已标记删除，清理任务已入队")
+
+    return {"message": f"AI伙伴 '{companion_name}' 已删除，关联数据将在后台清理。"}
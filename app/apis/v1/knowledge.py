@@ -1,21 +1,53 @@
+import asyncio
+import os
 from uuid import UUID, uuid4
 from pathlib import Path
 import shutil
-from typing import List
+from typing import List, Tuple
 from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Request, Response
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 from arq.connections import ArqRedis
 
 from app.schemas import knowledge_file as kf_schema
-from app.crud import crud_knowledge_file, crud_companion
-from app.models.user import User
+from app.crud import crud_knowledge_file, crud_knowledge_file_part, crud_companion
+from app.schemas.user import UserPrincipal
 from app.apis.dependencies import get_async_db, get_current_user
+from app.core.config import settings
+from app.core.job_queues import enqueue_task
+from app.services.chunk_manifest import manifest_id_ranges
+from app.services.embedding import companion_namespaces
+from app.services.knowledge_upload import (
+    UPLOAD_DIR,
+    ArchiveError,
+    UploadTooLarge,
+    copy_and_hash,
+    is_archive,
+    is_supported,
+    iter_archive_members,
+    save_upload,
+)
 
 router = APIRouter()
 
-UPLOAD_DIR = Path("uploads")
 UPLOAD_DIR.mkdir(exist_ok=True)
 
+
+async def _duplicate_file_conflict(db: AsyncSession, companion_id: UUID, content_hash: str) -> HTTPException:
+    """
+    唯一索引拒绝了写入（同一伙伴下有内容相同、未失败的文件）时返回的 409；
+    已有的文件可能属于仍未提交的并发请求，此时查不到它的 ID
+    """
+    duplicates = await crud_knowledge_file.get_files_by_content_hash(
+        db, companion_id=companion_id, content_hashes=[content_hash]
+    )
+    existing = duplicates.get(content_hash)
+    return HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail={"message": "An identical file already exists", "file_id": str(existing.id) if existing else None},
+    )
+
+
 @router.post(
     "/companions/{companion_id}/knowledge",
     response_model=kf_schema.KnowledgeFileRead,
@@ -27,39 +59,180 @@ async def upload_knowledge_file(
     request: Request,
     companion_id: UUID,
     db: AsyncSession = Depends(get_async_db),
-    current_user: User = Depends(get_current_user),
+    current_user: UserPrincipal = Depends(get_current_user),
     file: UploadFile = File(...),
 ):
-    companion = await crud_companion.get_companion_by_id(db=db, companion_id=companion_id)
-    if not companion or companion.user_id != current_user.id:
+    companion = await crud_companion.get_companion_snapshot(db=db, companion_id=companion_id)
+    if not companion or companion.owner_id != current_user.id:
         raise HTTPException(status_code=404, detail="Companion not found or access denied")
 
+    file_name = Path(file.filename or "").name
+    if not is_supported(file_name):
+        await file.close()
+        raise HTTPException(status_code=400, detail=f"Unsupported file type: {file_name}")
+
+    db_file_id = uuid4()
+    file_dir = UPLOAD_DIR / str(companion_id) / str(db_file_id)
+    file_dir.mkdir(parents=True, exist_ok=True)
+    file_path = file_dir / file_name
     try:
-        db_file_id = uuid4()
-        file_dir = UPLOAD_DIR / str(companion_id) / str(db_file_id)
-        file_dir.mkdir(parents=True, exist_ok=True)
-        file_path = file_dir / file.filename
-        with file_path.open("wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        # 分块异步写盘，不阻塞事件循环；同时计算 sha256，超过大小上限立即中止
+        _, content_hash = await save_upload(
+            file, file_path, settings.KNOWLEDGE_UPLOAD_MAX_BYTES, settings.UPLOAD_CHUNK_SIZE
+        )
+    except UploadTooLarge as e:
+        shutil.rmtree(file_dir, ignore_errors=True)
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(e))
+    except BaseException:
+        shutil.rmtree(file_dir, ignore_errors=True)
+        raise
     finally:
         await file.close()
 
+    # 同一伙伴下已有内容完全相同的文件：不再重复入库
+    duplicates = await crud_knowledge_file.get_files_by_content_hash(
+        db, companion_id=companion_id, content_hashes=[content_hash]
+    )
+    if content_hash in duplicates:
+        shutil.rmtree(file_dir, ignore_errors=True)
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail={"message": "An identical file already exists", "file_id": str(duplicates[content_hash].id)},
+        )
+
     file_in = kf_schema.KnowledgeFileCreate(
-        file_name=file.filename,
+        file_name=file_name,
         file_path=str(file_path),
         companion_id=companion_id,
+        content_hash=content_hash,
     )
 
     # 确保这一行是完整且正确的
-    db_file = await crud_knowledge_file.create_knowledge_file(
-        db=db, file_in=file_in, file_id=db_file_id
-    )
+    try:
+        db_file = await crud_knowledge_file.create_knowledge_file(
+            db=db, file_in=file_in, file_id=db_file_id
+        )
+    except IntegrityError:
+        # 并发上传了同一个文件（例如重复点击）：上面的检查都通过了，唯一索引只让其中一个插入成功
+        await db.rollback()
+        shutil.rmtree(file_dir, ignore_errors=True)
+        raise await _duplicate_file_conflict(db, companion_id, content_hash)
 
     arq_pool: ArqRedis = request.app.state.arq_pool
-    await arq_pool.enqueue_job("process_file_task", db_file.id)
+    await enqueue_task(arq_pool, "process_file_task", db_file.id)
     return db_file
 
 
+def _store_batch_uploads(companion_id: UUID, files: List[UploadFile]) -> List[Tuple[UUID, kf_schema.KnowledgeFileCreate]]:
+    """
+    （在线程中执行）把批量上传的文件与压缩包中解出的文件逐个写入磁盘。
+    任何一个文件不合法时删除已经写入的文件，整批拒绝。
+    """
+    stored: List[Tuple[UUID, kf_schema.KnowledgeFileCreate]] = []
+
+    def store(file_name: str, source) -> None:
+        if len(stored) >= settings.KNOWLEDGE_BATCH_MAX_FILES:
+            raise HTTPException(
+                status_code=400, detail=f"Too many files, at most {settings.KNOWLEDGE_BATCH_MAX_FILES} per batch"
+            )
+        file_id = uuid4()
+        file_dir = UPLOAD_DIR / str(companion_id) / str(file_id)
+        file_dir.mkdir(parents=True, exist_ok=True)
+        file_path = file_dir / file_name
+        try:
+            _, content_hash = copy_and_hash(
+                source, file_path, settings.KNOWLEDGE_UPLOAD_MAX_BYTES, settings.UPLOAD_CHUNK_SIZE
+            )
+        except BaseException:
+            shutil.rmtree(file_dir, ignore_errors=True)
+            raise
+        stored.append((file_id, kf_schema.KnowledgeFileCreate(
+            file_name=file_name, file_path=str(file_path), companion_id=companion_id, content_hash=content_hash,
+        )))
+
+    try:
+        for upload in files:
+            file_name = Path(upload.filename or "").name
+            if is_archive(file_name):
+                for member_name, member in iter_archive_members(upload.file, settings.KNOWLEDGE_ARCHIVE_MAX_BYTES):
+                    store(member_name, member)
+            elif is_supported(file_name):
+                store(file_name, upload.file)
+            else:
+                raise HTTPException(status_code=400, detail=f"Unsupported file type: {file_name}")
+    except ArchiveError as e:
+        _discard_stored(stored)
+        raise HTTPException(status_code=400, detail=str(e))
+    except UploadTooLarge as e:
+        _discard_stored(stored)
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(e))
+    except BaseException:
+        _discard_stored(stored)
+        raise
+    return stored
+
+
+def _discard_stored(stored: List[Tuple[UUID, kf_schema.KnowledgeFileCreate]]) -> None:
+    for _, file_in in stored:
+        shutil.rmtree(Path(file_in.file_path).parent, ignore_errors=True)
+
+
+@router.post(
+    "/companions/{companion_id}/knowledge/batch",
+    response_model=List[kf_schema.KnowledgeFileRead],
+    status_code=status.HTTP_202_ACCEPTED,
+    summary="批量上传知识文件（支持 zip 压缩包）"
+)
+async def upload_knowledge_files_batch(
+    *,
+    request: Request,
+    companion_id: UUID,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UserPrincipal = Depends(get_current_user),
+    files: List[UploadFile] = File(...),
+):
+    companion = await crud_companion.get_companion_snapshot(db=db, companion_id=companion_id)
+    if not companion or companion.owner_id != current_user.id:
+        raise HTTPException(status_code=404, detail="Companion not found or access denied")
+
+    try:
+        # 解压与写盘是同步 IO，放到线程中执行，避免阻塞事件循环
+        stored = await asyncio.to_thread(_store_batch_uploads, companion_id, files)
+    finally:
+        for upload in files:
+            await upload.close()
+    if not stored:
+        raise HTTPException(status_code=400, detail="No supported files (.txt, .md, .pdf) found in the upload")
+
+    # 跳过内容重复的文件：批次内重复的只保留第一个，伙伴下已有的不再入库
+    existing = await crud_knowledge_file.get_files_by_content_hash(
+        db, companion_id=companion_id, content_hashes=list({file_in.content_hash for _, file_in in stored})
+    )
+    seen = set(existing)
+    unique, duplicates = [], []
+    for file_id, file_in in stored:
+        (duplicates if file_in.content_hash in seen else unique).append((file_id, file_in))
+        seen.add(file_in.content_hash)
+    _discard_stored(duplicates)
+    if not unique:
+        return []
+
+    # 所有记录在一个事务中创建，整批只入队一个任务：小文件的文本块会被合并成共享的批次向量化
+    try:
+        db_files = await crud_knowledge_file.create_knowledge_files(db, files_in=unique)
+    except IntegrityError:
+        # 其中某个文件正被另一个请求同时上传：整批回滚，由客户端重试（重试时会跳过已存在的文件）
+        await db.rollback()
+        _discard_stored(unique)
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Some of these files are being uploaded by another request, try again later",
+        )
+    arq_pool: ArqRedis = request.app.state.arq_pool
+    await enqueue_task(arq_pool, "process_file_batch_task", [db_file.id for db_file in db_files])
+    return db_files
+
+
 @router.get(
     "/companions/{companion_id}/knowledge",
     response_model=List[kf_schema.KnowledgeFileRead],
@@ -69,10 +242,10 @@ async def get_knowledge_files_for_companion(
     *,
     companion_id: UUID,
     db: AsyncSession = Depends(get_async_db),
-    current_user: User = Depends(get_current_user)
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
-    companion = await crud_companion.get_companion_by_id(db=db, companion_id=companion_id)
-    if not companion or companion.user_id != current_user.id:
+    companion = await crud_companion.get_companion_snapshot(db=db, companion_id=companion_id)
+    if not companion or companion.owner_id != current_user.id:
         raise HTTPException(status_code=404, detail="Companion not found or access denied")
     files = await crud_knowledge_file.get_files_by_companion(db=db, companion_id=companion_id)
     return files
@@ -88,15 +261,164 @@ async def delete_knowledge_file(
     request: Request,
     file_id: UUID,
     db: AsyncSession = Depends(get_async_db),
-    current_user: User = Depends(get_current_user)
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
     file_to_delete = await crud_knowledge_file.get_file_by_id(db=db, file_id=file_id)
     if not file_to_delete:
         return Response(status_code=status.HTTP_204_NO_CONTENT)
-    companion = await crud_companion.get_companion_by_id(db=db, companion_id=file_to_delete.companion_id)
-    if not companion or companion.user_id != current_user.id:
+    companion = await crud_companion.get_companion_snapshot(db=db, companion_id=file_to_delete.companion_id)
+    if not companion or companion.owner_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not authorized to delete this file")
+    # 分片记录会随文件记录级联删除，先取出向量编号区间交给清理任务按 ID 删除
+    manifests = await crud_knowledge_file_part.get_vector_manifests(db, file_ids=[file_id])
+    id_ranges = manifest_id_ranges(manifests.get(file_id))
     await crud_knowledge_file.remove_file(db=db, file_to_delete=file_to_delete)
     arq_pool: ArqRedis = request.app.state.arq_pool
-    await arq_pool.enqueue_job("cleanup_pinecone_task", str(file_id))
-    return Response(status_code=status.HTTP_204_NO_CONTENT)
\ No newline at end of file
+    await enqueue_task(
+        arq_pool, "cleanup_pinecone_task", str(file_id), id_ranges, companion_namespaces(companion)
+    )
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+
+@router.put(
+    "/knowledge/{file_id}",
+    response_model=kf_schema.KnowledgeFileRead,
+    status_code=status.HTTP_202_ACCEPTED,
+    summary="替换知识文件内容（增量重建索引）"
+)
+async def replace_knowledge_file(
+    *,
+    request: Request,
+    file_id: UUID,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UserPrincipal = Depends(get_current_user),
+    file: UploadFile = File(...),
+):
+    db_file = await crud_knowledge_file.get_file_by_id(db=db, file_id=file_id)
+    if not db_file:
+        raise HTTPException(status_code=404, detail="Knowledge file not found")
+    companion = await crud_companion.get_companion_snapshot(db=db, companion_id=db_file.companion_id)
+    if not companion or companion.owner_id != current_user.id:
+        raise HTTPException(status_code=404, detail="Knowledge file not found")
+    if db_file.status in ("UPLOADED", "PROCESSING"):
+        raise HTTPException(status_code=409, detail="The file is still being processed, try again later")
+
+    file_name = Path(file.filename or "").name
+    if not is_supported(file_name):
+        await file.close()
+        raise HTTPException(status_code=400, detail=f"Unsupported file type: {file_name}")
+
+    # 新内容先流式写到暂存文件（边写边计算 sha256），确认内容有变化后再替换到位
+    old_path = Path(db_file.file_path)
+    new_path = old_path.parent / file_name
+    staged_path = old_path.parent / f".replace-{uuid4()}"
+    try:
+        old_path.parent.mkdir(parents=True, exist_ok=True)
+        _, content_hash = await save_upload(
+            file, staged_path, settings.KNOWLEDGE_UPLOAD_MAX_BYTES, settings.UPLOAD_CHUNK_SIZE
+        )
+    except UploadTooLarge as e:
+        staged_path.unlink(missing_ok=True)
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(e))
+    except BaseException:
+        staged_path.unlink(missing_ok=True)
+        raise
+    finally:
+        await file.close()
+
+    if content_hash == db_file.content_hash:
+        # 内容完全相同：不需要任何入库工作
+        staged_path.unlink(missing_ok=True)
+        return db_file
+
+    # 先用条件 UPDATE 占住文件（状态改为 UPLOADED），再移动文件：并发的替换请求只有一个能走到这里
+    old_file_name, old_content_hash, old_status = db_file.file_name, db_file.content_hash, db_file.status
+    try:
+        replaced = await crud_knowledge_file.replace_file_content(
+            db, file_id=file_id, file_name=file_name, file_path=str(new_path), content_hash=content_hash
+        )
+    except IntegrityError:
+        # 新内容与同一伙伴下的另一个文件相同
+        await db.rollback()
+        staged_path.unlink(missing_ok=True)
+        raise await _duplicate_file_conflict(db, companion.id, content_hash)
+    except BaseException:
+        staged_path.unlink(missing_ok=True)
+        raise
+    if replaced is None:
+        staged_path.unlink(missing_ok=True)
+        raise HTTPException(status_code=409, detail="The file is still being processed, try again later")
+
+    try:
+        os.replace(staged_path, new_path)
+    except BaseException:
+        staged_path.unlink(missing_ok=True)
+        await crud_knowledge_file.restore_file_content(
+            db,
+            file_id=file_id,
+            file_name=old_file_name,
+            file_path=str(old_path),
+            content_hash=old_content_hash,
+            status=old_status,
+        )
+        raise
+    if old_path != new_path and old_path.exists():
+        old_path.unlink()
+    db_file = replaced
+
+    # 增量模式：只向量化、上传新增的文本块，只删除消失的文本块。
+    # 任务 ID 带上新内容的哈希：文件之前的 process_file 任务还没结束（例如上次拆分失败后正在退出）时，
+    # 这次替换不会被当作重复任务忽略（只有同一内容的任务已在队列中时才会去重，此时无需再入队）
+    arq_pool: ArqRedis = request.app.state.arq_pool
+    await enqueue_task(arq_pool, "process_file_task", db_file.id, replace=True, job_suffix=content_hash[:16])
+    return db_file
+
+
+@router.post(
+    "/knowledge/{file_id}/retry",
+    response_model=kf_schema.KnowledgeFileRead,
+    status_code=status.HTTP_202_ACCEPTED,
+    summary="从断点重试处理失败的知识文件"
+)
+async def retry_knowledge_file(
+    *,
+    request: Request,
+    file_id: UUID,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UserPrincipal = Depends(get_current_user)
+):
+    db_file = await crud_knowledge_file.get_file_by_id(db=db, file_id=file_id)
+    if not db_file:
+        raise HTTPException(status_code=404, detail="Knowledge file not found")
+    companion = await crud_companion.get_companion_snapshot(db=db, companion_id=db_file.companion_id)
+    if not companion or companion.owner_id != current_user.id:
+        raise HTTPException(status_code=404, detail="Knowledge file not found")
+    if db_file.status != "FAILED":
+        raise HTTPException(status_code=409, detail=f"Only FAILED files can be retried (current status: {db_file.status})")
+
+    content_hash = db_file.content_hash
+    # 有未成功的分片时文件直接进入 PROCESSING；还没有分片时回到 UPLOADED，由 process_file_task 认领后重新拆分
+    has_parts = bool(await crud_knowledge_file_part.get_unfinished_parts(db, file_id=file_id))
+    try:
+        claimed = await crud_knowledge_file.transition_status(
+            db, file_id=file_id, from_status="FAILED", to_status="PROCESSING" if has_parts else "UPLOADED"
+        )
+    except IntegrityError:
+        # 文件失败后，同一伙伴下又上传了内容相同的文件：失败的这个不再需要重试
+        await db.rollback()
+        raise await _duplicate_file_conflict(db, companion.id, content_hash)
+    if not claimed:
+        raise HTTPException(status_code=409, detail="The file is already being retried")
+    # 只重新入队未成功的分片；每个分片从自己的断点继续，已上传的文本块不会重新向量化
+    part_nos = await crud_knowledge_file_part.reset_parts_for_retry(db, file_id=file_id)
+    db_file = await crud_knowledge_file.get_file_by_id(db=db, file_id=file_id)
+
+    arq_pool: ArqRedis = request.app.state.arq_pool
+    if part_nos:
+        for part_no in part_nos:
+            await enqueue_task(arq_pool, "process_file_part_task", file_id, part_no)
+    else:
+        # 还没有分片（拆分阶段就失败了）或内容为空：重新走完整流程。
+        # 以替换模式执行，保证之前可能残留的旧向量被沿用或清理
+        await enqueue_task(arq_pool, "process_file_task", file_id, replace=True)
+    return db_file
\ No newline at end of file
@@ -5,7 +5,7 @@ import logging
 from fastapi import APIRouter, Depends, HTTPException
 
 from app.schemas.upload import PresignedUrlRequest, PresignedUrlResponse
-from app.schemas.user import User
+from app.schemas.user import UserPrincipal
 from app.services.cos_service import cos_service
 from app.apis.dependencies import get_current_user
 
@@ -22,7 +22,7 @@ router = APIRouter()
 )
 async def get_presigned_url_for_avatar(
     request_body: PresignedUrlRequest,
-    current_user: User = Depends(get_current_user)
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
     """
     为当前登录用户获取一个用于上传头像的预签名URL。
@@ -4,7 +4,7 @@ from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
 import logging
 
-from app.schemas.user import User, UserAvatarUpdate
+from app.schemas.user import User, UserAvatarUpdate, UserPrincipal
 from app.crud import crud_user
 from app.apis.dependencies import get_async_db, get_current_user
 
@@ -20,16 +20,20 @@ async def update_current_user_avatar(
     *,
     db: AsyncSession = Depends(get_async_db),
     avatar_in: UserAvatarUpdate,
-    current_user: User = Depends(get_current_user)
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
     """
     更新当前登录用户的头像URL。
     """
+    # 认证依赖返回的是只读快照，修改需要数据库中的用户记录
+    db_user = await crud_user.get_user(db=db, user_id=current_user.id)
+    if not db_user:
+        raise HTTPException(status_code=404, detail="User not found")
     try:
-        # 🚀 调用我们新的、专属的CRUD函数
+        # 🚀 调用我们新的、专属的CRUD函数（提交后使该用户的认证缓存失效）
         updated_user = await crud_user.update_user_avatar(
             db=db,
-            user=current_user,
+            user=db_user,
             avatar_url=str(avatar_in.avatar_url) # Pydantic HttpUrl -> str
         )
         return updated_user
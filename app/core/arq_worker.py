@@ -1,8 +1,11 @@
 # app/core/arq_worker.py
 
+import asyncio
 import logging
+import time
+from typing import List, Optional, Tuple
 from uuid import UUID
-from arq import ArqRedis
+from arq import ArqRedis, cron
 from arq.connections import create_pool
 from app.db import base
 
@@ -10,6 +13,16 @@ from app.core.config import settings
 from arq.connections import RedisSettings
 # --- ↓↓↓ 关键改动：导入我们刚刚创建的 KnowledgeService ↓↓↓ ---
 from app.services.knowledge_service import KnowledgeService
+from app.services.embedding import warm_up_embedding_model
+from app.services.vector_store import get_pinecone_index
+from app.db.session import async_engine
+from app.core.metrics import metrics, publish_metrics
+from app.core.job_queues import CLEANUP_QUEUE, INGEST_QUEUE, enqueue_task
+from app.core.snapshot_cache import configure_snapshot_caches
+from app.services.pdf_parser import shutdown_pdf_process_pool
+from app.services.companion_cleanup import purge_companion
+from app.services.storage_reconciler import StorageReconciler
+from app.services.reindex_service import EmbeddingReindexer
 
 # 配置日志
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
@@ -21,7 +34,7 @@ async def create_arq_pool() -> ArqRedis:
     """创建并返回 ARQ 连接池"""
     global arq_pool
     if arq_pool is None:
-        arq_pool = await create_pool(WorkerSettings.redis_settings)
+        arq_pool = await create_pool(_redis_settings)
     return arq_pool
 
 async def close_arq_pool():
@@ -29,51 +42,232 @@ async def close_arq_pool():
     if arq_pool:
         await arq_pool.close()
 
+# --- Worker 生命周期 ---
+
+async def startup(ctx):
+    """
+    Worker 进程启动时执行一次：创建共享的服务实例并放入 ctx，
+    之后的每个任务直接复用，不再重复加载模型或重连 Pinecone。
+    """
+    logging.info("Worker 启动中: 初始化 KnowledgeService...")
+    ctx["knowledge_service"] = KnowledgeService()
+    # worker 中修改伙伴（模型切换等）时要让 API 进程中的伙伴缓存失效
+    configure_snapshot_caches(ctx["redis"])
+    # Pinecone 连接在进程内只建立一次，所有任务共享
+    await asyncio.to_thread(get_pinecone_index)
+    if settings.EMBEDDING_PRELOAD:
+        # 模型加载是 CPU / IO 密集的同步操作，放到线程里避免阻塞事件循环
+        await asyncio.to_thread(warm_up_embedding_model)
+    logging.info("Worker 启动完成。")
+
+
+async def cleanup_startup(ctx):
+    """清理 worker 只删除数据，不需要预加载嵌入模型"""
+    ctx["knowledge_service"] = KnowledgeService()
+    configure_snapshot_caches(ctx["redis"])
+    await asyncio.to_thread(get_pinecone_index)
+    logging.info("清理 Worker 启动完成。")
+
+
+async def shutdown(ctx):
+    """Worker 进程退出时释放共享资源。"""
+    ctx.pop("knowledge_service", None)
+    # PDF 解析进程池是按需创建的，退出时一并回收子进程
+    await asyncio.to_thread(shutdown_pdf_process_pool)
+    await async_engine.dispose()
+    logging.info("Worker 已关闭，数据库连接池与 PDF 解析进程池已释放。")
+
+
+def _queue_label(queue_name: str) -> str:
+    return queue_name.rsplit(":", 1)[-1]
+
+
+def _make_job_hooks(queue_name: str):
+    """
+    为某个队列的 worker 生成 on_job_start / on_job_end：
+    记录排队等待时间（入队到开始执行）与当前队列深度，任务结束后把本 worker 的指标发布到 Redis。
+    """
+    label = _queue_label(queue_name)
+
+    async def on_job_start(ctx):
+        # score 是任务可以开始执行的时间（毫秒），延迟执行的任务不计入等待时间
+        metrics.observe(f"job_wait_seconds:{label}", max(0.0, time.time() - ctx["score"] / 1000))
+        metrics.set_gauge(f"queue_depth:{label}", await ctx["redis"].zcard(queue_name))
+
+    async def on_job_end(ctx):
+        metrics.incr(f"jobs_finished:{label}")
+        # 发布本 worker 的指标（如向量缓存命中率、队列深度），供 API 的 /metrics 汇总
+        await publish_metrics(ctx["redis"], role=f"worker-{label}")
+
+    return on_job_start, on_job_end
+
+
 # --- ARQ 任务定义 ---
 
-async def process_file_task(ctx, file_id: UUID):
+async def process_file_task(ctx, file_id: UUID, replace: bool = False):
     """
-    ARQ 任务：后台处理上传的知识文件。
-    ctx 包含了任务的上下文信息，如 redis 连接。
+    ARQ 任务（协调者）：把上传的知识文件拆成若干分片，
+    每个分片作为独立的子任务入队，可以被任意 worker 副本并行处理。
+    文件的最终状态由最后一个完成的分片汇总写入。
+    replace=True 表示文件内容被替换，只处理发生变化的文本块。
     """
-    logging.info(f"Worker 接到任务: process_file_task, file_id: {file_id}")
+    logging.info(f"Worker 接到任务: process_file_task, file_id: {file_id}, replace: {replace}")
     try:
-        # --- ↓↓↓ 关键改动：实例化服务并调用核心逻辑 ↓↓↓ ---
-        knowledge_service = KnowledgeService()
-        await knowledge_service.process_and_index_file(file_id)
-        logging.info(f"成功完成任务, file_id: {file_id}")
+        knowledge_service: KnowledgeService = ctx["knowledge_service"]
+        part_nos = await knowledge_service.plan_file_parts(file_id, replace=replace)
+        redis: ArqRedis = ctx["redis"]
+        for part_no in part_nos:
+            await enqueue_task(redis, "process_file_part_task", file_id, part_no)
+        logging.info(f"已为 file_id: {file_id} 入队 {len(part_nos)} 个分片子任务")
     except Exception as e:
         # 这里的日志主要用于捕获服务实例化等更高层的错误
         logging.error(f"执行任务 process_file_task (file_id: {file_id}) 时发生致命错误: {e}", exc_info=True)
         # 具体的错误处理和数据库状态更新，已经在 KnowledgeService 内部完成
 
 
-async def cleanup_pinecone_task(ctx, file_id: str):
+async def process_file_part_task(ctx, file_id: UUID, part_no: int):
+    """
+    ARQ 任务（子任务）：处理知识文件的一个分片。
+    """
+    logging.info(f"Worker 接到任务: process_file_part_task, file_id: {file_id}, part: {part_no}")
+    try:
+        knowledge_service: KnowledgeService = ctx["knowledge_service"]
+        await knowledge_service.process_file_part(file_id, part_no)
+        logging.info(f"成功完成任务, file_id: {file_id}, part: {part_no}")
+    except Exception as e:
+        logging.error(
+            f"执行任务 process_file_part_task (file_id: {file_id}, part: {part_no}) 时发生致命错误: {e}",
+            exc_info=True,
+        )
+
+
+async def process_file_batch_task(ctx, file_ids: List[UUID]):
+    """
+    ARQ 任务：批量 / 压缩包上传的一批文件。小文件在本任务中共用一条向量化流水线处理，
+    需要拆分的大文件照常把分片子任务入队。
+    """
+    logging.info(f"Worker 接到任务: process_file_batch_task, {len(file_ids)} 个文件")
+    try:
+        knowledge_service: KnowledgeService = ctx["knowledge_service"]
+        fan_out = await knowledge_service.process_file_batch(file_ids)
+        redis: ArqRedis = ctx["redis"]
+        for file_id, part_no in fan_out:
+            await enqueue_task(redis, "process_file_part_task", file_id, part_no)
+        logging.info(f"批量任务完成: {len(file_ids)} 个文件，另入队 {len(fan_out)} 个分片子任务")
+    except Exception as e:
+        logging.error(f"执行任务 process_file_batch_task 时发生致命错误: {e}", exc_info=True)
+
+
+async def cleanup_pinecone_task(
+    ctx, file_id: str, id_ranges: Optional[List[Tuple[int, int]]] = None, namespaces: Optional[List[str]] = None
+):
     """
     ARQ 任务：后台清理指定 file_id 在 Pinecone 中的所有向量。
+    id_ranges 是删除文件记录之前由分片清单得到的向量编号区间；
+    为 None 时（旧数据没有清单）退回按前缀 / metadata filter 删除。
+    namespaces 是伙伴向量所在的命名空间（模型迁移期间有两个），为 None 时只清理默认命名空间。
     """
     logging.info(f"Worker 接到任务: cleanup_pinecone_task, file_id: {file_id}")
     try:
-        # 复用 KnowledgeService 实例来执行删除操作
-        knowledge_service = KnowledgeService()
-        await knowledge_service.delete_vectors_by_file_id(file_id)
+        # 复用启动时创建的 KnowledgeService；删除只用到 Pinecone，不会触发模型加载
+        knowledge_service: KnowledgeService = ctx["knowledge_service"]
+        await knowledge_service.delete_vectors_by_file_id(file_id, id_ranges, namespaces or ("",))
         logging.info(f"成功完成 Pinecone 清理任务, file_id: {file_id}")
     except Exception as e:
         logging.error(f"执行任务 cleanup_pinecone_task (file_id: {file_id}) 时发生致命错误: {e}", exc_info=True)
 
+async def cleanup_companion_task(ctx, companion_id: UUID):
+    """
+    ARQ 任务：彻底清理一个已软删除的 AI 伙伴（向量、词法索引、所有用户的对话记忆、上传文件与数据库记录）。
+    失败时伙伴仍保持软删除状态，可以重新入队再次清理。
+    """
+    logging.info(f"Worker 接到任务: cleanup_companion_task, companion_id: {companion_id}")
+    try:
+        await purge_companion(companion_id, ctx["redis"])
+    except Exception as e:
+        logging.error(f"执行任务 cleanup_companion_task (companion_id: {companion_id}) 时发生致命错误: {e}", exc_info=True)
+
+async def reconcile_storage_task(ctx):
+    """
+    ARQ 定时任务：对账并清理泄漏的向量、上传文件与对话记忆，找回停滞的入库（见 StorageReconciler）。
+    """
+    if not settings.RECONCILE_ENABLED:
+        return
+    logging.info("Worker 接到任务: reconcile_storage_task")
+    try:
+        await StorageReconciler(ctx["redis"], ctx["knowledge_service"]).run()
+    except Exception as e:
+        logging.error(f"执行任务 reconcile_storage_task 时发生致命错误: {e}", exc_info=True)
+
+async def reindex_embeddings_task(ctx):
+    """
+    ARQ 定时任务：推进 embedding 模型迁移（见 EmbeddingReindexer），每次最多执行 REINDEX_TASK_SECONDS 秒。
+    没有迁移中的伙伴时只做一次查询。
+    """
+    if not settings.REINDEX_ENABLED:
+        return
+    try:
+        await EmbeddingReindexer(ctx["redis"]).run()
+    except Exception as e:
+        logging.error(f"执行任务 reindex_embeddings_task 时发生致命错误: {e}", exc_info=True)
+
 # --- Worker 配置 ---
 
-class WorkerSettings:
+_redis_settings = RedisSettings(
+    host=settings.REDIS_HOST,
+    port=settings.REDIS_PORT,
+    database=settings.REDIS_DB
+)
+
+
+class IngestWorkerSettings:
     """
-    ARQ Worker 的配置类。
+    入库 worker：解析、向量化与上传，单个任务耗时长、占用 CPU / 内存多，并发数较低；
+    同时定期推进 embedding 模型迁移 (reindex_embeddings_task)，它同样需要加载模型。
+    启动方式: python -m arq app.core.arq_worker.IngestWorkerSettings
     """
-    # --- ↓↓↓ 将新任务注册到函数列表中 ↓↓↓ ---
-    functions = [process_file_task, cleanup_pinecone_task]
-    
-    redis_settings = RedisSettings(
-        host=settings.REDIS_HOST,
-        port=settings.REDIS_PORT,
-        database=settings.REDIS_DB
-    )
-    
-    job_timeout = 600
\ No newline at end of file
+    functions = [process_file_task, process_file_part_task, process_file_batch_task]
+    cron_jobs = [
+        cron(
+            reindex_embeddings_task,
+            minute=set(range(0, 60, settings.REINDEX_INTERVAL_MINUTES)),
+            timeout=settings.REINDEX_TASK_SECONDS + 60,
+        )
+    ]
+    queue_name = INGEST_QUEUE
+    max_jobs = settings.ARQ_INGEST_MAX_JOBS
+    job_timeout = settings.ARQ_INGEST_JOB_TIMEOUT
+    # 任务 ID 是确定的（见 job_queues），不保留结果，任务结束后同一 ID 可以再次入队
+    keep_result = 0
+    on_startup = startup
+    on_shutdown = shutdown
+    on_job_start, on_job_end = _make_job_hooks(INGEST_QUEUE)
+    redis_settings = _redis_settings
+
+
+class CleanupWorkerSettings:
+    """
+    清理 worker：删除向量、伙伴数据等短任务，独立的队列和更高的并发，不会被入库任务阻塞；
+    同时定期执行存储对账 (reconcile_storage_task)。
+    启动方式: python -m arq app.core.arq_worker.CleanupWorkerSettings
+    """
+    functions = [cleanup_pinecone_task, cleanup_companion_task]
+    cron_jobs = [
+        cron(
+            reconcile_storage_task,
+            minute=set(range(0, 60, settings.RECONCILE_INTERVAL_MINUTES)),
+            timeout=settings.ARQ_CLEANUP_JOB_TIMEOUT,
+        )
+    ]
+    queue_name = CLEANUP_QUEUE
+    max_jobs = settings.ARQ_CLEANUP_MAX_JOBS
+    job_timeout = settings.ARQ_CLEANUP_JOB_TIMEOUT
+    keep_result = 0
+    on_startup = cleanup_startup
+    on_shutdown = shutdown
+    on_job_start, on_job_end = _make_job_hooks(CLEANUP_QUEUE)
+    redis_settings = _redis_settings
+
+
+# 兼容旧的启动命令 (python -m arq app.core.arq_worker.WorkerSettings)：等同于入库 worker
+WorkerSettings = IngestWorkerSettings
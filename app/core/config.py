@@ -20,12 +20,133 @@ class Settings(BaseSettings):
     DEEPSEEK_API_BASE: str
     PINECONE_API_KEY: str
     PINECONE_ENVIRONMENT: str
-    
+
+    # --- Embedding 模型配置 ---
+    EMBEDDING_MODEL_NAME: str = "BAAI/bge-large-zh-v1.5"
+    # "sentence_transformers"（全精度 PyTorch）或 "onnx"（int8 量化的 onnxruntime）
+    EMBEDDING_BACKEND: str = "sentence_transformers"
+    MODEL_CACHE_DIR: str = "./models_cache"
+    # onnxruntime 的 intra-op 线程数，0 表示使用全部 CPU 核
+    EMBEDDING_ONNX_THREADS: int = 0
+    EMBEDDING_MAX_SEQ_LENGTH: int = 512
+    # API 启动后在后台加载并预热模型；关闭时模型在第一次检索时才加载
+    EMBEDDING_PRELOAD: bool = True
+    PINECONE_INDEX_NAME: str = "ai-companion-index"
+
+    # --- 知识文件上传配置 ---
+    # 单个知识文件的大小上限（字节），超过时返回 413
+    KNOWLEDGE_UPLOAD_MAX_BYTES: int = 100 * 1024 * 1024
+    # 批量上传一次请求体的大小上限（字节）
+    KNOWLEDGE_BATCH_MAX_BYTES: int = 500 * 1024 * 1024
+    # 上传文件流式写盘时每次读取的块大小（字节）
+    UPLOAD_CHUNK_SIZE: int = 1024 * 1024
+    # 一次批量上传（含压缩包解出的文件）最多接受的文件数
+    KNOWLEDGE_BATCH_MAX_FILES: int = 500
+    # 压缩包解压后的总大小上限（字节）
+    KNOWLEDGE_ARCHIVE_MAX_BYTES: int = 500 * 1024 * 1024
+
+    # --- 知识文件入库流水线配置 ---
+    # 解析 / 切分线程与向量化阶段之间的队列容量（文本块数）
+    INGEST_CHUNK_QUEUE_SIZE: int = 500
+    # 每次 upsert 到 Pinecone 的向量数量
+    INGEST_UPSERT_BATCH_SIZE: int = 100
+    # 同时在途的 upsert 批次数；超过后向量化阶段会等待（反压）
+    INGEST_MAX_INFLIGHT_UPSERTS: int = 2
+    # 一次送入向量化阶段的文本块数；窗口内按长度排序后组批，窗口越大 padding 浪费越少
+    INGEST_EMBED_WINDOW: int = 500
+    # 每个向量化批次的 token 预算（批大小 × 批内最长序列长度）
+    EMBEDDING_BATCH_TOKEN_BUDGET: int = 16384
+    # 按 (模型, 文本 sha256) 缓存向量，重复内容不再重新向量化
+    EMBEDDING_CACHE_ENABLED: bool = True
+    # Pinecone 调用遇到瞬时错误（限流 / 5xx / 网络）时的最大尝试次数与初始退避时间（秒）
+    PINECONE_MAX_ATTEMPTS: int = 5
+    PINECONE_RETRY_BASE_DELAY: float = 0.5
+    # 按 ID 删除向量后抽样核验的 ID 数（0 表示不核验）
+    PINECONE_DELETE_VERIFY_SAMPLE: int = 1000
+    # 大 PDF 按页拆成多个 ARQ 子任务，每个子任务处理的页数
+    INGEST_PAGES_PER_PART: int = 50
+    # 大的非 PDF 文件（txt / md）按文本块序号拆分，每个分片处理的文本块数（须小于 PART_ID_STRIDE）
+    INGEST_CHUNKS_PER_PART: int = 50_000
+    # PDF 并行解析的进程数（0 表示使用全部 CPU 核，1 表示不使用进程池、单线程解析）
+    PDF_PARSE_PROCESSES: int = 0
+    # 每个解析任务负责的页数；页数不超过该值的 PDF 直接在当前线程解析
+    PDF_PAGES_PER_TASK: int = 8
+
+    # --- 混合检索 (BM25 + 向量) 配置 ---
+    # 每个 companion 的本地 BM25 倒排索引存放目录，API 与 worker 需要共享该目录
+    LEXICAL_INDEX_DIR: str = "lexical_index"
+    # 每个进程最多在内存中缓存多少个 companion 的合并索引（LRU 淘汰）
+    LEXICAL_INDEX_CACHE_MAX_COMPANIONS: int = 64
+    # 缓存的索引在这段时间（秒）内直接使用，过期后才检查段文件是否有变化（worker 写入的新段最多延迟这么久可见）
+    LEXICAL_INDEX_REFRESH_SECONDS: float = 5.0
+    # 向量检索超过该时长（秒）则放弃，只使用本地词法检索结果
+    RAG_DENSE_TIMEOUT_SECONDS: float = 2.0
+    # 每一路检索取回多少候选参与融合
+    RAG_FUSION_CANDIDATES: int = 10
+    # Reciprocal Rank Fusion 的平滑常数
+    RAG_RRF_K: int = 60
+
     # --- Redis 配置 ---
     REDIS_HOST: str
     REDIS_PORT: int
     REDIS_DB: int
 
+    # --- ARQ 队列配置 ---
+    # 入库与清理任务使用不同的队列和 worker（见 app/core/job_queues.py）
+    ARQ_INGEST_MAX_JOBS: int = 4
+    ARQ_INGEST_JOB_TIMEOUT: int = 600
+    ARQ_CLEANUP_MAX_JOBS: int = 20
+    ARQ_CLEANUP_JOB_TIMEOUT: int = 300
+
+    # --- 定期存储对账（清理 worker 的 cron 任务，见 app/services/storage_reconciler.py）---
+    RECONCILE_ENABLED: bool = True
+    RECONCILE_INTERVAL_MINUTES: int = 15
+    # 每一页 / 每一批处理的条目数（Pinecone 列出 ID 单页最多 100 个）
+    RECONCILE_BATCH_SIZE: int = 100
+    # 每次执行每一项最多扫描的页数，剩余部分下次从游标处继续
+    RECONCILE_MAX_PAGES: int = 50
+    # 新上传 / 刚删除的数据在宽限期内不做对账，避免与进行中的请求冲突
+    RECONCILE_GRACE_SECONDS: int = 3600
+    # 分片超过这个时间没有任何进展视为停滞（应明显大于 ARQ_INGEST_JOB_TIMEOUT）
+    RECONCILE_STALE_SECONDS: int = 7200
+
+    # --- embedding 模型迁移（入库 worker 的 cron 任务，见 app/services/reindex_service.py）---
+    REINDEX_ENABLED: bool = True
+    REINDEX_INTERVAL_MINUTES: int = 5
+    # 单次执行的时间上限（应小于间隔），剩余部分下次从断点继续
+    REINDEX_TASK_SECONDS: int = 240
+    # 复制速率上限（文本块 / 秒），避免与在线入库争抢模型和 Pinecone 配额
+    REINDEX_CHUNKS_PER_SECOND: float = 50.0
+    # 每次从 Pinecone 读取 / 写入的文本块数（fetch 单次最多 100 个 ID）
+    REINDEX_BATCH_SIZE: int = 100
+
+    # --- 伙伴读穿缓存（进程内 LRU + Redis，见 app/core/snapshot_cache.py）---
+    COMPANION_CACHE_ENABLED: bool = True
+    COMPANION_CACHE_MAX_ENTRIES: int = 10000
+    # 本地条目的兜底过期时间（正常情况下由 pub/sub 广播立即失效）
+    COMPANION_CACHE_LOCAL_TTL_SECONDS: float = 60.0
+    COMPANION_CACHE_REDIS_TTL_SECONDS: int = 3600
+
+    # --- 已认证用户缓存（认证依赖使用，见 app/apis/dependencies.py）---
+    USER_CACHE_ENABLED: bool = True
+    USER_CACHE_MAX_ENTRIES: int = 10000
+    USER_CACHE_LOCAL_TTL_SECONDS: float = 30.0
+    USER_CACHE_REDIS_TTL_SECONDS: int = 300
+    # 在 token 中写入 email / nickname：带有这些声明的 token 认证时不读缓存和数据库；
+    # 代价是用户资料的修改要等 token 过期后才反映到认证结果中
+    AUTH_TOKEN_EMBED_CLAIMS: bool = False
+
+    # --- 密码哈希线程池（见 app/core/security.py）---
+    # 同时计算的 bcrypt 数：每个占满一个 CPU 核，应小于 API 进程可用的核数
+    PASSWORD_HASH_WORKERS: int = 2
+    # 排队等待的上限，超出时登录 / 注册直接返回 503
+    PASSWORD_HASH_MAX_QUEUE: int = 64
+
+    # --- 聊天记录搜索（见 crud_message.search_messages）---
+    # trgm: pg_trgm 三元组索引 + 子串匹配（默认，不需要额外扩展）；
+    # zhparser: 中文分词全文检索（需要数据库安装 zhparser，迁移时会自动建立对应索引）
+    MESSAGE_SEARCH_BACKEND: str = "trgm"
+
     # 🚀 --- 关键修复：新增异步数据库URL配置 ---
     ASYNC_DATABASE_URL: Optional[str] = None
 
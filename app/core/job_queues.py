@@ -0,0 +1,65 @@
+# app/core/job_queues.py
+
+"""
+ARQ 任务的队列划分与去重。
+
+- 入库任务（解析 / 向量化，耗时长）与清理任务（删除向量 / 伙伴数据，耗时短）使用不同的队列，
+  分别由各自的 worker（arq_worker.IngestWorkerSettings / CleanupWorkerSettings）消费，
+  并发数和超时独立配置：大批 PDF 入库时，清理任务不会排在它们后面。
+- 任务 ID 由任务名和业务 ID（file_id / companion_id）确定：同一个任务还在队列中或正在执行时，
+  再次入队会被 ARQ 直接忽略（例如重复点击“重试”）。
+  同一业务 ID 下需要区分的任务（例如替换文件内容后的重新入库）通过 job_suffix 加上版本，
+  只有相同版本的任务会被去重。
+
+API 与 worker 都通过 enqueue_task 入队，不要直接调用 enqueue_job。
+"""
+
+import hashlib
+import logging
+from typing import Any, Optional
+
+from arq import ArqRedis
+from arq.jobs import Job
+
+from app.core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+INGEST_QUEUE = "arq:queue:ingest"
+CLEANUP_QUEUE = "arq:queue:cleanup"
+
+TASK_QUEUES = {
+    "process_file_task": INGEST_QUEUE,
+    "process_file_part_task": INGEST_QUEUE,
+    "process_file_batch_task": INGEST_QUEUE,
+    "cleanup_pinecone_task": CLEANUP_QUEUE,
+    "cleanup_companion_task": CLEANUP_QUEUE,
+}
+
+
+def task_job_id(function: str, *args: Any, job_suffix: Optional[str] = None) -> str:
+    """由任务名和第一个（分片任务为前两个）位置参数生成确定的任务 ID，job_suffix 附加在末尾"""
+    name = function.removesuffix("_task")
+    if function == "process_file_part_task":
+        file_id, part_no = args[:2]
+        job_id = f"{name}:{file_id}:{part_no}"
+    elif function == "process_file_batch_task":
+        file_ids = sorted(str(file_id) for file_id in args[0])
+        job_id = f"{name}:{hashlib.sha1(','.join(file_ids).encode()).hexdigest()[:16]}"
+    else:
+        job_id = f"{name}:{args[0]}"
+    return f"{job_id}:{job_suffix}" if job_suffix else job_id
+
+
+async def enqueue_task(
+    redis: ArqRedis, function: str, *args: Any, job_suffix: Optional[str] = None, **kwargs: Any
+) -> Optional[Job]:
+    """把任务放入它所属的队列；相同任务已在排队或执行中时返回 None"""
+    job_id = task_job_id(function, *args, job_suffix=job_suffix)
+    job = await redis.enqueue_job(function, *args, _job_id=job_id, _queue_name=TASK_QUEUES[function], **kwargs)
+    if job is None:
+        metrics.incr("jobs_deduplicated")
+        logger.info(f"任务 {job_id} 已在队列中或正在执行，忽略重复入队")
+    else:
+        metrics.incr("jobs_enqueued")
+    return job
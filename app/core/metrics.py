@@ -0,0 +1,92 @@
+# app/core/metrics.py
+
+"""
+轻量的进程内指标：计数器 + 摘要（count / sum / max）+ 派生比率。
+
+API 进程通过 GET /metrics 直接读取本进程的快照；
+ARQ worker 在任务结束后把自己的快照发布到 Redis（带过期时间），
+API 端把所有存活 worker 的快照一起返回。
+"""
+
+import json
+import logging
+import os
+import socket
+import threading
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+import redis.asyncio as redis
+
+logger = logging.getLogger(__name__)
+
+PUBLISHED_KEY_PREFIX = "metrics:"
+PUBLISHED_TTL_SECONDS = 300
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = defaultdict(float)
+        self._summaries: Dict[str, Dict[str, float]] = {}
+        self._gauges: Dict[str, float] = {}
+        self._ratios: Dict[str, Tuple[str, List[str]]] = {}
+
+    def incr(self, name: str, value: float = 1) -> None:
+        with self._lock:
+            self._counters[name] += value
+
+    def set_gauge(self, name: str, value: float) -> None:
+        with self._lock:
+            self._gauges[name] = value
+
+    def observe(self, name: str, value: float) -> None:
+        with self._lock:
+            summary = self._summaries.setdefault(name, {"count": 0, "sum": 0.0, "max": 0.0})
+            summary["count"] += 1
+            summary["sum"] += value
+            summary["max"] = max(summary["max"], value)
+
+    def register_ratio(self, name: str, numerator: str, denominators: List[str]) -> None:
+        """注册派生指标：numerator / sum(denominators)，在快照中计算。"""
+        self._ratios[name] = (numerator, denominators)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            counters = dict(self._counters)
+            summaries = {name: dict(summary) for name, summary in self._summaries.items()}
+            gauges = dict(self._gauges)
+
+        ratios = {}
+        for name, (numerator, denominators) in self._ratios.items():
+            total = sum(counters.get(d, 0) for d in denominators)
+            ratios[name] = round(counters.get(numerator, 0) / total, 4) if total else None
+
+        return {"counters": counters, "gauges": gauges, "summaries": summaries, "ratios": ratios}
+
+
+metrics = Metrics()
+
+
+def _source_name(role: str) -> str:
+    return f"{role}:{socket.gethostname()}:{os.getpid()}"
+
+
+async def publish_metrics(redis_client: redis.Redis, role: str = "worker") -> None:
+    """把本进程的快照写入 Redis，供 API 的 /metrics 聚合展示；失败只记录日志"""
+    key = PUBLISHED_KEY_PREFIX + _source_name(role)
+    try:
+        await redis_client.set(key, json.dumps(metrics.snapshot()), ex=PUBLISHED_TTL_SECONDS)
+    except Exception as e:
+        logger.warning(f"Failed to publish metrics to Redis: {e}")
+
+
+async def read_published_metrics(redis_client: redis.Redis) -> Dict[str, dict]:
+    """读取所有仍在有效期内的进程快照"""
+    published = {}
+    async for key in redis_client.scan_iter(match=f"{PUBLISHED_KEY_PREFIX}*", count=100):
+        raw = await redis_client.get(key)
+        if raw:
+            name = key.decode() if isinstance(key, bytes) else key
+            published[name[len(PUBLISHED_KEY_PREFIX):]] = json.loads(raw)
+    return published
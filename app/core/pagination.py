@@ -0,0 +1,82 @@
+# app/core/pagination.py
+
+"""
+键集（keyset / cursor）分页的游标编码。
+
+游标是排序键的值（例如 (created_at, id)）编码成的不透明字符串：下一页用
+WHERE (排序键) < / > (游标中的值) 直接在索引上定位，而不是 OFFSET 跳过前面所有行，
+翻到多深的页代价都一样。
+"""
+
+import base64
+import json
+from datetime import datetime
+from typing import Any, Callable, Optional, Sequence, Tuple
+from uuid import UUID
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    """把排序键的值编码成 URL 安全的游标；支持 datetime / UUID / 数字 / 字符串"""
+    encoded = []
+    for value in values:
+        if isinstance(value, datetime):
+            encoded.append({"dt": value.isoformat()})
+        elif isinstance(value, UUID):
+            encoded.append({"uuid": str(value)})
+        else:
+            encoded.append(value)
+    raw = json.dumps(encoded, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def _decode_value(value: Any, expected: type) -> Any:
+    if expected is datetime:
+        if isinstance(value, dict) and isinstance(value.get("dt"), str):
+            return datetime.fromisoformat(value["dt"])
+    elif expected is UUID:
+        if isinstance(value, dict) and isinstance(value.get("uuid"), str):
+            return UUID(value["uuid"])
+    elif expected is float:
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return float(value)
+    elif isinstance(value, expected) and not isinstance(value, bool):
+        return value
+    raise ValueError(f"invalid cursor: expected {expected.__name__}")
+
+
+def decode_cursor(cursor: str, types: Sequence[type]) -> Tuple[Any, ...]:
+    """
+    解析 encode_cursor 生成的游标，按 types 逐个校验并还原每个值（例如 (datetime, UUID)）。
+    游标来自客户端，格式、长度或任何一个值的类型不对时都抛出 ValueError，不会把错误类型的值带进查询。
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        encoded = json.loads(raw)
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"invalid cursor: {e}") from e
+    if not isinstance(encoded, list) or len(encoded) != len(types):
+        raise ValueError("invalid cursor")
+    return tuple(_decode_value(value, expected) for value, expected in zip(encoded, types))
+
+
+def page_cursors(
+    items: Sequence[Any],
+    key: Callable[[Any], Sequence[Any]],
+    *,
+    has_more: bool,
+    before: bool = False,
+    after: bool = False,
+) -> Tuple[Optional[str], Optional[str]]:
+    """
+    双向键集分页一页（页内正序）的 (before_cursor, after_cursor)，没有更早 / 更新的记录时为 None。
+    has_more 是翻页方向上是否还有更多；before / after 表示本页是否是带对应游标请求的：
+    带游标翻页时，游标所在的那一侧一定还有记录。
+    """
+    if not items:
+        return None, None
+    has_older = True if after else has_more
+    has_newer = has_more if after else before
+    return (
+        encode_cursor(key(items[0])) if has_older else None,
+        encode_cursor(key(items[-1])) if has_newer else None,
+    )
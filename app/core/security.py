@@ -1,10 +1,15 @@
 # app/core/security.py
 
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
-from typing import Optional
+from typing import Callable, Optional, TypeVar
 from uuid import UUID
 from jose import JWTError, jwt
 from app.core.config import settings
+from app.core.metrics import metrics
 
 # 核心修正：使用 passlib 的 CryptContext
 from passlib.context import CryptContext
@@ -26,6 +31,81 @@ def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
 
+# --- 异步接口：密码哈希在专用的小线程池中执行 ---
+# bcrypt 单次耗时数百毫秒的 CPU，直接在异步接口中调用会阻塞事件循环上的所有请求和对话流。
+# bcrypt 计算期间会释放 GIL，线程池即可并行，不需要进程池。
+# 排队 + 执行中的任务数超过上限时直接拒绝（PasswordHashingBusy → 503），登录风暴不会无限堆积。
+
+T = TypeVar("T")
+
+
+class PasswordHashingBusy(Exception):
+    """等待密码哈希的请求已达上限"""
+
+
+_hash_executor: Optional[ThreadPoolExecutor] = None
+_hash_executor_lock = threading.Lock()
+# 已提交且尚未完成的任务数；只在事件循环线程中修改
+_hash_pending = 0
+
+
+def _get_hash_executor() -> ThreadPoolExecutor:
+    global _hash_executor
+    if _hash_executor is None:
+        with _hash_executor_lock:
+            if _hash_executor is None:
+                _hash_executor = ThreadPoolExecutor(
+                    max_workers=settings.PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash"
+                )
+    return _hash_executor
+
+
+def _set_hash_queue_gauges() -> None:
+    metrics.set_gauge("password_hash_pending", _hash_pending)
+    metrics.set_gauge("password_hash_queue_depth", max(0, _hash_pending - settings.PASSWORD_HASH_WORKERS))
+
+
+def _release_hash_slot() -> None:
+    global _hash_pending
+    _hash_pending -= 1
+    _set_hash_queue_gauges()
+
+
+async def _run_password_task(func: Callable[..., T], *args) -> T:
+    global _hash_pending
+    if _hash_pending >= settings.PASSWORD_HASH_WORKERS + settings.PASSWORD_HASH_MAX_QUEUE:
+        metrics.incr("password_hash_rejected")
+        raise PasswordHashingBusy()
+
+    loop = asyncio.get_running_loop()
+    submitted = time.perf_counter()
+
+    def run() -> T:
+        started = time.perf_counter()
+        metrics.observe("password_hash_wait_seconds", started - submitted)
+        try:
+            return func(*args)
+        finally:
+            metrics.observe("password_hash_seconds", time.perf_counter() - started)
+
+    _hash_pending += 1
+    _set_hash_queue_gauges()
+    future = _get_hash_executor().submit(run)
+    # 在任务真正结束（或排队中被取消）时才释放名额：请求被取消后，已开始的哈希仍会占用线程
+    future.add_done_callback(lambda _: loop.call_soon_threadsafe(_release_hash_slot))
+    return await asyncio.wrap_future(future)
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """verify_password 的异步版本，在密码哈希线程池中执行；排队已满时抛出 PasswordHashingBusy"""
+    return await _run_password_task(verify_password, plain_password, hashed_password)
+
+
+async def get_password_hash_async(password: str) -> str:
+    """get_password_hash 的异步版本，在密码哈希线程池中执行；排队已满时抛出 PasswordHashingBusy"""
+    return await _run_password_task(get_password_hash, password)
+
+
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     
@@ -38,9 +118,15 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
     return encoded_jwt
 
-def create_jwt_for_user(user_id: UUID) -> str:
+def user_principal_claims(user) -> dict:
+    """
+    写入 token 的最小用户声明（AUTH_TOKEN_EMBED_CLAIMS 开启时），认证时据此直接构造 UserPrincipal。
+    """
+    return {"email": user.email, "nickname": user.nickname}
+
+def create_jwt_for_user(user_id: UUID, claims: Optional[dict] = None) -> str:
     
     access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     return create_access_token(
-        data={"sub": str(user_id)}, expires_delta=access_token_expires
+        data={**(claims or {}), "sub": str(user_id)}, expires_delta=access_token_expires
     )
\ No newline at end of file
@@ -0,0 +1,216 @@
+# app/core/snapshot_cache.py
+
+"""
+读多写少的数据行（伙伴、已认证用户）的读穿缓存：进程内 LRU + Redis 两级，带版本号，通过 pub/sub 失效。
+
+- 缓存的是只读快照（pydantic 模型），不是 ORM 实例，可以安全地跨请求 / 跨会话共享。
+- 每个 key 在 Redis 中有一个版本号 cache:{name}:ver:{key}。Redis 中的条目记录生成时读到的版本号，
+  读取时与当前版本号一起 MGET，不一致即视为未命中：失效与回填并发时，旧数据不会被读到。
+- 写操作（见 crud_companion / crud_user）在提交后调用 invalidate：版本号加一、删除 Redis 条目，
+  并在 cache:{name}:invalidate 频道上广播，各进程的 listen_for_invalidations 收到后淘汰本地条目。
+  本地条目另有较短的 TTL，即使错过广播（例如 Redis 重连期间）也只会短暂过期。
+- 没有调用 configure 的进程（脚本、测试）不使用缓存，直接读数据库；
+  没有运行 listen_for_invalidations 的进程（worker）只使用 Redis 一级。
+
+命中 / 未命中计入 metrics：{name}_cache_hits_local / _hits_redis / _misses。
+"""
+
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Generic, Optional, Tuple, Type, TypeVar
+
+import redis.asyncio as redis
+from pydantic import BaseModel
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.schemas.companion import CompanionSnapshot
+from app.schemas.user import UserPrincipal
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T", bound=BaseModel)
+
+
+class SnapshotCache(Generic[T]):
+    def __init__(
+        self, name: str, model: Type[T], *, max_entries: int, local_ttl: float, redis_ttl: int, enabled: bool = True
+    ):
+        self.name = name
+        self.model = model
+        self.max_entries = max_entries
+        self.local_ttl = local_ttl
+        self.redis_ttl = redis_ttl
+        self.enabled = enabled
+        self.channel = f"cache:{name}:invalidate"
+        self._redis: Optional[redis.Redis] = None
+        # key -> (过期时间, 快照)
+        self._local: "OrderedDict[str, Tuple[float, T]]" = OrderedDict()
+        # 本地淘汰计数：回填前后不一致说明期间有失效发生，不写入本地
+        self._evictions = 0
+        # 只有订阅着失效频道时才使用本地一级（否则收不到其他进程的失效广播）
+        self.listening = False
+
+        metrics.register_ratio(
+            f"{name}_cache_hit_ratio",
+            numerator=f"{name}_cache_hits",
+            denominators=[f"{name}_cache_hits", f"{name}_cache_misses"],
+        )
+
+    def configure(self, redis_client: Optional[redis.Redis]) -> None:
+        self._redis = redis_client
+        self.clear_local()
+
+    def _entry_key(self, key: str) -> str:
+        return f"cache:{self.name}:{key}"
+
+    def _version_key(self, key: str) -> str:
+        return f"cache:{self.name}:ver:{key}"
+
+    def _get_local(self, key: str) -> Optional[T]:
+        entry = self._local.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._local[key]
+            return None
+        self._local.move_to_end(key)
+        return value
+
+    def _put_local(self, key: str, value: T) -> None:
+        self._local[key] = (time.monotonic() + self.local_ttl, value)
+        self._local.move_to_end(key)
+        while len(self._local) > self.max_entries:
+            self._local.popitem(last=False)
+        metrics.set_gauge(f"{self.name}_cache_local_entries", len(self._local))
+
+    def evict_local(self, key: str) -> None:
+        self._evictions += 1
+        self._local.pop(key, None)
+
+    def clear_local(self) -> None:
+        self._evictions += 1
+        self._local.clear()
+
+    async def get(self, key: str, loader: Callable[[], Awaitable[Optional[T]]]) -> Optional[T]:
+        """读穿：本地 → Redis → loader（数据库）。loader 返回 None 时不缓存"""
+        if not self.enabled or self._redis is None:
+            return await loader()
+
+        value = self._get_local(key) if self.listening else None
+        if value is not None:
+            metrics.incr(f"{self.name}_cache_hits")
+            metrics.incr(f"{self.name}_cache_hits_local")
+            return value
+
+        evictions = self._evictions
+        version = 0
+        try:
+            raw_version, raw_entry = await self._redis.mget(self._version_key(key), self._entry_key(key))
+            version = int(raw_version or 0)
+            if raw_entry:
+                entry = json.loads(raw_entry)
+                if entry["v"] == version:
+                    value = self.model.model_validate(entry["d"])
+                    metrics.incr(f"{self.name}_cache_hits")
+                    metrics.incr(f"{self.name}_cache_hits_redis")
+        except Exception as e:
+            logger.warning(f"读取 {self.name} 缓存失败，直接读数据库: {e}")
+            metrics.incr(f"{self.name}_cache_errors")
+            return await loader()
+
+        if value is None:
+            metrics.incr(f"{self.name}_cache_misses")
+            value = await loader()
+            if value is None:
+                return None
+            try:
+                entry = json.dumps({"v": version, "d": value.model_dump(mode="json")})
+                await self._redis.set(self._entry_key(key), entry, ex=self.redis_ttl)
+            except Exception as e:
+                logger.warning(f"写入 {self.name} 缓存失败: {e}")
+
+        if self.listening and evictions == self._evictions:
+            self._put_local(key, value)
+        return value
+
+    async def invalidate(self, *keys: str) -> None:
+        """数据变更并提交后调用：所有进程中的这些 key 都会失效"""
+        if not keys:
+            return
+        for key in keys:
+            self.evict_local(key)
+        if self._redis is None:
+            return
+        try:
+            async with self._redis.pipeline(transaction=False) as pipe:
+                for key in keys:
+                    pipe.incr(self._version_key(key))
+                    pipe.expire(self._version_key(key), self.redis_ttl * 2)
+                    pipe.delete(self._entry_key(key))
+                    pipe.publish(self.channel, key)
+                await pipe.execute()
+        except Exception as e:
+            # 版本号没能更新：其他进程的本地条目最多在 local_ttl 后过期
+            logger.error(f"{self.name} 缓存失效失败 ({len(keys)} 个 key): {e}")
+
+
+companion_cache: SnapshotCache[CompanionSnapshot] = SnapshotCache(
+    "companion",
+    CompanionSnapshot,
+    max_entries=settings.COMPANION_CACHE_MAX_ENTRIES,
+    local_ttl=settings.COMPANION_CACHE_LOCAL_TTL_SECONDS,
+    redis_ttl=settings.COMPANION_CACHE_REDIS_TTL_SECONDS,
+    enabled=settings.COMPANION_CACHE_ENABLED,
+)
+
+user_cache: SnapshotCache[UserPrincipal] = SnapshotCache(
+    "user",
+    UserPrincipal,
+    max_entries=settings.USER_CACHE_MAX_ENTRIES,
+    local_ttl=settings.USER_CACHE_LOCAL_TTL_SECONDS,
+    redis_ttl=settings.USER_CACHE_REDIS_TTL_SECONDS,
+    enabled=settings.USER_CACHE_ENABLED,
+)
+
+_caches: Dict[str, SnapshotCache] = {cache.channel: cache for cache in (companion_cache, user_cache)}
+
+
+def configure_snapshot_caches(redis_client: Optional[redis.Redis]) -> None:
+    """在进程启动时调用：API 与 worker 都要配置，worker 中的写操作才能让 API 的缓存失效"""
+    for cache in _caches.values():
+        cache.configure(redis_client)
+
+
+async def listen_for_invalidations(redis_client: redis.Redis) -> None:
+    """订阅全部缓存的失效频道并淘汰本地条目（API 进程的后台任务）；断线后清空本地缓存并重连"""
+    while True:
+        try:
+            async with redis_client.pubsub() as pubsub:
+                await pubsub.subscribe(*_caches)
+                # 订阅之前可能错过了广播
+                for cache in _caches.values():
+                    cache.clear_local()
+                    cache.listening = True
+                async for message in pubsub.listen():
+                    if message["type"] != "message":
+                        continue
+                    channel = message["channel"]
+                    channel = channel.decode() if isinstance(channel, bytes) else channel
+                    key = message["data"]
+                    key = key.decode() if isinstance(key, bytes) else key
+                    _caches[channel].evict_local(key)
+        except asyncio.CancelledError:
+            for cache in _caches.values():
+                cache.listening = False
+            raise
+        except Exception as e:
+            logger.warning(f"缓存失效订阅中断，稍后重连: {e}")
+            for cache in _caches.values():
+                cache.listening = False
+                cache.clear_local()
+            await asyncio.sleep(1)
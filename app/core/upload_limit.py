@@ -0,0 +1,94 @@
+# app/core/upload_limit.py
+
+"""
+请求体大小限制（纯 ASGI 中间件）。
+
+FastAPI 在调用上传接口之前就会把整个 multipart 表单解析并落到临时文件，
+所以接口内部的大小检查来不及阻止超大的上传。这里在最外层拦截：
+- 声明了 Content-Length 且超过上限的请求直接返回 413，不读取任何请求体
+- 分块传输（没有 Content-Length）的请求边接收边计数，超过上限时由中间件直接返回 413，
+  应用收到的是 http.disconnect
+"""
+
+import json
+from typing import Callable, Optional
+
+from app.core.config import settings
+
+# multipart 边界、各字段头等额外开销
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+
+async def _send_413(send, limit: int) -> None:
+    body = json.dumps({"detail": f"Request body exceeds the limit of {limit} bytes"}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": 413,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+class RequestBodyLimitMiddleware:
+    def __init__(self, app, limit_for: Callable[[dict], Optional[int]]):
+        self.app = app
+        self.limit_for = limit_for
+
+    async def __call__(self, scope, receive, send):
+        limit = self.limit_for(scope) if scope["type"] == "http" else None
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        content_length = headers.get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > limit:
+            await _send_413(send, limit)
+            return
+
+        received = 0
+        response_started = False
+        rejected = False
+
+        async def limited_receive():
+            nonlocal received, rejected
+            if rejected:
+                return {"type": "http.disconnect"}
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    # 在这里直接回复 413，而不是向应用抛异常：multipart 解析会捕获异常并回复 400。
+                    # 之后应用只会收到 http.disconnect，它的响应被丢弃
+                    rejected = True
+                    if not response_started:
+                        await _send_413(send, limit)
+                    return {"type": "http.disconnect"}
+            return message
+
+        async def tracking_send(message):
+            nonlocal response_started
+            if rejected:
+                return
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracking_send)
+        except Exception:
+            # 应用读到 http.disconnect 后可能抛出 ClientDisconnect 等异常，413 已经发出
+            if not rejected:
+                raise
+
+
+def knowledge_upload_limit(scope: dict) -> Optional[int]:
+    """知识文件上传接口的请求体上限；其他请求不限制"""
+    if scope.get("method") not in ("POST", "PUT"):
+        return None
+    path = scope.get("path", "")
+    if path.endswith("/knowledge/batch"):
+        return settings.KNOWLEDGE_BATCH_MAX_BYTES
+    if path.endswith("/knowledge") or "/knowledge/" in path:
+        return settings.KNOWLEDGE_UPLOAD_MAX_BYTES + MULTIPART_OVERHEAD_BYTES
+    return None
@@ -0,0 +1,38 @@
+from typing import Dict, List
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+
+from app.models.chunk_embedding import ChunkEmbedding
+
+
+async def get_embeddings(
+    db: AsyncSession, *, model_id: str, content_hashes: List[bytes]
+) -> Dict[bytes, bytes]:
+    """
+    (异步) 批量查询缓存的向量，返回 {content_hash: float16 字节串}，未命中的不在结果中。
+    """
+    if not content_hashes:
+        return {}
+    query = select(ChunkEmbedding.content_hash, ChunkEmbedding.embedding).where(
+        ChunkEmbedding.model_id == model_id,
+        ChunkEmbedding.content_hash.in_(content_hashes),
+    )
+    result = await db.execute(query)
+    return {row.content_hash: row.embedding for row in result}
+
+
+async def save_embeddings(
+    db: AsyncSession, *, model_id: str, dimension: int, embeddings: Dict[bytes, bytes]
+) -> None:
+    """
+    (异步) 批量写入向量缓存；并发写入同一内容时以先写入者为准。
+    """
+    if not embeddings:
+        return
+    stmt = insert(ChunkEmbedding).values([
+        {"model_id": model_id, "content_hash": content_hash, "dimension": dimension, "embedding": blob}
+        for content_hash, blob in embeddings.items()
+    ])
+    await db.execute(stmt.on_conflict_do_nothing(index_elements=["model_id", "content_hash"]))
+    await db.commit()
@@ -1,12 +1,17 @@
 # app/crud/crud_companion.py (最终异步版)
 
-from typing import List, Optional
+from datetime import timedelta
+from typing import List, Optional, Set, Tuple
 from uuid import UUID
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import and_, exists, func, or_, update
 from sqlalchemy.future import select
 
 from app.models.companion import Companion
-from app.schemas.companion import CompanionCreate, CompanionUpdate
+from app.models.knowledge_file import KnowledgeFile
+from app.models.knowledge_file_part import KnowledgeFilePart
+from app.core.snapshot_cache import companion_cache
+from app.schemas.companion import CompanionCreate, CompanionSnapshot, CompanionUpdate
 
 async def create_companion(db: AsyncSession, companion_in: CompanionCreate, user_id: UUID) -> Companion:
     """
@@ -19,20 +24,34 @@ async def create_companion(db: AsyncSession, companion_in: CompanionCreate, user
     await db.refresh(db_companion)
     return db_companion
 
-async def get_companion_by_id(db: AsyncSession, companion_id: UUID) -> Optional[Companion]:
+async def get_companion_by_id(db: AsyncSession, companion_id: UUID, include_deleted: bool = False) -> Optional[Companion]:
     """
-    通过 ID 获取一个 AI 伙伴 (异步)。
+    通过 ID 获取一个 AI 伙伴 (异步)。已软删除的伙伴默认视为不存在。
     """
-    result = await db.execute(select(Companion).filter(Companion.id == companion_id))
+    query = select(Companion).filter(Companion.id == companion_id)
+    if not include_deleted:
+        query = query.filter(Companion.deleted_at.is_(None))
+    result = await db.execute(query)
     return result.scalar_one_or_none()
 
+async def get_companion_snapshot(db: AsyncSession, companion_id: UUID) -> Optional[CompanionSnapshot]:
+    """
+    获取伙伴的只读快照 (异步)，先查进程内 / Redis 缓存，未命中时读数据库。
+    已软删除的伙伴视为不存在。需要修改伙伴时请使用 get_companion_by_id。
+    """
+    async def load() -> Optional[CompanionSnapshot]:
+        db_companion = await get_companion_by_id(db, companion_id)
+        return CompanionSnapshot.model_validate(db_companion) if db_companion else None
+
+    return await companion_cache.get(str(companion_id), load)
+
 async def get_multi_companions_by_owner(db: AsyncSession, user_id: UUID, skip: int = 0, limit: int = 100) -> List[Companion]:
     """
     获取一个用户拥有的所有 AI 伙伴列表 (异步)。
     """
     result = await db.execute(
         select(Companion)
-        .filter(Companion.user_id == user_id)
+        .filter(Companion.user_id == user_id, Companion.deleted_at.is_(None))
         .offset(skip)
         .limit(limit)
     )
@@ -52,12 +71,146 @@ async def update_companion(
     db.add(db_companion)
     await db.commit()
     await db.refresh(db_companion)
+    await companion_cache.invalidate(str(db_companion.id))
     return db_companion
 
 async def delete_companion(db: AsyncSession, db_companion: Companion) -> Companion:
     """
     删除一个 AI 伙伴 (异步)。
     """
+    companion_id = db_companion.id
     await db.delete(db_companion)
     await db.commit()
-    return db_companion
\ No newline at end of file
+    await companion_cache.invalidate(str(companion_id))
+    return db_companion
+
+async def soft_delete_companion(db: AsyncSession, db_companion: Companion) -> Companion:
+    """
+    软删除一个 AI 伙伴 (异步)：只标记 deleted_at，关联数据由后台清理任务删除。
+    """
+    companion_id = db_companion.id
+    db_companion.deleted_at = func.now()
+    db.add(db_companion)
+    await db.commit()
+    await companion_cache.invalidate(str(companion_id))
+    return db_companion
+
+
+async def get_live_companion_ids(db: AsyncSession, companion_ids: List[UUID]) -> Set[UUID]:
+    """
+    返回 companion_ids 中仍然存在且未被软删除的伙伴 ID (异步)。
+    """
+    if not companion_ids:
+        return set()
+    result = await db.execute(
+        select(Companion.id).filter(Companion.id.in_(companion_ids), Companion.deleted_at.is_(None))
+    )
+    return set(result.scalars().all())
+
+
+async def get_deleted_companion_ids(db: AsyncSession, older_than_seconds: int, limit: int = 100) -> List[UUID]:
+    """
+    返回软删除已超过 older_than_seconds、但后台清理仍未完成的伙伴 ID (异步)。
+    """
+    cutoff = func.now() - timedelta(seconds=older_than_seconds)
+    result = await db.execute(
+        select(Companion.id)
+        .filter(Companion.deleted_at.is_not(None), Companion.deleted_at < cutoff)
+        .order_by(Companion.deleted_at)
+        .limit(limit)
+    )
+    return result.scalars().all()
+
+
+# --- embedding 模型迁移（见 app/services/reindex_service.py）---
+
+async def start_embedding_migration(db: AsyncSession, *, model_id: str, default_model_id: str) -> int:
+    """
+    把所有当前模型不是 model_id 的伙伴标记为迁移到 model_id (异步)，返回标记的伙伴数。
+    embedding_model 为空的伙伴使用 default_model_id；已经在迁移到其他模型的伙伴不受影响。
+    """
+    current_model = func.coalesce(Companion.embedding_model, default_model_id)
+    result = await db.execute(
+        update(Companion)
+        .where(
+            Companion.deleted_at.is_(None),
+            Companion.reindex_model.is_(None),
+            current_model != model_id,
+        )
+        .values(reindex_model=model_id)
+        .returning(Companion.id)
+    )
+    companion_ids = result.scalars().all()
+    await db.commit()
+    await companion_cache.invalidate(*(str(companion_id) for companion_id in companion_ids))
+    return len(companion_ids)
+
+
+async def get_migrating_companions(db: AsyncSession, limit: int = 100) -> List[Companion]:
+    """
+    返回正在迁移 embedding 模型的伙伴 (异步)。
+    """
+    result = await db.execute(
+        select(Companion)
+        .filter(Companion.reindex_model.is_not(None), Companion.deleted_at.is_(None))
+        .order_by(Companion.created_at)
+        .limit(limit)
+    )
+    return result.scalars().all()
+
+
+async def switch_embedding_model(db: AsyncSession, *, companion_id: UUID, model_id: str) -> bool:
+    """
+    把伙伴原子地切换到迁移目标模型 (异步)：只有全部知识文件都已复制到 model_id 的命名空间、
+    且没有正在入库的文件时才会切换，判断与切换在同一条 UPDATE 中完成。返回是否切换成功。
+
+    同一事务中清空未完成分片的断点：断点记录的是旧命名空间中的进度，切换后重试要从头写入新命名空间。
+    """
+    pending_file = exists().where(
+        KnowledgeFile.companion_id == Companion.id,
+        or_(
+            KnowledgeFile.status.in_(("UPLOADED", "PROCESSING")),
+            KnowledgeFile.reindexed_model.is_distinct_from(model_id),
+        ),
+    )
+    result = await db.execute(
+        update(Companion)
+        .where(Companion.id == companion_id, Companion.reindex_model == model_id, ~pending_file)
+        .values(embedding_model=model_id, reindex_model=None)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount != 1:
+        await db.rollback()
+        return False
+
+    await db.execute(
+        update(KnowledgeFilePart)
+        .where(
+            KnowledgeFilePart.file_id.in_(select(KnowledgeFile.id).where(KnowledgeFile.companion_id == companion_id)),
+            KnowledgeFilePart.status != "INDEXED",
+            KnowledgeFilePart.committed_chunks > 0,
+        )
+        .values(committed_chunks=0)
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    await companion_cache.invalidate(str(companion_id))
+    return True
+
+
+async def get_embedding_migration_progress(db: AsyncSession) -> List[Tuple[UUID, str, int, int]]:
+    """
+    返回每个迁移中伙伴的 (companion_id, 目标模型, 已复制的文件数, 需要复制的文件数) (异步)。
+    """
+    copied = func.count(KnowledgeFile.id).filter(KnowledgeFile.reindexed_model == Companion.reindex_model)
+    result = await db.execute(
+        select(Companion.id, Companion.reindex_model, copied, func.count(KnowledgeFile.id))
+        .outerjoin(
+            KnowledgeFile,
+            and_(KnowledgeFile.companion_id == Companion.id, KnowledgeFile.status.in_(("INDEXED", "FAILED"))),
+        )
+        .filter(Companion.reindex_model.is_not(None), Companion.deleted_at.is_(None))
+        .group_by(Companion.id, Companion.reindex_model)
+        .order_by(Companion.id)
+    )
+    return [tuple(row) for row in result.all()]
@@ -1,8 +1,9 @@
 import os
+from datetime import datetime, timedelta
 from uuid import UUID
-from typing import List, Optional
+from typing import Dict, List, Optional, Set, Tuple
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import delete, func, select, update
 
 from app.models.knowledge_file import KnowledgeFile
 from app.schemas import knowledge_file as kf_schema
@@ -15,23 +16,92 @@ async def create_knowledge_file(db: AsyncSession, *, file_in: kf_schema.Knowledg
         id=file_id, # <-- 1. 直接使用传入的 file_id
         file_name=file_in.file_name,
         file_path=file_in.file_path,
-        companion_id=file_in.companion_id
+        companion_id=file_in.companion_id,
+        content_hash=file_in.content_hash,
     )
     db.add(db_file)
     await db.commit()
     await db.refresh(db_file)
     return db_file
 
+async def create_knowledge_files(
+    db: AsyncSession, *, files_in: List[Tuple[UUID, kf_schema.KnowledgeFileCreate]]
+) -> List[KnowledgeFile]:
+    """
+    (异步) 在一个事务中批量创建知识文件记录（批量 / 压缩包上传），只提交一次。
+    """
+    db.add_all([
+        KnowledgeFile(
+            id=file_id,
+            file_name=file_in.file_name,
+            file_path=file_in.file_path,
+            companion_id=file_in.companion_id,
+            content_hash=file_in.content_hash,
+        )
+        for file_id, file_in in files_in
+    ])
+    await db.commit()
+    # 提交后实例已过期，用一次查询重新取回，而不是逐个 refresh
+    query = (
+        select(KnowledgeFile)
+        .where(KnowledgeFile.id.in_([file_id for file_id, _ in files_in]))
+        .order_by(KnowledgeFile.file_name)
+    )
+    result = await db.execute(query)
+    return result.scalars().all()
+
 async def get_file_by_id(db: AsyncSession, *, file_id: UUID) -> Optional[KnowledgeFile]:
     query = select(KnowledgeFile).where(KnowledgeFile.id == file_id)
     result = await db.execute(query)
     return result.scalar_one_or_none()
 
+async def get_files_by_content_hash(
+    db: AsyncSession, *, companion_id: UUID, content_hashes: List[str]
+) -> Dict[str, KnowledgeFile]:
+    """
+    (异步) 查找同一伙伴下内容相同的已有文件，返回 {content_hash: 文件}。
+    处理失败的文件不算重复，允许重新上传。
+    """
+    if not content_hashes:
+        return {}
+    query = select(KnowledgeFile).where(
+        KnowledgeFile.companion_id == companion_id,
+        KnowledgeFile.content_hash.in_(content_hashes),
+        KnowledgeFile.status != "FAILED",
+    )
+    result = await db.execute(query)
+    return {db_file.content_hash: db_file for db_file in result.scalars()}
+
 async def get_files_by_companion(db: AsyncSession, *, companion_id: UUID) -> List[KnowledgeFile]:
     query = select(KnowledgeFile).where(KnowledgeFile.companion_id == companion_id).order_by(KnowledgeFile.created_at.desc())
     result = await db.execute(query)
     return result.scalars().all()
 
+async def get_existing_file_ids(db: AsyncSession, *, file_ids: List[UUID]) -> Set[UUID]:
+    """(异步) 返回 file_ids 中在数据库里仍然存在的那部分"""
+    if not file_ids:
+        return set()
+    result = await db.execute(select(KnowledgeFile.id).where(KnowledgeFile.id.in_(file_ids)))
+    return set(result.scalars().all())
+
+async def get_files_by_ids(db: AsyncSession, *, file_ids: List[UUID]) -> List[KnowledgeFile]:
+    if not file_ids:
+        return []
+    result = await db.execute(select(KnowledgeFile).where(KnowledgeFile.id.in_(file_ids)))
+    return result.scalars().all()
+
+async def get_stale_files(db: AsyncSession, *, status: str, older_than_seconds: int, limit: int) -> List[UUID]:
+    """(异步) 状态为 status 且超过 older_than_seconds 未更新的文件 ID"""
+    cutoff = func.now() - timedelta(seconds=older_than_seconds)
+    query = (
+        select(KnowledgeFile.id)
+        .where(KnowledgeFile.status == status, KnowledgeFile.updated_at < cutoff)
+        .order_by(KnowledgeFile.updated_at)
+        .limit(limit)
+    )
+    result = await db.execute(query)
+    return result.scalars().all()
+
 async def remove_file(db: AsyncSession, *, file_to_delete: KnowledgeFile) -> None:
     if os.path.exists(file_to_delete.file_path):
         try:
@@ -41,6 +111,104 @@ async def remove_file(db: AsyncSession, *, file_to_delete: KnowledgeFile) -> Non
     await db.delete(file_to_delete)
     await db.commit()
 
+async def delete_files_by_companion(db: AsyncSession, *, companion_id: UUID) -> int:
+    """
+    (异步) 删除伙伴的全部知识文件记录（分片记录由外键级联删除），返回删除的行数。
+    不负责磁盘文件与向量，由调用方在此之前清理。
+    """
+    result = await db.execute(delete(KnowledgeFile).where(KnowledgeFile.companion_id == companion_id))
+    await db.commit()
+    return result.rowcount
+
+async def set_reindexed_model(db: AsyncSession, *, file_id: UUID, model_id: Optional[str]) -> None:
+    await db.execute(update(KnowledgeFile).where(KnowledgeFile.id == file_id).values(reindexed_model=model_id))
+    await db.commit()
+
+async def mark_file_reindexed(db: AsyncSession, *, file_id: UUID, model_id: str, updated_at: datetime) -> bool:
+    """
+    (异步) 记录文件的向量已复制到 model_id 的命名空间。只有文件在复制期间没有被修改
+    （updated_at 未变，例如没有被替换或重试）时才会生效，返回是否生效。
+    """
+    result = await db.execute(
+        update(KnowledgeFile)
+        .where(KnowledgeFile.id == file_id, KnowledgeFile.updated_at == updated_at)
+        .values(reindexed_model=model_id)
+    )
+    await db.commit()
+    return result.rowcount == 1
+
+async def get_files_to_reindex(db: AsyncSession, *, companion_id: UUID, model_id: str, limit: int) -> List[KnowledgeFile]:
+    """(异步) 伙伴下还没有复制到 model_id 命名空间的文件（INDEXED，以及保留部分向量的 FAILED 文件）"""
+    query = (
+        select(KnowledgeFile)
+        .where(
+            KnowledgeFile.companion_id == companion_id,
+            KnowledgeFile.status.in_(("INDEXED", "FAILED")),
+            KnowledgeFile.reindexed_model.is_distinct_from(model_id),
+        )
+        .order_by(KnowledgeFile.created_at)
+        .limit(limit)
+    )
+    result = await db.execute(query)
+    return result.scalars().all()
+
+async def replace_file_content(
+    db: AsyncSession, *, file_id: UUID, file_name: str, file_path: str, content_hash: str | None = None
+) -> Optional[KnowledgeFile]:
+    """
+    (异步) 替换文件内容前更新记录：新的文件名 / 路径 / 内容哈希，状态回到 UPLOADED 等待重新处理。
+    只有文件不在处理中（不是 UPLOADED / PROCESSING）时才会生效，用一条条件 UPDATE 完成检查和写入：
+    并发的两个替换请求只有一个能成功，另一个返回 None。
+    """
+    result = await db.execute(
+        update(KnowledgeFile)
+        .where(KnowledgeFile.id == file_id, KnowledgeFile.status.not_in(("UPLOADED", "PROCESSING")))
+        .values(
+            file_name=file_name,
+            file_path=file_path,
+            content_hash=content_hash,
+            status="UPLOADED",
+            error_message=None,
+        )
+        .returning(KnowledgeFile.id)
+    )
+    await db.commit()
+    if result.scalar_one_or_none() is None:
+        return None
+    return await get_file_by_id(db, file_id=file_id)
+
+async def restore_file_content(
+    db: AsyncSession, *, file_id: UUID, file_name: str, file_path: str, content_hash: str | None, status: str
+) -> None:
+    """(异步) 替换在移动文件时失败：把 replace_file_content 改写的字段恢复为替换前的值"""
+    await db.execute(
+        update(KnowledgeFile)
+        .where(KnowledgeFile.id == file_id, KnowledgeFile.status == "UPLOADED")
+        .values(file_name=file_name, file_path=file_path, content_hash=content_hash, status=status)
+    )
+    await db.commit()
+
+async def transition_status(
+    db: AsyncSession,
+    *,
+    file_id: UUID,
+    from_status: str,
+    to_status: str,
+    older_than_seconds: int | None = None,
+) -> bool:
+    """
+    (异步) 只有文件当前处于 from_status（且指定 older_than_seconds 时超过这么久未更新）时才改为 to_status，
+    返回是否生效。用于“认领”文件：同一个文件被多个任务同时处理时，只有一个能认领成功。
+    """
+    conditions = [KnowledgeFile.id == file_id, KnowledgeFile.status == from_status]
+    if older_than_seconds is not None:
+        conditions.append(KnowledgeFile.updated_at < func.now() - timedelta(seconds=older_than_seconds))
+    result = await db.execute(
+        update(KnowledgeFile).where(*conditions).values(status=to_status, updated_at=func.now())
+    )
+    await db.commit()
+    return result.rowcount == 1
+
 async def update_status(db: AsyncSession, *, file_id: UUID, status: str, error_message: str | None = None) -> KnowledgeFile | None:
     db_file = await get_file_by_id(db, file_id=file_id)
     if db_file:
@@ -0,0 +1,261 @@
+from datetime import timedelta
+from uuid import UUID
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import and_, or_, select, delete, update, func
+from sqlalchemy.engine import Row
+
+from app.models.knowledge_file import KnowledgeFile
+from app.models.knowledge_file_part import KnowledgeFilePart
+
+UNFINISHED_STATUSES = ("PENDING", "PROCESSING")
+
+
+async def get_parts(db: AsyncSession, *, file_id: UUID) -> List[KnowledgeFilePart]:
+    query = select(KnowledgeFilePart).where(KnowledgeFilePart.file_id == file_id).order_by(KnowledgeFilePart.part_no)
+    result = await db.execute(query)
+    return result.scalars().all()
+
+
+async def create_parts(
+    db: AsyncSession,
+    *,
+    file_id: UUID,
+    ranges: List[Tuple[int, Optional[int]]],
+    first_part_no: int = 0,
+    supersede_existing: bool = False,
+) -> List[KnowledgeFilePart]:
+    """
+    (异步) 按页码区间为文件（重新）创建处理分片，编号从 first_part_no 开始。
+    已有的分片默认被删除；supersede_existing 时保留并标记为 SUPERSEDED（替换文件的增量模式）。
+    """
+    existing = KnowledgeFilePart.file_id == file_id
+    if supersede_existing:
+        await db.execute(update(KnowledgeFilePart).where(existing).values(status="SUPERSEDED"))
+    else:
+        await db.execute(delete(KnowledgeFilePart).where(existing))
+    parts = [
+        KnowledgeFilePart(
+            file_id=file_id, part_no=first_part_no + i, start_page=start, end_page=end,
+            status="PENDING", chunk_count=0, committed_chunks=0,
+        )
+        for i, (start, end) in enumerate(ranges)
+    ]
+    db.add_all(parts)
+    await db.commit()
+    return parts
+
+
+async def get_part(db: AsyncSession, *, file_id: UUID, part_no: int) -> Optional[KnowledgeFilePart]:
+    query = select(KnowledgeFilePart).where(
+        KnowledgeFilePart.file_id == file_id, KnowledgeFilePart.part_no == part_no
+    )
+    result = await db.execute(query)
+    return result.scalar_one_or_none()
+
+
+async def update_part_status(
+    db: AsyncSession,
+    *,
+    file_id: UUID,
+    part_no: int,
+    status: str,
+    chunk_count: int | None = None,
+    error_message: str | None = None,
+    chunk_manifest: bytes | None = None,
+) -> KnowledgeFilePart | None:
+    db_part = await get_part(db, file_id=file_id, part_no=part_no)
+    if db_part:
+        db_part.status = status
+        # 显式刷新 updated_at：状态没有变化（例如重新执行仍在 PROCESSING 的分片）时 ORM 不会发出 UPDATE，
+        # onupdate 也就不会触发，对账任务会把仍在推进的分片误判为停滞
+        db_part.updated_at = func.now()
+        if chunk_count is not None:
+            db_part.chunk_count = chunk_count
+        if error_message is not None:
+            db_part.error_message = error_message
+        if chunk_manifest is not None:
+            db_part.chunk_manifest = chunk_manifest
+        await db.commit()
+        await db.refresh(db_part)
+    return db_part
+
+
+async def claim_part(
+    db: AsyncSession, *, file_id: UUID, part_no: int, abandoned_after_seconds: int
+) -> Optional[KnowledgeFilePart]:
+    """
+    (异步) 认领一个分片开始处理：PENDING，或超过 abandoned_after_seconds 没有进展的 PROCESSING
+    （处理它的任务已经超时或 worker 已崩溃）的分片改为 PROCESSING 并返回；
+    分片正被另一个任务处理（或已经结束）时返回 None。同一个分片被重复入队时只有一个任务会处理它。
+    """
+    abandoned = func.now() - timedelta(seconds=abandoned_after_seconds)
+    stmt = (
+        update(KnowledgeFilePart)
+        .where(
+            KnowledgeFilePart.file_id == file_id,
+            KnowledgeFilePart.part_no == part_no,
+            or_(
+                KnowledgeFilePart.status == "PENDING",
+                and_(KnowledgeFilePart.status == "PROCESSING", KnowledgeFilePart.updated_at < abandoned),
+            ),
+        )
+        .values(status="PROCESSING", updated_at=func.now())
+        .returning(KnowledgeFilePart.part_no)
+    )
+    result = await db.execute(stmt)
+    await db.commit()
+    if result.scalar_one_or_none() is None:
+        return None
+    return await get_part(db, file_id=file_id, part_no=part_no)
+
+
+async def update_part_checkpoint(db: AsyncSession, *, file_id: UUID, part_no: int, committed_chunks: int) -> None:
+    """
+    (异步) 记录分片的上传断点。只会前移，不会被乱序到达的旧值覆盖。
+    """
+    stmt = (
+        update(KnowledgeFilePart)
+        .where(
+            KnowledgeFilePart.file_id == file_id,
+            KnowledgeFilePart.part_no == part_no,
+            KnowledgeFilePart.committed_chunks < committed_chunks,
+        )
+        # 断点前移即为进展，停滞检测 (fail_stale_parts) 依据 updated_at 判断
+        .values(committed_chunks=committed_chunks, updated_at=func.now())
+    )
+    await db.execute(stmt)
+    await db.commit()
+
+
+async def get_unfinished_parts(db: AsyncSession, *, file_id: UUID) -> List[KnowledgeFilePart]:
+    """(异步) 返回尚未成功的分片（不含已被替换的旧分片），用于断点重试。"""
+    query = (
+        select(KnowledgeFilePart)
+        .where(
+            KnowledgeFilePart.file_id == file_id,
+            KnowledgeFilePart.status.in_(UNFINISHED_STATUSES + ("FAILED",)),
+        )
+        .order_by(KnowledgeFilePart.part_no)
+    )
+    result = await db.execute(query)
+    return result.scalars().all()
+
+
+async def reset_parts_for_retry(db: AsyncSession, *, file_id: UUID) -> List[int]:
+    """
+    (异步) 把未成功的分片重置为 PENDING（保留断点），返回需要重新入队的分片编号。
+    """
+    parts = await get_unfinished_parts(db, file_id=file_id)
+    for part in parts:
+        part.status = "PENDING"
+        part.error_message = None
+    await db.commit()
+    return [part.part_no for part in parts]
+
+
+async def get_part_manifests(db: AsyncSession, *, file_id: UUID, superseded: bool) -> List[bytes]:
+    """(异步) 返回文件当前分片（或已被替换的旧分片）的文本块清单"""
+    status_filter = (
+        KnowledgeFilePart.status == "SUPERSEDED" if superseded else KnowledgeFilePart.status != "SUPERSEDED"
+    )
+    query = select(KnowledgeFilePart.chunk_manifest).where(
+        KnowledgeFilePart.file_id == file_id,
+        status_filter,
+        KnowledgeFilePart.chunk_manifest.is_not(None),
+    )
+    result = await db.execute(query)
+    return result.scalars().all()
+
+
+async def get_vector_manifests(db: AsyncSession, *, file_ids: List[UUID]) -> Dict[UUID, Optional[List[bytes]]]:
+    """
+    (异步) 返回每个文件全部分片（包括被替换的旧分片）的文本块清单，用于按 ID 删除向量。
+    只要有一个分片缺少清单（处理中或失败），该文件的值就是 None；没有分片记录的文件不出现在结果中。
+    """
+    if not file_ids:
+        return {}
+    query = select(KnowledgeFilePart.file_id, KnowledgeFilePart.chunk_manifest).where(
+        KnowledgeFilePart.file_id.in_(file_ids)
+    )
+    manifests: Dict[UUID, Optional[List[bytes]]] = {}
+    for file_id, blob in (await db.execute(query)).all():
+        blobs = manifests.setdefault(file_id, [])
+        if blobs is None or blob is None:
+            manifests[file_id] = None
+        else:
+            blobs.append(blob)
+    return manifests
+
+
+async def delete_superseded_parts(db: AsyncSession, *, file_id: UUID) -> List[int]:
+    """(异步) 删除已被替换的旧分片记录，返回被删除的分片编号"""
+    stmt = (
+        delete(KnowledgeFilePart)
+        .where(KnowledgeFilePart.file_id == file_id, KnowledgeFilePart.status == "SUPERSEDED")
+        .returning(KnowledgeFilePart.part_no)
+    )
+    result = await db.execute(stmt)
+    part_nos = result.scalars().all()
+    await db.commit()
+    return part_nos
+
+
+async def get_parts_summary(db: AsyncSession, *, file_id: UUID) -> Row:
+    """
+    (异步) 汇总一个文件的当前分片（不含 SUPERSEDED）：total / unfinished / failed / chunk_count / error_message
+    （error_message 取任意一个失败分片的错误信息）。
+    """
+    query = select(
+        func.count().label("total"),
+        func.count().filter(KnowledgeFilePart.status.in_(UNFINISHED_STATUSES)).label("unfinished"),
+        func.count().filter(KnowledgeFilePart.status == "FAILED").label("failed"),
+        func.coalesce(func.sum(KnowledgeFilePart.chunk_count), 0).label("chunk_count"),
+        func.min(KnowledgeFilePart.error_message).label("error_message"),
+    ).where(KnowledgeFilePart.file_id == file_id, KnowledgeFilePart.status != "SUPERSEDED")
+    result = await db.execute(query)
+    return result.one()
+
+
+async def fail_stale_parts(db: AsyncSession, *, older_than_seconds: int, error_message: str) -> List[UUID]:
+    """
+    (异步) 把超过 older_than_seconds 没有任何进展（状态 / 断点都未更新）的 PROCESSING 分片标记为 FAILED，
+    断点保留，重试时从断点继续。返回涉及的文件 ID（去重）。
+    """
+    cutoff = func.now() - timedelta(seconds=older_than_seconds)
+    stmt = (
+        update(KnowledgeFilePart)
+        .where(KnowledgeFilePart.status == "PROCESSING", KnowledgeFilePart.updated_at < cutoff)
+        .values(status="FAILED", error_message=error_message)
+        .returning(KnowledgeFilePart.file_id)
+    )
+    result = await db.execute(stmt)
+    file_ids = list(dict.fromkeys(result.scalars().all()))
+    await db.commit()
+    return file_ids
+
+
+async def get_stale_pending_parts(db: AsyncSession, *, older_than_seconds: int, limit: int) -> List[Tuple[UUID, int]]:
+    """(异步) 超过 older_than_seconds 仍未开始处理的分片 (file_id, part_no)"""
+    cutoff = func.now() - timedelta(seconds=older_than_seconds)
+    query = (
+        select(KnowledgeFilePart.file_id, KnowledgeFilePart.part_no)
+        .where(KnowledgeFilePart.status == "PENDING", KnowledgeFilePart.updated_at < cutoff)
+        .order_by(KnowledgeFilePart.updated_at)
+        .limit(limit)
+    )
+    result = await db.execute(query)
+    return [tuple(row) for row in result.all()]
+
+
+async def get_files_with_superseded_parts(db: AsyncSession, *, limit: int) -> List[UUID]:
+    """(异步) 已经 INDEXED 但仍留有被替换旧分片的文件（替换完成后清理旧分片失败）"""
+    query = (
+        select(KnowledgeFilePart.file_id)
+        .join(KnowledgeFile, KnowledgeFile.id == KnowledgeFilePart.file_id)
+        .where(KnowledgeFilePart.status == "SUPERSEDED", KnowledgeFile.status == "INDEXED")
+        .distinct()
+        .limit(limit)
+    )
+    result = await db.execute(query)
+    return result.scalars().all()
@@ -1,7 +1,10 @@
-from typing import List
+from datetime import datetime
+from typing import AsyncIterator, List, Optional, Tuple
 from uuid import UUID
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import Row, func, literal_column, select, tuple_
+
+from app.core.config import settings
 
 from app.models.message import Message
 from app.schemas.message import MessageCreate
@@ -42,18 +45,105 @@ async def get_messages_by_companion(
     return result.scalars().all()
 
 
-async def get_messages_by_companion_ascending(
-    db: AsyncSession, *, companion_id: UUID, user_id: UUID, skip: int = 0, limit: int = 100
-) -> List[Message]:
+async def get_messages_page(
+    db: AsyncSession,
+    *,
+    companion_id: UUID,
+    user_id: UUID,
+    limit: int = 50,
+    before: Optional[Tuple[datetime, UUID]] = None,
+    after: Optional[Tuple[datetime, UUID]] = None,
+) -> Tuple[List[Message], bool]:
     """
-    (异步) 获取指定AI伙伴与用户的聊天记录 (按时间正序)。
+    (异步) 按 (created_at, id) 键集分页获取指定AI伙伴与用户的聊天记录，页内按时间正序。
+
+    - before: 早于该位置的 limit 条（向更早翻页）
+    - after: 晚于该位置的 limit 条（向更新翻页）
+    - 都不传: 最新的 limit 条
+
+    返回 (消息列表, 翻页方向上是否还有更多)。查询沿 (companion_id, user_id, created_at, id)
+    复合索引定位，不使用 OFFSET，翻到多早的记录代价都相同。
     """
-    query = (
-        select(Message)
-        .where(Message.companion_id == companion_id, Message.user_id == user_id)
-        .order_by(Message.created_at.asc())
-        .offset(skip)
-        .limit(limit)
+    position = tuple_(Message.created_at, Message.id)
+    query = select(Message).where(Message.companion_id == companion_id, Message.user_id == user_id)
+    if after is not None:
+        query = query.where(position > tuple_(*after)).order_by(Message.created_at.asc(), Message.id.asc())
+    else:
+        if before is not None:
+            query = query.where(position < tuple_(*before))
+        query = query.order_by(Message.created_at.desc(), Message.id.desc())
+
+    # 多取一条，判断翻页方向上是否还有更多
+    result = await db.execute(query.limit(limit + 1))
+    messages = list(result.scalars().all())
+    has_more = len(messages) > limit
+    messages = messages[:limit]
+    if after is None:
+        messages.reverse()
+    return messages, has_more
+
+
+async def stream_messages(
+    db: AsyncSession, *, user_id: UUID, companion_id: Optional[UUID] = None, batch_size: int = 1000
+) -> AsyncIterator[Row]:
+    """
+    (异步) 以服务端游标逐批读取用户的聊天记录（可限定一个伙伴），按伙伴、时间正序。
+    只取导出需要的列，每次从数据库取 batch_size 行：无论总量多大，都只有一条查询、内存占用恒定。
+    """
+    query = select(
+        Message.id, Message.companion_id, Message.role, Message.content, Message.created_at
+    ).where(Message.user_id == user_id)
+    if companion_id is not None:
+        query = query.where(Message.companion_id == companion_id)
+    query = query.order_by(Message.companion_id, Message.created_at, Message.id).execution_options(
+        yield_per=batch_size
     )
-    result = await db.execute(query)
-    return result.scalars().all()
\ No newline at end of file
+
+    result = await db.stream(query)
+    async for partition in result.partitions():
+        for row in partition:
+            yield row
+
+
+def _escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+async def search_messages(
+    db: AsyncSession,
+    *,
+    companion_id: UUID,
+    user_id: UUID,
+    query: str,
+    limit: int = 20,
+    after: Optional[Tuple[float, datetime, UUID]] = None,
+) -> Tuple[List[Tuple[Message, float]], bool]:
+    """
+    (异步) 在指定AI伙伴与用户的聊天记录中搜索，按相关度降序（相同时新的在前）。
+    after 为上一页最后一条的 (相关度, created_at, id)，键集分页。
+
+    返回 ([(消息, 相关度)], 是否还有更多)。MESSAGE_SEARCH_BACKEND 决定匹配方式：
+    - trgm: 子串匹配（ILIKE，由 pg_trgm GIN 索引加速），相关度为 word_similarity
+    - zhparser: 中文分词的全文检索，相关度为 ts_rank_cd
+    """
+    if settings.MESSAGE_SEARCH_BACKEND == "zhparser":
+        # 分词配置必须以常量写在 SQL 中，才能与索引表达式 to_tsvector('zh', content) 匹配
+        config = literal_column("'zh'::regconfig")
+        document = func.to_tsvector(config, Message.content)
+        ts_query = func.plainto_tsquery(config, query)
+        match = document.op("@@")(ts_query)
+        rank = func.ts_rank_cd(document, ts_query)
+    else:
+        match = Message.content.ilike(f"%{_escape_like(query)}%", escape="\\")
+        rank = func.word_similarity(query, Message.content)
+
+    stmt = select(Message, rank.label("rank")).where(
+        Message.companion_id == companion_id, Message.user_id == user_id, match
+    )
+    if after is not None:
+        stmt = stmt.where(tuple_(rank, Message.created_at, Message.id) < tuple_(*after))
+    stmt = stmt.order_by(rank.desc(), Message.created_at.desc(), Message.id.desc()).limit(limit + 1)
+
+    result = await db.execute(stmt)
+    hits = [(message, float(score)) for message, score in result.all()]
+    return hits[:limit], len(hits) > limit
@@ -4,7 +4,9 @@ from uuid import UUID
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 
+from app.core.snapshot_cache import user_cache
 from app.models.user import User
+from app.schemas.user import UserPrincipal
 # 注意：我们不再需要从 schemas 导入 UserCreate，因为创建逻辑已改变
 # from app.schemas.user import UserCreate 
 
@@ -40,6 +42,16 @@ async def get_user(db: AsyncSession, user_id: UUID) -> User | None:
     result = await db.execute(select(User).filter(User.id == user_id))
     return result.scalar_one_or_none()
 
+async def get_user_principal(db: AsyncSession, user_id: UUID) -> UserPrincipal | None:
+    """
+    获取用户的只读快照 (异步)，供认证依赖使用：先查进程内 / Redis 缓存，未命中时读数据库。
+    """
+    async def load() -> UserPrincipal | None:
+        db_user = await get_user(db, user_id)
+        return UserPrincipal.model_validate(db_user) if db_user else None
+
+    return await user_cache.get(str(user_id), load)
+
 # : 添加一个专门用于更新用户头像的函数
 async def update_user_avatar(db: AsyncSession, *, user: User, avatar_url: str) -> User:
     """
@@ -49,4 +61,5 @@ async def update_user_avatar(db: AsyncSession, *, user: User, avatar_url: str) -
     db.add(user)
     await db.commit()
     await db.refresh(user)
+    await user_cache.invalidate(str(user.id))
     return user    
\ No newline at end of file
@@ -5,4 +5,6 @@ from app.db.base_class import Base
 from app.models.user import User
 from app.models.companion import Companion
 from app.models.message import Message
-from app.models.knowledge_file import KnowledgeFile
\ No newline at end of file
+from app.models.knowledge_file import KnowledgeFile
+from app.models.knowledge_file_part import KnowledgeFilePart
+from app.models.chunk_embedding import ChunkEmbedding
\ No newline at end of file
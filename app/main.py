@@ -1,3 +1,5 @@
+import asyncio
+import logging
 import redis.asyncio as redis
 from fastapi import FastAPI
 from arq.connections import create_pool, RedisSettings
@@ -12,9 +14,15 @@ from app.apis.v1 import chat as chat_router
 from app.apis.v1 import knowledge as knowledge_router
 from app.apis.v1 import uploads as uploads_router
 from app.apis.v1 import users as users_router
+from app.services.embedding import warm_up_embedding_model
+from app.core.metrics import metrics, read_published_metrics
+from app.core.snapshot_cache import configure_snapshot_caches, listen_for_invalidations
+from app.core.upload_limit import RequestBodyLimitMiddleware, knowledge_upload_limit
 
 
 app = FastAPI(title=settings.PROJECT_NAME)
+# 超大的知识文件上传在读取请求体之前就被拒绝（413）
+app.add_middleware(RequestBodyLimitMiddleware, limit_for=knowledge_upload_limit)
 
 @app.on_event("startup")
 async def startup_event():
@@ -36,9 +44,29 @@ async def startup_event():
     print("General Redis client stored in app.state.")
     # --- 修改结束 ---
 
+    # 伙伴等读多写少数据的读穿缓存：Redis 一级 + 本进程 LRU（由 pub/sub 广播失效）
+    configure_snapshot_caches(redis_client)
+    app.state.cache_invalidation_listener = asyncio.create_task(listen_for_invalidations(redis_client))
+
+    # 在后台线程中加载并预热 embedding 模型：应用立即开始对外服务，
+    # 加载完成前的检索请求会自动退化为本地词法检索。
+    if settings.EMBEDDING_PRELOAD:
+        app.state.embedding_warmup = asyncio.create_task(_warm_up_embedding_model())
+
+
+async def _warm_up_embedding_model():
+    try:
+        await asyncio.to_thread(warm_up_embedding_model)
+        print("Embedding model loaded and warmed up.")
+    except Exception as e:
+        logging.error(f"Embedding model warm-up failed: {e}", exc_info=True)
+
+
 @app.on_event("shutdown")
 async def shutdown_event():
     print("--- Application shutdown... ---")
+    if hasattr(app.state, 'cache_invalidation_listener'):
+        app.state.cache_invalidation_listener.cancel()
     if hasattr(app.state, 'arq_pool'):
         await app.state.arq_pool.close()
         print("ARQ Redis pool closed.")
@@ -59,4 +87,13 @@ app.include_router(users_router.router, prefix=f"{settings.API_V1_STR}/users", t
 
 @app.get("/")
 def read_root():
-    return {"message": f"Welcome to {settings.PROJECT_NAME}"}
\ No newline at end of file
+    return {"message": f"Welcome to {settings.PROJECT_NAME}"}
+
+
+@app.get("/metrics")
+async def read_metrics():
+    """本进程与各 ARQ worker 发布的运行指标（缓存命中率等）"""
+    return {
+        "api": metrics.snapshot(),
+        "published": await read_published_metrics(app.state.redis_client),
+    }
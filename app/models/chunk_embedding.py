@@ -0,0 +1,25 @@
+# app/models/chunk_embedding.py
+
+from datetime import datetime
+from sqlalchemy import String, LargeBinary, SmallInteger, DateTime, func
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.db.base_class import Base
+
+
+class ChunkEmbedding(Base):
+    """
+    内容寻址的文本块向量缓存：同一个模型下，相同文本只需向量化一次。
+    向量以 float16 字节串存储，比 float32 / JSON 小一半以上。
+    """
+    __tablename__ = "chunk_embeddings"
+
+    # 模型标识（模型名 + 推理后端），不同模型 / 后端的向量互不复用
+    model_id: Mapped[str] = mapped_column(String(255), primary_key=True)
+    # 文本块内容的 sha256 摘要（32 字节）
+    content_hash: Mapped[bytes] = mapped_column(LargeBinary(32), primary_key=True)
+
+    dimension: Mapped[int] = mapped_column(SmallInteger, nullable=False)
+    embedding: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
+
+    created_at: Mapped[datetime] = mapped_column(DateTime, server_default=func.now())
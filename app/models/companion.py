@@ -37,8 +37,15 @@ class Companion(Base):
     pinecone_index_name: Mapped[Optional[str]] = mapped_column(String, unique=True, nullable=True, index=True)
     knowledge_base_status: Mapped[str] = mapped_column(String(20), default='EMPTY', nullable=False)
 
+    # 知识库向量使用的 embedding 模型标识（"模型名@后端"），决定检索 / 入库使用的模型与 Pinecone 命名空间；
+    # 为空表示当前配置的模型、默认命名空间。reindex_model 非空表示正在迁移到该模型，完成后原子地切换
+    embedding_model: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)
+    reindex_model: Mapped[Optional[str]] = mapped_column(String(255), nullable=True, index=True)
+
     created_at: Mapped[datetime] = mapped_column(DateTime, server_default=func.now())
     updated_at: Mapped[datetime] = mapped_column(DateTime, server_default=func.now(), onupdate=func.now())
+    # 软删除：设置后伙伴立即对外不可见，向量、记忆、文件等由后台任务 cleanup_companion_task 清理
+    deleted_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True, index=True)
 
     # relationships
     owner: Mapped["User"] = relationship("User", back_populates="companions")
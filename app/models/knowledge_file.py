@@ -1,5 +1,5 @@
 import uuid
-from sqlalchemy import Column, String, Text, ForeignKey, func, DateTime
+from sqlalchemy import Column, String, Text, ForeignKey, func, DateTime, Index, text
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 
@@ -26,12 +26,38 @@ class KnowledgeFile(Base):
     # 关联到 companions 表
     companion_id = Column(UUID(as_uuid=True), ForeignKey("companions.id"), nullable=False, index=True)
     
+    # 文件内容的 sha256（十六进制），上传时边写盘边计算，用于同一伙伴下的重复文件检测；
+    # 同一伙伴下未失败的文件不能重复（部分唯一索引），并发上传同一文件时只有一个能插入成功
+    content_hash = Column(String(64), nullable=True)
+
     # 文件处理状态，使用字符串
     status = Column(String(20), default='UPLOADED', nullable=False)
     error_message = Column(Text, nullable=True)
 
+    # 模型迁移期间：该文件的向量已完整复制到迁移目标模型（companion.reindex_model）的命名空间时，记录该模型标识；
+    # 文件被重新处理（替换 / 重试）时清空，需要重新复制
+    reindexed_model = Column(String(255), nullable=True)
+
     created_at = Column(DateTime, server_default=func.now())
     updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
 
+    __table_args__ = (
+        Index(
+            "ix_knowledge_files_companion_id_content_hash",
+            "companion_id",
+            "content_hash",
+            unique=True,
+            postgresql_where=text("status <> 'FAILED'"),
+        ),
+    )
+
     # 建立与 Companion 模型的关系
-    companion = relationship("Companion", back_populates="knowledge_files")
\ No newline at end of file
+    companion = relationship("Companion", back_populates="knowledge_files")
+
+    # 处理分片（大文件拆成多个子任务并行处理），随文件一起删除
+    parts = relationship(
+        "KnowledgeFilePart",
+        back_populates="knowledge_file",
+        cascade="all, delete-orphan",
+        passive_deletes=True,
+    )
\ No newline at end of file
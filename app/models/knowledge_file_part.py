@@ -0,0 +1,43 @@
+# app/models/knowledge_file_part.py
+
+import uuid
+from datetime import datetime
+from typing import Optional
+from sqlalchemy import ForeignKey, Integer, LargeBinary, String, Text, DateTime, func
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.orm import Mapped, mapped_column, relationship
+
+from app.db.base_class import Base
+
+
+class KnowledgeFilePart(Base):
+    """
+    知识文件的一个处理分片（PDF 的一段连续页码）。
+    大文件由协调任务拆成多个分片，分别作为独立的 ARQ 子任务处理，
+    所有分片完成后再汇总为 KnowledgeFile 的最终状态。
+    """
+    __tablename__ = "knowledge_file_parts"
+
+    file_id: Mapped[uuid.UUID] = mapped_column(
+        UUID(as_uuid=True), ForeignKey("knowledge_files.id", ondelete="CASCADE"), primary_key=True
+    )
+    part_no: Mapped[int] = mapped_column(Integer, primary_key=True)
+
+    # PDF 为页码区间 [start_page, end_page)；非 PDF 文件为文本块序号区间；end_page 为空表示到文件末尾
+    start_page: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    end_page: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+
+    # PENDING / PROCESSING / INDEXED / FAILED；
+    # 替换文件时旧分片标记为 SUPERSEDED，新分片全部成功后再清理
+    status: Mapped[str] = mapped_column(String(20), default="PENDING", nullable=False)
+    chunk_count: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    # 断点：按文档顺序已连续上传到 Pinecone 的文本块数，重试时从这里继续
+    committed_chunks: Mapped[int] = mapped_column(Integer, default=0, server_default="0", nullable=False)
+    error_message: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    # 文本块清单（见 app/services/chunk_manifest.py），分片成功后写入，用于替换文件时的增量更新
+    chunk_manifest: Mapped[Optional[bytes]] = mapped_column(LargeBinary, nullable=True)
+
+    created_at: Mapped[datetime] = mapped_column(DateTime, server_default=func.now())
+    updated_at: Mapped[datetime] = mapped_column(DateTime, server_default=func.now(), onupdate=func.now())
+
+    knowledge_file = relationship("KnowledgeFile", back_populates="parts")
@@ -1,5 +1,5 @@
 import uuid
-from sqlalchemy import Column, Text, ForeignKey, func, DateTime, String
+from sqlalchemy import Column, Text, ForeignKey, func, DateTime, String, Index
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 
@@ -23,6 +23,19 @@ class Message(Base):
     user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False, index=True)
 
     created_at = Column(DateTime, server_default=func.now())
+
+    # 聊天记录按 (伙伴, 用户) 以 (created_at, id) 键集分页读取，见 crud_message.get_messages_page；
+    # content 上的三元组 GIN 索引用于聊天记录搜索，见 crud_message.search_messages
+    # （zhparser 的全文索引 ix_messages_content_zh 只在安装了 zhparser 的数据库上由迁移创建，不在这里声明）
+    __table_args__ = (
+        Index("ix_messages_companion_id_user_id_created_at_id", "companion_id", "user_id", "created_at", "id"),
+        Index(
+            "ix_messages_content_trgm",
+            "content",
+            postgresql_using="gin",
+            postgresql_ops={"content": "gin_trgm_ops"},
+        ),
+    )
     
     # 建立关系 (可选，但推荐)
     companion = relationship("Companion")
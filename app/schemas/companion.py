@@ -32,4 +32,23 @@ class Companion(CompanionBase): # <-- 统一命名为 Companion
     owner_id: uuid.UUID # <-- 修正：根据您的 model，外键应为 owner_id
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+# 伙伴的只读快照：缓存在进程内与 Redis 中（见 app/core/snapshot_cache.py），
+# 供对话、WebSocket 连接和知识库接口读取，不能用于修改
+class CompanionSnapshot(BaseModel):
+    id: uuid.UUID
+    owner_id: uuid.UUID
+    name: str
+    description: str
+    instructions: str
+    seed: str
+    avatar_url: Optional[str] = None
+    category_id: Optional[str] = None
+    knowledge_base_status: str
+    embedding_model: Optional[str] = None
+    reindex_model: Optional[str] = None
+
+    class Config:
+        from_attributes = True
+        frozen = True
@@ -11,6 +11,7 @@ class KnowledgeFileRead(KnowledgeFileBase):
     id: UUID
     status: str
     error_message: str | None = None
+    content_hash: str | None = None
     created_at: datetime
 
     class Config:
@@ -19,4 +20,5 @@ class KnowledgeFileRead(KnowledgeFileBase):
 # 创建文件记录时内部使用的模型
 class KnowledgeFileCreate(KnowledgeFileBase):
     file_path: str
-    companion_id: UUID
\ No newline at end of file
+    companion_id: UUID
+    content_hash: str | None = None
\ No newline at end of file
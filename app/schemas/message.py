@@ -1,3 +1,4 @@
+from typing import List, Optional
 from pydantic import BaseModel, Field
 from uuid import UUID
 from datetime import datetime
@@ -16,4 +17,21 @@ class MessageRead(MessageBase):
     created_at: datetime
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+# 键集分页的一页聊天记录：items 按时间正序；
+# before_cursor 用于加载更早的记录，after_cursor 用于加载更新的记录，为空表示该方向没有更多
+class MessagePage(BaseModel):
+    items: List[MessageRead]
+    before_cursor: Optional[str] = None
+    after_cursor: Optional[str] = None
+
+
+# 聊天记录搜索的一条结果与一页结果：按相关度降序，next_cursor 为空表示没有更多
+class MessageSearchHit(MessageRead):
+    rank: float
+
+
+class MessageSearchPage(BaseModel):
+    items: List[MessageSearchHit]
+    next_cursor: Optional[str] = None
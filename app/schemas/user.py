@@ -28,4 +28,17 @@ class User(UserBase):
     created_at: datetime
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+# 已认证用户的只读快照：由认证依赖返回，缓存在进程内与 Redis 中（见 app/core/snapshot_cache.py），
+# 或者在开启 AUTH_TOKEN_EMBED_CLAIMS 时直接由 token 中的声明构造（此时没有 avatar_url / created_at）
+class UserPrincipal(BaseModel):
+    id: uuid.UUID
+    email: str
+    nickname: Optional[str] = None
+    avatar_url: Optional[str] = None
+    created_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+        frozen = True
@@ -29,9 +29,9 @@ class ChatService:
         )
 
     async def process_user_message(self, user_message: str) -> AsyncGenerator[str, None]:
-        """处理单条用户消息的完整流程，并在每次处理时获取最新的伙伴人设。"""
+        """处理单条用户消息的完整流程，并在每次处理时获取最新的伙伴人设（读穿缓存，修改后立即失效）。"""
         
-        companion = await crud_companion.get_companion_by_id(db=self.db, companion_id=self.companion_id)
+        companion = await crud_companion.get_companion_snapshot(db=self.db, companion_id=self.companion_id)
         if not companion:
             yield "[ERROR] 伙伴信息不存在，对话无法继续。"
             yield "[END_OF_STREAM]"
@@ -74,9 +74,10 @@ class ChatService:
 你需要巧妙地满足用户的深层需求，并采用最适合他当前接受度的沟通方式。
 """
 
-        # --- ↓↓↓ 这是关键的修正：移除了 await 关键字 ↓↓↓ ---
-        retrieved_knowledge = rag_service.retrieve(query=user_message, companion_id=self.companion_id)
-        # --- ↑↑↑ 修正完成 ↑↑↑ ---
+        # 检索的阻塞部分（词法索引加载、向量检索）都在线程中执行，不会阻塞事件循环
+        retrieved_knowledge = await rag_service.retrieve(
+            query=user_message, companion_id=self.companion_id, embedding_model=companion.embedding_model
+        )
         knowledge_context = "\n\n".join(retrieved_knowledge)
 
         system_prompt_template = f"""
@@ -0,0 +1,70 @@
+# app/services/chunk_manifest.py
+
+"""
+分片的文本块清单：每个文本块一条 (向量编号, 内容摘要) 记录，紧凑地打包成字节串存入数据库。
+
+替换文件时用它做增量：新文件中内容未变的文本块直接沿用旧的向量编号（不再向量化和上传），
+旧清单中不再出现的编号就是需要从 Pinecone 删除的向量。
+向量编号即向量 ID f"{file_id}_{编号}" 中的数字部分。
+"""
+
+import hashlib
+import struct
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+# sha256 的前 8 字节：单个文件内的碰撞概率可以忽略，清单每条只占 16 字节
+MANIFEST_HASH_BYTES = 8
+_ENTRY = struct.Struct(f"<Q{MANIFEST_HASH_BYTES}s")
+
+ManifestEntry = Tuple[int, bytes]
+
+
+def chunk_digest(text: str) -> bytes:
+    return hashlib.sha256(text.encode("utf-8")).digest()[:MANIFEST_HASH_BYTES]
+
+
+def pack_manifest(entries: Iterable[ManifestEntry]) -> bytes:
+    return b"".join(_ENTRY.pack(number, digest) for number, digest in entries)
+
+
+def unpack_manifest(blob: bytes) -> List[ManifestEntry]:
+    return list(_ENTRY.iter_unpack(blob))
+
+
+def build_reuse_map(blobs: Iterable[bytes]) -> Dict[bytes, int]:
+    """由旧清单构建 {内容摘要: 向量编号}；同一内容出现多次时沿用第一个编号"""
+    reuse: Dict[bytes, int] = {}
+    for blob in blobs:
+        for number, digest in unpack_manifest(blob):
+            reuse.setdefault(digest, number)
+    return reuse
+
+
+def vector_numbers(blobs: Iterable[bytes]) -> set:
+    return {number for blob in blobs for number, _ in unpack_manifest(blob)}
+
+
+def number_ranges(numbers: Iterable[int]) -> List[Tuple[int, int]]:
+    """把向量编号压缩成有序的左闭右开区间，例如 {0, 1, 2, 5} -> [(0, 3), (5, 6)]"""
+    ranges: List[Tuple[int, int]] = []
+    for number in sorted(set(numbers)):
+        if ranges and ranges[-1][1] == number:
+            ranges[-1] = (ranges[-1][0], number + 1)
+        else:
+            ranges.append((number, number + 1))
+    return ranges
+
+
+def manifest_id_ranges(blobs: Optional[Iterable[bytes]]) -> Optional[List[Tuple[int, int]]]:
+    """
+    文件全部分片清单中的向量编号区间，用于按 ID 删除向量。
+    blobs 为 None（早于清单的旧数据，或有分片尚未完成）时返回 None，调用方需要退回其他删除方式。
+    """
+    if blobs is None:
+        return None
+    return number_ranges(vector_numbers(blobs))
+
+
+def iter_range_numbers(ranges: Iterable[Tuple[int, int]]) -> Iterator[int]:
+    for start, end in ranges:
+        yield from range(start, end)
@@ -0,0 +1,78 @@
+# app/services/companion_cleanup.py
+
+"""
+AI 伙伴的后台清理。
+
+删除接口只把伙伴标记为已删除（deleted_at）并把 cleanup_companion_task 入队，立即返回；
+这里在 worker 中完成耗时的部分：
+    1. 按分片清单批量删除全部知识文件的向量，以及本地词法索引
+    2. SCAN + 批量 UNLINK 删除该伙伴与所有用户的对话记忆
+    3. 删除磁盘上的上传文件
+    4. 最后删除数据库记录（知识文件、分片、消息随之删除）
+
+每一步都可以安全地重复执行：任务中途失败时重新入队即可，伙伴记录会保留到全部清理完成。
+"""
+
+import asyncio
+import logging
+import shutil
+from pathlib import Path
+from typing import List
+from uuid import UUID
+
+import redis.asyncio as redis
+
+from app.crud import crud_companion, crud_knowledge_file, crud_knowledge_file_part
+from app.db.session import AsyncSessionLocal
+from app.services.chunk_manifest import manifest_id_ranges
+from app.services.embedding import companion_namespaces
+from app.services.memory_manager import MemoryManager
+from app.services.rag_service import rag_service
+
+logger = logging.getLogger(__name__)
+
+
+def _remove_upload_dirs(file_paths: List[str]) -> None:
+    """删除每个知识文件所在的目录 (uploads/{companion_id}/{file_id})，再尝试删除已空的伙伴目录"""
+    companion_dirs = set()
+    for file_path in file_paths:
+        file_dir = Path(file_path).parent
+        shutil.rmtree(file_dir, ignore_errors=True)
+        companion_dirs.add(file_dir.parent)
+    for companion_dir in companion_dirs:
+        try:
+            companion_dir.rmdir()
+        except OSError:
+            pass
+
+
+async def purge_companion(companion_id: UUID, redis_client: redis.Redis) -> bool:
+    """彻底清理一个已软删除的伙伴；伙伴不存在或未被标记删除时不做任何事，返回 False"""
+    async with AsyncSessionLocal() as db:
+        db_companion = await crud_companion.get_companion_by_id(db, companion_id, include_deleted=True)
+        if db_companion is None:
+            logger.info(f"伙伴 {companion_id} 已不存在，无需清理")
+            return False
+        if db_companion.deleted_at is None:
+            logger.warning(f"伙伴 {companion_id} 未被标记删除，跳过清理")
+            return False
+
+        files = await crud_knowledge_file.get_files_by_companion(db=db, companion_id=companion_id)
+        manifests = await crud_knowledge_file_part.get_vector_manifests(
+            db, file_ids=[db_file.id for db_file in files]
+        )
+        await rag_service.delete_vectors_by_companion_id(
+            companion_id=str(companion_id),
+            file_id_ranges={str(db_file.id): manifest_id_ranges(manifests.get(db_file.id)) for db_file in files},
+            namespaces=companion_namespaces(db_companion),
+        )
+
+        deleted_keys = await MemoryManager.delete_companion_memories(redis_client, str(companion_id))
+        await asyncio.to_thread(_remove_upload_dirs, [db_file.file_path for db_file in files])
+
+        await crud_knowledge_file.delete_files_by_companion(db, companion_id=companion_id)
+        await crud_companion.delete_companion(db=db, db_companion=db_companion)
+        logger.info(
+            f"伙伴 {companion_id} 清理完成: {len(files)} 个知识文件, {deleted_keys} 个对话记忆 key"
+        )
+        return True
@@ -0,0 +1,282 @@
+# app/services/embedding.py
+
+"""
+Embedding 模型后端。
+
+KnowledgeService 与 RAGService 都通过 get_embedding_model() 获取同一个
+进程级共享的模型实例（首次使用时才加载），由 EMBEDDING_BACKEND 选择具体实现：
+
+- "sentence_transformers"：原始的全精度 PyTorch 模型（默认）
+- "onnx"：导出为 ONNX 并做 int8 动态量化，通过 onnxruntime 在 CPU 上推理
+
+两种后端暴露同样的 encode() 接口：输入字符串返回一维向量，
+输入字符串列表返回二维 numpy 数组，向量均已 L2 归一化。
+"""
+
+import logging
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Union
+
+import numpy as np
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+ONNX_FP32_FILE = "model.onnx"
+ONNX_INT8_FILE = "model_int8.onnx"
+
+
+def _model_cache_path() -> Path:
+    model_cache_path = Path(settings.MODEL_CACHE_DIR)
+    model_cache_path.mkdir(parents=True, exist_ok=True)
+    return model_cache_path
+
+
+def onnx_model_dir(model_name: Optional[str] = None) -> Path:
+    """导出的 ONNX 模型目录，例如 models_cache/onnx/BAAI__bge-large-zh-v1.5"""
+    model_name = model_name or settings.EMBEDDING_MODEL_NAME
+    return _model_cache_path() / "onnx" / model_name.replace("/", "__")
+
+
+def embedding_model_id() -> str:
+    """模型的唯一标识：不同模型或不同推理后端产生的向量不能混用"""
+    return f"{settings.EMBEDDING_MODEL_NAME}@{settings.EMBEDDING_BACKEND}"
+
+
+def vector_namespace(model_id: Optional[str]) -> str:
+    """
+    一个模型的向量所在的 Pinecone 命名空间。
+    model_id 为 None 表示未经过模型迁移的伙伴：使用当前配置的模型和默认命名空间 ""；
+    迁移（scripts/reindex_embeddings.py）写入的向量按模型标识放在独立的命名空间中，向量 ID 不变。
+    """
+    if model_id is None:
+        return ""
+    return re.sub(r"[^0-9A-Za-z._-]+", "-", model_id)
+
+
+def companion_namespaces(companion) -> List[str]:
+    """伙伴的向量可能所在的全部命名空间：当前使用的，以及迁移中的目标模型的"""
+    namespaces = [vector_namespace(companion.embedding_model)]
+    if companion.reindex_model:
+        namespaces.append(vector_namespace(companion.reindex_model))
+    return namespaces
+
+
+def export_onnx_model(
+    model_name: Optional[str] = None, output_dir: Optional[Path] = None, quantize: bool = True
+) -> Path:
+    """
+    把 HuggingFace 模型导出为 ONNX，并（默认）做 int8 动态量化。
+    返回最终用于推理的 .onnx 文件路径。
+
+    先导出到同级的临时目录，全部完成后再逐个 os.replace 到 output_dir，最终的 .onnx 文件最后移入：
+    中途失败或并发导出都不会留下被当作已完成的半成品。
+    """
+    model_name = model_name or settings.EMBEDDING_MODEL_NAME
+    output_dir = Path(output_dir or onnx_model_dir(model_name))
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    staging_dir = Path(tempfile.mkdtemp(prefix=".export-", dir=output_dir.parent))
+    try:
+        final_file = _export_onnx_files(model_name, staging_dir, quantize)
+        for path in sorted(staging_dir.iterdir(), key=lambda p: p.name == final_file):
+            os.replace(path, output_dir / path.name)
+    finally:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+    return output_dir / final_file
+
+
+def _export_onnx_files(model_name: str, output_dir: Path, quantize: bool) -> str:
+    """把模型（以及 tokenizer）导出到 output_dir，返回最终用于推理的文件名"""
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    cache_dir = str(_model_cache_path())
+
+    logger.info(f"正在导出 {model_name} 为 ONNX ...")
+    tokenizer = AutoTokenizer.from_pretrained(model_name, cache_dir=cache_dir)
+    model = AutoModel.from_pretrained(model_name, cache_dir=cache_dir)
+    model.eval()
+
+    dummy = tokenizer(["示例文本"], return_tensors="pt")
+    input_names = ["input_ids", "attention_mask", "token_type_ids"]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+
+    fp32_path = output_dir / ONNX_FP32_FILE
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            tuple(dummy[name] for name in input_names),
+            str(fp32_path),
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=17,
+        )
+    tokenizer.save_pretrained(str(output_dir))
+
+    if not quantize:
+        return ONNX_FP32_FILE
+
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    logger.info("正在对 ONNX 模型做 int8 动态量化...")
+    quantize_dynamic(str(fp32_path), str(output_dir / ONNX_INT8_FILE), weight_type=QuantType.QInt8)
+    return ONNX_INT8_FILE
+
+
+class OnnxEmbeddingModel:
+    """
+    bge 系列模型的 onnxruntime 推理实现：
+    取 [CLS] 位置的隐状态并做 L2 归一化，与 sentence-transformers 的输出保持一致。
+    """
+
+    def __init__(self, model_dir: Path, model_file: str = ONNX_INT8_FILE, num_threads: int = 0):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        self.model_dir = Path(model_dir)
+        self.tokenizer = AutoTokenizer.from_pretrained(str(self.model_dir))
+        self.max_seq_length = settings.EMBEDDING_MAX_SEQ_LENGTH
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        # 单个请求内并行（矩阵运算），请求之间不再并行，避免线程超额订阅
+        options.intra_op_num_threads = num_threads or (os.cpu_count() or 1)
+        options.inter_op_num_threads = 1
+
+        self.session = ort.InferenceSession(
+            str(self.model_dir / model_file),
+            sess_options=options,
+            providers=["CPUExecutionProvider"],
+        )
+        self._input_names = {i.name for i in self.session.get_inputs()}
+
+    def encode(self, sentences: Union[str, List[str]], batch_size: int = 32, **kwargs) -> np.ndarray:
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+
+        outputs = []
+        for start in range(0, len(texts), batch_size):
+            encoded = self.tokenizer(
+                texts[start : start + batch_size],
+                padding=True,
+                truncation=True,
+                max_length=self.max_seq_length,
+                return_tensors="np",
+            )
+            feeds = {name: value.astype(np.int64) for name, value in encoded.items() if name in self._input_names}
+            last_hidden_state = self.session.run(["last_hidden_state"], feeds)[0]
+            cls = last_hidden_state[:, 0]
+            outputs.append(cls / np.linalg.norm(cls, axis=1, keepdims=True))
+
+        embeddings = np.concatenate(outputs) if outputs else np.zeros((0, 0), dtype=np.float32)
+        return embeddings[0] if single else embeddings
+
+
+def token_lengths(model, texts: List[str]) -> List[int]:
+    """用模型自己的 tokenizer 统计每段文本截断后的 token 数（含特殊 token）"""
+    tokenizer = getattr(model, "tokenizer", None)
+    max_length = getattr(model, "max_seq_length", None) or settings.EMBEDDING_MAX_SEQ_LENGTH
+    if tokenizer is None:
+        # 没有 tokenizer 的后端退化为按字符数估计，排序效果基本一致
+        return [min(len(text), max_length) for text in texts]
+    encoded = tokenizer(texts, add_special_tokens=True, truncation=True, max_length=max_length)
+    return [len(ids) for ids in encoded["input_ids"]]
+
+
+def encode_by_token_budget(model, texts: List[str], token_budget: int) -> np.ndarray:
+    """
+    按长度分桶的自适应批量编码。
+
+    一个批次的计算量 ≈ 批大小 × 批内最长序列（其余样本都会被 padding 到这个长度），
+    所以先按 token 数排序，让长度相近的文本落在同一批，再按 token 预算
+    （批大小 × 批内最长长度 ≤ token_budget）切分批次：短文本的批次更大，
+    长文本的批次更小。最后把结果还原成输入顺序。
+    """
+    if not texts:
+        return np.zeros((0, 0), dtype=np.float32)
+
+    lengths = token_lengths(model, texts)
+    order = sorted(range(len(texts)), key=lengths.__getitem__)
+
+    batches: List[List[int]] = []
+    current: List[int] = []
+    for idx in order:
+        # 升序遍历，因此加入 idx 之后批内最长长度就是 lengths[idx]
+        if current and (len(current) + 1) * lengths[idx] > token_budget:
+            batches.append(current)
+            current = []
+        current.append(idx)
+    if current:
+        batches.append(current)
+
+    result = None
+    for batch in batches:
+        embeddings = np.asarray(model.encode([texts[i] for i in batch], batch_size=len(batch)))
+        if result is None:
+            result = np.empty((len(texts), embeddings.shape[1]), dtype=embeddings.dtype)
+        result[batch] = embeddings
+    return result
+
+
+def create_embedding_model(model_name: Optional[str] = None, backend: Optional[str] = None):
+    """根据 EMBEDDING_BACKEND 创建 embedding 模型实例（开销很大，应当复用）"""
+    backend = backend or settings.EMBEDDING_BACKEND
+    model_name = model_name or settings.EMBEDDING_MODEL_NAME
+
+    if backend == "sentence_transformers":
+        from sentence_transformers import SentenceTransformer
+
+        logger.info(f"Loading embedding model {model_name} (sentence-transformers)...")
+        # 使用 cache_folder 将模型缓存到项目目录下，避免每次 Docker 重启都重新下载。
+        return SentenceTransformer(model_name, cache_folder=str(_model_cache_path()))
+
+    if backend == "onnx":
+        model_dir = onnx_model_dir(model_name)
+        # 导出需要 torch、耗时数分钟且要写大文件，不在服务进程里现场做（还会在加载锁内阻塞所有检索）
+        if not (model_dir / ONNX_INT8_FILE).exists():
+            raise RuntimeError(
+                f"未找到量化后的 ONNX 模型 {model_dir / ONNX_INT8_FILE}，"
+                f"请先执行 python scripts/embedding_benchmark.py export --model {model_name}"
+            )
+        logger.info(f"Loading embedding model {model_name} (onnxruntime int8)...")
+        return OnnxEmbeddingModel(model_dir, num_threads=settings.EMBEDDING_ONNX_THREADS)
+
+    raise ValueError(f"Unsupported EMBEDDING_BACKEND: {backend}")
+
+
+# --- 进程级共享实例 ---
+# 模型权重 ~1.3GB，每个模型在整个进程中只保留一份；导入本模块不会触发加载。
+# 平时只有当前配置的模型；模型迁移期间，尚未切换的伙伴仍使用旧模型检索，两个模型会同时驻留。
+_embedding_models: Dict[str, Any] = {}
+_embedding_model_lock = threading.Lock()
+
+
+def get_embedding_model(model_id: Optional[str] = None):
+    """返回进程内共享的 embedding 模型（默认为当前配置的模型），首次调用时加载（线程安全）"""
+    model_id = model_id or embedding_model_id()
+    model = _embedding_models.get(model_id)
+    if model is None:
+        with _embedding_model_lock:
+            model = _embedding_models.get(model_id)
+            if model is None:
+                model_name, backend = model_id.rsplit("@", 1)
+                model = _embedding_models[model_id] = create_embedding_model(model_name, backend)
+    return model
+
+
+def warm_up_embedding_model() -> None:
+    """加载模型并做一次编码，让首个真实请求不必承担加载和初始化开销"""
+    start = time.perf_counter()
+    get_embedding_model().encode("预热")
+    logger.info(f"Embedding model warmed up in {time.perf_counter() - start:.1f}s.")
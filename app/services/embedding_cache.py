@@ -0,0 +1,76 @@
+# app/services/embedding_cache.py
+
+"""
+内容寻址的向量缓存：键为 (模型标识, sha256(文本))，值为 float16 向量。
+
+同一份 PDF 被重复上传、或同一本手册被上传给多个伙伴时，
+相同的文本块只在第一次向量化，之后直接从 Postgres 读取。
+"""
+
+import asyncio
+import hashlib
+import logging
+from typing import List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.crud import crud_chunk_embedding
+from app.services.embedding import embedding_model_id, encode_by_token_budget, get_embedding_model
+
+logger = logging.getLogger(__name__)
+
+metrics.register_ratio(
+    "embedding_cache_hit_rate", "embedding_cache_hits", ["embedding_cache_hits", "embedding_cache_misses"]
+)
+
+
+def content_hash(text: str) -> bytes:
+    return hashlib.sha256(text.encode("utf-8")).digest()
+
+
+async def embed_texts(
+    db: AsyncSession, texts: List[str], model_id: Optional[str] = None
+) -> Tuple[List[List[float]], int]:
+    """
+    返回 (与 texts 顺序一致的向量列表, 缓存命中的文本块数)。
+    只有缓存未命中的文本才会送入模型，且同一批内重复的文本只编码一次。
+    model_id 为空时使用当前配置的模型。
+    """
+    model_id = model_id or embedding_model_id()
+    model = get_embedding_model(model_id)
+
+    if not settings.EMBEDDING_CACHE_ENABLED:
+        embeddings = await asyncio.to_thread(
+            encode_by_token_budget, model, texts, settings.EMBEDDING_BATCH_TOKEN_BUDGET
+        )
+        return embeddings.tolist(), 0
+
+    hashes = [content_hash(text) for text in texts]
+    cached = await crud_chunk_embedding.get_embeddings(db, model_id=model_id, content_hashes=list(set(hashes)))
+
+    vectors = {h: np.frombuffer(blob, dtype=np.float16).astype(np.float32) for h, blob in cached.items()}
+    misses = {}
+    for h, text in zip(hashes, texts):
+        if h not in vectors:
+            misses.setdefault(h, text)
+
+    if misses:
+        miss_hashes = list(misses)
+        encoded = await asyncio.to_thread(
+            encode_by_token_budget, model, list(misses.values()), settings.EMBEDDING_BATCH_TOKEN_BUDGET
+        )
+        new_entries = {}
+        for h, vector in zip(miss_hashes, encoded):
+            vectors[h] = vector
+            new_entries[h] = np.asarray(vector, dtype=np.float16).tobytes()
+        await crud_chunk_embedding.save_embeddings(
+            db, model_id=model_id, dimension=encoded.shape[1], embeddings=new_entries
+        )
+
+    hits = len(texts) - len(misses)
+    metrics.incr("embedding_cache_hits", hits)
+    metrics.incr("embedding_cache_misses", len(misses))
+    return [vectors[h].tolist() for h in hashes], hits
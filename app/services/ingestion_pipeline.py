@@ -0,0 +1,199 @@
+# app/services/ingestion_pipeline.py
+
+"""
+知识文件入库的流式流水线组件：
+
+    解析页面 / 切分 (线程) --有界队列--> 向量化 --有界队列--> 上传 (max_inflight 并发)
+
+- BackgroundIterator：在线程中运行同步的 “逐页解析 + 切分” 生成器，
+  通过有界队列交给事件循环；队列满时解析线程等待，内存占用与文件大小无关
+- run_bounded_pipeline：生产者（向量化，CPU 密集）把结果放入容量为 max_inflight
+  的队列，max_inflight 个消费者（上传，网络 IO）并发处理。队列满时生产者被挂起，
+  形成对向量化阶段的反压；整体耗时趋近于 max(向量化, 上传) 而不是两者之和
+- ContiguousWatermark：上传批次可能乱序完成，只有连续完成的前缀才能作为断点
+- retry_with_backoff：对上传等网络调用的瞬时错误做指数退避重试
+"""
+
+import asyncio
+import concurrent.futures
+import logging
+import random
+import threading
+from typing import AsyncIterator, Awaitable, Callable, Dict, Iterator, List, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+_DONE = object()
+_ERROR = object()
+
+
+class BackgroundIterator:
+    """
+    在后台线程中消费一个同步迭代器，并以异步方式按批次取出结果（带反压）。
+
+    用法:
+        async with BackgroundIterator(lambda: iter_chunks(path), maxsize=500) as chunks:
+            async for batch in chunks.iter_batches(max_size=500, min_size=100):
+                ...
+    """
+
+    def __init__(self, make_iterator: Callable[[], Iterator[T]], maxsize: int):
+        self._make_iterator = make_iterator
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max(1, maxsize))
+        self._stop = threading.Event()
+        self._finished = False
+        self._worker = None
+
+    async def __aenter__(self) -> "BackgroundIterator":
+        loop = asyncio.get_running_loop()
+        self._worker = loop.run_in_executor(None, self._run, loop)
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    def _put(self, loop: asyncio.AbstractEventLoop, item) -> bool:
+        future = asyncio.run_coroutine_threadsafe(self._queue.put(item), loop)
+        while True:
+            try:
+                future.result(timeout=0.5)
+                return True
+            except concurrent.futures.TimeoutError:
+                # 队列已满：继续等待，除非消费端已经放弃
+                if self._stop.is_set():
+                    future.cancel()
+                    return False
+
+    def _run(self, loop: asyncio.AbstractEventLoop) -> None:
+        try:
+            for item in self._make_iterator():
+                if self._stop.is_set() or not self._put(loop, item):
+                    return
+            self._put(loop, _DONE)
+        except BaseException as e:
+            self._put(loop, (_ERROR, e))
+
+    def _unwrap(self, item):
+        if item is _DONE:
+            self._finished = True
+            return _DONE
+        if isinstance(item, tuple) and len(item) == 2 and item[0] is _ERROR:
+            self._finished = True
+            raise item[1]
+        return item
+
+    async def iter_batches(self, max_size: int, min_size: int = 1) -> AsyncIterator[List[T]]:
+        """
+        按批次产出结果：已就绪的元素尽量凑满 max_size（便于按长度排序组批），
+        但上游较慢时只要凑够 min_size 就立即交出，让第一批向量尽早上传。
+        """
+        batch: List[T] = []
+        while not self._finished:
+            if not batch or len(batch) < min_size or not self._queue.empty():
+                item = self._unwrap(await self._queue.get())
+            else:
+                yield batch
+                batch = []
+                continue
+            if item is _DONE:
+                break
+            batch.append(item)
+            if len(batch) >= max_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    async def close(self) -> None:
+        """通知解析线程停止，并等待它退出（不会抛出线程内的异常）"""
+        self._stop.set()
+        if self._worker is not None:
+            await asyncio.gather(self._worker, return_exceptions=True)
+
+
+async def run_bounded_pipeline(
+    produce: AsyncIterator[T],
+    consume: Callable[[T], Awaitable[None]],
+    max_inflight: int,
+) -> None:
+    """
+    驱动 produce 产出的每个元素交给 consume 处理，最多 max_inflight 个并发。
+    任意一端抛出异常都会取消其余任务，并把异常原样抛给调用方。
+    """
+    max_inflight = max(1, max_inflight)
+    queue: asyncio.Queue = asyncio.Queue(maxsize=max_inflight)
+
+    async def producer():
+        async for item in produce:
+            await queue.put(item)  # 队列已满时在这里等待 —— 反压
+        for _ in range(max_inflight):
+            await queue.put(_DONE)
+
+    async def consumer():
+        while True:
+            item = await queue.get()
+            if item is _DONE:
+                return
+            await consume(item)
+
+    tasks = [asyncio.create_task(producer())]
+    tasks += [asyncio.create_task(consumer()) for _ in range(max_inflight)]
+    try:
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+        for task in done:
+            if task.exception() is not None:
+                raise task.exception()
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        # 关闭生产者，让它内部的 async with / finally（例如解析线程）得以清理
+        aclose = getattr(produce, "aclose", None)
+        if aclose is not None:
+            await aclose()
+
+
+class ContiguousWatermark:
+    """
+    记录已完成的区间 [start, end)，返回从 start 开始连续完成的最远位置。
+    例如 [0, 100) 与 [200, 300) 完成时水位仍是 100，[100, 200) 完成后跳到 300。
+    """
+
+    def __init__(self, start: int = 0):
+        self.value = start
+        self._pending: Dict[int, int] = {}
+
+    def mark_done(self, start: int, end: int) -> int:
+        self._pending[start] = end
+        while self.value in self._pending:
+            self.value = self._pending.pop(self.value)
+        return self.value
+
+
+async def retry_with_backoff(
+    func: Callable[[], Awaitable[T]],
+    *,
+    is_retryable: Callable[[BaseException], bool],
+    max_attempts: int,
+    base_delay: float,
+    max_delay: float = 30.0,
+    description: str = "operation",
+) -> T:
+    """
+    执行 func()；遇到 is_retryable 判定为瞬时的错误时按指数退避（带随机抖动）重试，
+    超过 max_attempts 次或遇到非瞬时错误时原样抛出。
+    """
+    attempt = 1
+    while True:
+        try:
+            return await func()
+        except Exception as e:
+            if attempt >= max_attempts or not is_retryable(e):
+                raise
+            delay = min(max_delay, base_delay * 2 ** (attempt - 1)) * random.uniform(0.5, 1.0)
+            logger.warning(f"{description} 第 {attempt} 次失败 ({type(e).__name__}: {e})，{delay:.1f}s 后重试")
+            await asyncio.sleep(delay)
+            attempt += 1
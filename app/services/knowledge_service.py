@@ -1,34 +1,79 @@
 # app/services/knowledge_service.py
 
+import asyncio
+import itertools
 import logging
+import math
 import os
+from dataclasses import dataclass, field
 from uuid import UUID
 from pathlib import Path
-from typing import List
+from typing import Awaitable, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
 
 # --- 数据库 & CRUD ---
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.db.session import AsyncSessionLocal
-from app.crud import crud_knowledge_file
+from app.crud import crud_companion, crud_knowledge_file, crud_knowledge_file_part
 from app.models.knowledge_file import KnowledgeFile
 
 # --- 文档处理 (LangChain) ---
 from langchain_community.document_loaders import (
     TextLoader,
-    PyPDFLoader,
     UnstructuredMarkdownLoader,
 )
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.schema import Document
 
-# --- 向量化 & 向量数据库 ---
-from sentence_transformers import SentenceTransformer
-from pinecone import Pinecone
-
 from app.core.config import settings
+from app.services.embedding import companion_namespaces, get_embedding_model, vector_namespace
+from app.services.embedding_cache import embed_texts
+from app.services.vector_store import get_pinecone_index, is_transient_pinecone_error
+from app.services.lexical_index import LexicalSegmentBuilder, lexical_index_store
+from app.services.ingestion_pipeline import (
+    BackgroundIterator,
+    ContiguousWatermark,
+    retry_with_backoff,
+    run_bounded_pipeline,
+)
+from app.services.knowledge_upload import SUPPORTED_EXTENSIONS
+from app.services.chunk_manifest import (
+    ManifestEntry,
+    build_reuse_map,
+    chunk_digest,
+    manifest_id_ranges,
+    pack_manifest,
+    vector_numbers,
+)
+from app.services.vector_deletion import delete_file_vectors, delete_ids
+from app.services.pdf_parser import count_pdf_pages, get_pdf_process_pool, iter_pdf_pages, pdf_parse_processes
 
 # 配置日志
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
+# 每个分片内文本块的编号上限：分片 n 的向量 ID 为 f"{file_id}_{n * PART_ID_STRIDE + i}"，
+# 分片 0 与拆分前的 ID 完全一致。超过这个数量的分片会被标记为失败（见 _embed_and_upsert_chunks）
+PART_ID_STRIDE = 100_000
+
+# 文本切分参数：每个块的最大字符数、相邻块之间的重叠字符数
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+
+
+@dataclass
+class _IndexTarget:
+    """一个正在入库的分片：文本块流中的每个文本块都标记了它属于哪个分片"""
+    file_id: UUID
+    companion_id: UUID
+    file_name: str
+    part_no: int
+    lexical_builder: LexicalSegmentBuilder
+    # 替换文件时可沿用的旧向量 {内容摘要: 向量编号}
+    reuse_ids: Dict[bytes, int] = field(default_factory=dict)
+    # 按文档顺序累积的文本块清单
+    manifest: List[ManifestEntry] = field(default_factory=list)
+    # 伙伴使用的 embedding 模型（None 为当前配置的模型），决定向量化模型与 Pinecone 命名空间
+    model_id: Optional[str] = None
+
 
 class KnowledgeService:
     """
@@ -36,158 +81,653 @@ class KnowledgeService:
     """
 
     def __init__(self):
-        # 1. 初始化嵌入模型 (Embedding Model)
-        # 在服务实例化时加载模型，避免每次任务都重新加载，提高效率。
+        # 嵌入模型与 Pinecone 索引都是进程级共享、按需加载的：
+        # 实例化 KnowledgeService 本身几乎没有开销，只做删除的任务也不会加载模型。
+        self.pinecone_index_name = settings.PINECONE_INDEX_NAME
+
+    @property
+    def embedding_model(self):
         # 'bge-large-zh-v1.5' 是一个优秀的中英双语嵌入模型。
-        # 使用 cache_folder 将模型缓存到项目目录下，避免每次 Docker 重启都重新下载。
-        model_cache_path = Path("./models_cache")
-        model_cache_path.mkdir(exist_ok=True)
-        self.embedding_model = SentenceTransformer(
-            'BAAI/bge-large-zh-v1.5', 
-            cache_folder=str(model_cache_path)
-        )
-        
-        # 2. 初始化 Pinecone 客户端
-        self.pinecone = Pinecone(api_key=settings.PINECONE_API_KEY)
-        self.pinecone_index_name = "ai-companion-index" # 暂时硬编码，未来可以根据 companion 配置
-        
-        if self.pinecone_index_name not in self.pinecone.list_indexes().names():
-            # 如果索引不存在，这里可以根据需要自动创建，但需要指定维度
-            # 目前的策略是要求索引必须预先存在
-            raise ValueError(f"Pinecone index '{self.pinecone_index_name}' does not exist.")
-        self.pinecone_index = self.pinecone.Index(self.pinecone_index_name)
-
-    async def process_and_index_file(self, file_id: UUID):
-        """
-        核心方法：处理单个文件并将其向量化存入 Pinecone。
-        这是 ARQ worker 将要调用的主要任务。
+        # 具体使用哪种推理后端由 EMBEDDING_BACKEND 决定。
+        return get_embedding_model()
+
+    @property
+    def pinecone_index(self):
+        return get_pinecone_index()
+
+    async def plan_file_parts(self, file_id: UUID, replace: bool = False) -> List[int]:
+        """
+        协调阶段：把文件按页码区间拆成若干分片并写入数据库，返回分片编号。
+        每个分片由一个独立的 ARQ 子任务处理，可以分散到多个 worker 上并行执行，
+        单个子任务的耗时也不再随文件大小增长。
+
+        replace=True 表示文件内容已被替换：旧分片保留为 SUPERSEDED，新分片的编号接在其后，
+        处理新分片时内容未变的文本块沿用旧向量，全部完成后只删除消失的旧向量。
         """
-        # 为每个任务创建一个独立的数据库会话，这是后台任务的最佳实践
         async with AsyncSessionLocal() as db:
             try:
-                # 1. 获取文件记录并更新状态为 PROCESSING
-                db_file = await crud_knowledge_file.update_status(
-                    db, file_id=file_id, status="PROCESSING"
+                # 1. 认领文件：只有 UPLOADED 的文件才会被改为 PROCESSING 并拆分。
+                #    同一个文件可能被多个任务同时处理（例如批量任务排队太久，对账任务又把它单独入队），
+                #    只有认领成功的任务继续，其余的直接跳过，不会删除 / 替换别人正在写入的分片
+                claimed = await crud_knowledge_file.transition_status(
+                    db, file_id=file_id, from_status="UPLOADED", to_status="PROCESSING"
                 )
+                db_file = await crud_knowledge_file.get_file_by_id(db, file_id=file_id)
                 if not db_file:
                     logging.error(f"File with id {file_id} not found in database.")
-                    return
+                    return []
+                if not claimed:
+                    logging.info(f"文件 {file_id} 当前状态为 {db_file.status}，已由其他任务处理，跳过拆分")
+                    return []
+                file_path, companion_id = db_file.file_path, db_file.companion_id
 
-                logging.info(f"开始处理文件: {db_file.file_path}")
+                # 2. 计算分片（读取 PDF 页数是同步 IO，放到线程中执行）
+                ranges = await asyncio.to_thread(self._plan_page_ranges, file_path)
 
-                # 2. 加载文档内容
-                documents = self._load_documents(db_file.file_path)
-                if not documents:
-                    raise ValueError("Failed to load any content from the document.")
-
-                # 3. 分割文档成文本块 (Chunks)
-                text_splitter = RecursiveCharacterTextSplitter(
-                    chunk_size=1000,   # 每个块的最大字符数
-                    chunk_overlap=200, # 相邻块之间的重叠字符数
+                existing = await crud_knowledge_file_part.get_parts(db, file_id=file_id) if replace else []
+                # 只有旧分片全部成功且都有清单时才能增量；否则（早于清单的旧数据、上次处理未完成等）
+                # 先删除该文件的全部旧向量，再完整重建
+                incremental = bool(existing) and all(
+                    part.status == "INDEXED" and part.chunk_manifest is not None for part in existing
                 )
-                chunks = text_splitter.split_documents(documents)
-                logging.info(f"文件被分割成 {len(chunks)} 个文本块 (chunks)")
-                if not chunks:
-                    raise ValueError("Document is empty or could not be split into chunks.")
-
-                # 4. 向量化文本块并分批上传到 Pinecone
-                await self._embed_and_upsert_chunks(
-                    chunks=chunks,
-                    companion_id=db_file.companion_id,
-                    file_id=db_file.id,
-                    file_name=db_file.file_name,
+                # 替换时新分片编号始终递增，新向量 ID 不会与仍在使用的旧向量冲突
+                first_part_no = max((part.part_no for part in existing), default=-1) + 1
+                companion = await crud_companion.get_companion_by_id(db, companion_id, include_deleted=True)
+                if replace and not incremental:
+                    manifests = await crud_knowledge_file_part.get_vector_manifests(db, file_ids=[file_id])
+                    await self.delete_vectors_by_file_id(
+                        str(file_id),
+                        manifest_id_ranges(manifests.get(file_id)),
+                        namespaces=companion_namespaces(companion),
+                        raise_on_error=True,
+                    )
+                if db_file.reindexed_model:
+                    # 内容即将变化：迁移目标命名空间中的副本作废，由迁移任务重新复制
+                    await crud_knowledge_file.set_reindexed_model(db, file_id=file_id, model_id=None)
+
+                parts = await crud_knowledge_file_part.create_parts(
+                    db, file_id=file_id, ranges=ranges, first_part_no=first_part_no, supersede_existing=incremental
                 )
-                
-                # 5. 全部成功后，更新数据库状态为 INDEXED
+
+                if not incremental:
+                    # 重新处理时，先清掉上一次留下的词法索引段（分片数可能已经变化）
+                    lexical_index_store.delete_segment(str(file_id), str(companion_id))
+                mode = "增量替换" if incremental else ("完整替换" if replace else "新建")
+                logging.info(f"文件 {file_path} 被拆分为 {len(parts)} 个分片 ({mode})")
+                return [part.part_no for part in parts]
+
+            except Exception as e:
+                logging.error(f"拆分文件 {file_id} 时发生严重错误: {e}", exc_info=True)
+                await db.rollback()
                 await crud_knowledge_file.update_status(
-                    db, file_id=file_id, status="INDEXED"
+                    db,
+                    file_id=file_id,
+                    status="FAILED",
+                    error_message=f"{type(e).__name__}: {e}",
                 )
-                logging.info(f"文件 {db_file.file_name} (id: {file_id}) 处理并索引成功!")
+                return []
+
+    async def process_file_part(self, file_id: UUID, part_no: int):
+        """
+        核心方法：处理文件的一个分片并将其向量化存入 Pinecone。
+        这是 ARQ worker 子任务调用的主要方法；最后一个完成的分片负责汇总文件状态。
+        """
+        target: Optional[_IndexTarget] = None
+        db_part = None
+        # 为每个任务创建一个独立的数据库会话，这是后台任务的最佳实践
+        async with AsyncSessionLocal() as db:
+            try:
+                # 1. 获取文件记录并认领分片（改为 PROCESSING）；分片正被其他任务处理或已经结束时跳过
+                db_file = await crud_knowledge_file.get_file_by_id(db, file_id=file_id)
+                if not db_file:
+                    logging.error(f"File {file_id} not found in database.")
+                    return
+                db_part = await crud_knowledge_file_part.claim_part(
+                    db, file_id=file_id, part_no=part_no, abandoned_after_seconds=settings.ARQ_INGEST_JOB_TIMEOUT
+                )
+                if not db_part:
+                    logging.info(f"File {file_id} part {part_no} is missing or owned by another job, skipping.")
+                    return
+
+                # 先取出需要的标量：后续的 commit（如写入向量缓存）会让 ORM 实例过期
+                file_path, file_name, companion_id = db_file.file_path, db_file.file_name, db_file.companion_id
+                start_page, end_page = db_part.start_page, db_part.end_page
+                companion = await crud_companion.get_companion_by_id(db, companion_id, include_deleted=True)
+                if companion is None:
+                    raise ValueError(f"Companion {companion_id} of file {file_id} not found")
+                model_id = companion.embedding_model
+                # 上一次执行（超时 / OOM / 重新部署）已经上传的文本块不再重复向量化和上传
+                resume_from = db_part.committed_chunks
+                logging.info(f"开始处理文件: {file_path} (分片 {part_no}, 页 {start_page}-{end_page})")
+                if resume_from:
+                    logging.info(f"分片 {part_no} 从断点继续：跳过前 {resume_from} 个已上传的文本块")
+                # 替换文件时：旧分片中内容相同的文本块直接沿用其向量
+                reuse_ids = build_reuse_map(
+                    await crud_knowledge_file_part.get_part_manifests(db, file_id=file_id, superseded=True)
+                )
+
+                # 2. 以流的方式逐页加载、切分文档 (在后台线程中进行)，
+                #    通过有界队列边解析边向量化、上传；内存占用与文件大小无关
+                text_splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+                # 同时构建该分片的 BM25 词法索引段（与向量使用相同的 ID，便于融合）
+                target = _IndexTarget(
+                    file_id=file_id,
+                    companion_id=companion_id,
+                    file_name=file_name,
+                    part_no=part_no,
+                    lexical_builder=LexicalSegmentBuilder(file_id=str(file_id), file_name=file_name, part_no=part_no),
+                    reuse_ids=reuse_ids,
+                    model_id=model_id,
+                )
+
+                # 断点写入使用独立的会话：它在上传任务中执行，与向量化阶段使用的 db 并发
+                async with AsyncSessionLocal() as checkpoint_db, BackgroundIterator(
+                    lambda: (
+                        (target, chunk)
+                        for chunk in self._iter_chunks(file_path, text_splitter, start_page, end_page)
+                    ),
+                    maxsize=settings.INGEST_CHUNK_QUEUE_SIZE,
+                ) as chunk_stream:
+
+                    async def save_checkpoint(committed_chunks: int):
+                        await crud_knowledge_file_part.update_part_checkpoint(
+                            checkpoint_db, file_id=file_id, part_no=part_no, committed_chunks=committed_chunks
+                        )
+
+                    # 3. 向量化文本块并分批上传到 Pinecone
+                    await self._embed_and_upsert_chunks(
+                        db=db,
+                        chunk_stream=chunk_stream,
+                        resume_from=resume_from,
+                        on_checkpoint=save_checkpoint,
+                        model_id=model_id,
+                    )
+                logging.info(f"分片 {part_no} 被分割成 {len(target.manifest)} 个文本块 (chunks)")
+
+                # 4. 持久化词法索引段并标记分片成功
+                await self._complete_target(db, target)
+
+            except asyncio.CancelledError:
+                # 任务被取消（ARQ 超时或 worker 退出）：另开会话记录失败（保留断点）并汇总，
+                # 以便之后从断点重试；shield 保证这一步不会再次被取消打断
+                logging.error(f"处理文件 {file_id} 的分片 {part_no} 时任务被取消")
+                if db_part is not None:
+                    await asyncio.shield(self._mark_part_cancelled(file_id, part_no, target))
+                raise
 
             except Exception as e:
-                logging.error(f"处理文件 {file_id} 时发生严重错误: {e}", exc_info=True)
-                # 如果发生任何错误，更新状态为 FAILED 并记录详细错误信息
-                await crud_knowledge_file.update_status(
+                logging.error(f"处理文件 {file_id} 的分片 {part_no} 时发生严重错误: {e}", exc_info=True)
+                # 先回滚，避免会话停留在失败的事务中导致下面的状态更新也失败
+                await db.rollback()
+                await crud_knowledge_file_part.update_part_status(
                     db,
                     file_id=file_id,
+                    part_no=part_no,
                     status="FAILED",
                     error_message=f"{type(e).__name__}: {e}",
+                    chunk_manifest=pack_manifest(target.manifest) if target else None,
                 )
 
-    async def delete_vectors_by_file_id(self, file_id: str):
+            await self._finalize_file_if_done(db, file_id)
+
+    async def process_file_batch(self, file_ids: List[UUID]) -> List[Tuple[UUID, int]]:
         """
-        根据 file_id 从 Pinecone 索引中删除所有相关的向量。
-        这是一个后台任务，确保数据一致性。
+        批量入库（批量 / 压缩包上传）：所有只有一个分片的小文件共用一条流水线，
+        文本块跨文件合并成批次向量化和上传，避免每个文件各自启动任务、各自组一个很小的批次。
+        需要拆成多个分片的大文件照常扇出，返回它们的 (file_id, part_no) 供调用方入队子任务。
+        """
+        fan_out: List[Tuple[UUID, int]] = []
+        single_part_files: List[UUID] = []
+        for file_id in file_ids:
+            part_nos = await self.plan_file_parts(file_id)
+            if len(part_nos) == 1:
+                single_part_files.append(file_id)
+            else:
+                fan_out += [(file_id, part_no) for part_no in part_nos]
+
+        if single_part_files:
+            await self._process_single_part_files(single_part_files)
+        return fan_out
+
+    async def _process_single_part_files(self, file_ids: List[UUID]):
+        async with AsyncSessionLocal() as db:
+            sources: List[Tuple[_IndexTarget, str]] = []
+            for file_id in file_ids:
+                db_file = await crud_knowledge_file.get_file_by_id(db, file_id=file_id)
+                if not db_file:
+                    logging.error(f"File {file_id} not found in database.")
+                    continue
+                # 认领分片；对账任务可能已经把排队太久的分片单独入队并开始处理
+                db_part = await crud_knowledge_file_part.claim_part(
+                    db, file_id=file_id, part_no=0, abandoned_after_seconds=settings.ARQ_INGEST_JOB_TIMEOUT
+                )
+                if not db_part:
+                    logging.info(f"File {file_id} part 0 is missing or owned by another job, skipping.")
+                    continue
+                companion = await crud_companion.get_companion_by_id(db, db_file.companion_id, include_deleted=True)
+                if companion is None:
+                    # 伙伴已被（硬）删除：分片直接标记为失败，而不是停留在 PROCESSING 等待对账
+                    logging.error(f"File {file_id} belongs to companion {db_file.companion_id}, which no longer exists.")
+                    await crud_knowledge_file_part.update_part_status(
+                        db,
+                        file_id=file_id,
+                        part_no=0,
+                        status="FAILED",
+                        error_message=f"ValueError: Companion {db_file.companion_id} not found",
+                    )
+                    await self._finalize_file_if_done(db, file_id)
+                    continue
+                target = _IndexTarget(
+                    file_id=file_id,
+                    companion_id=db_file.companion_id,
+                    file_name=db_file.file_name,
+                    part_no=0,
+                    lexical_builder=LexicalSegmentBuilder(file_id=str(file_id), file_name=db_file.file_name),
+                    model_id=companion.embedding_model,
+                )
+                sources.append((target, db_file.file_path))
+
+            # 一条流水线只使用一个模型 / 命名空间；批量上传的文件同属一个伙伴，通常只有一组
+            for model_id in dict.fromkeys(target.model_id for target, _ in sources):
+                await self._process_shared_stream(
+                    db, [source for source in sources if source[0].model_id == model_id], model_id
+                )
+
+    async def _process_shared_stream(
+        self, db: AsyncSession, sources: List[Tuple[_IndexTarget, str]], model_id: Optional[str]
+    ):
+        logging.info(f"批量处理 {len(sources)} 个文件，共用一条向量化流水线")
+        text_splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+        # 单个文件解析失败不影响其他文件：错误按 file_id 记录，流继续处理下一个文件
+        failures: Dict[UUID, BaseException] = {}
+        try:
+            async with BackgroundIterator(
+                lambda: self._iter_target_chunks(sources, text_splitter, failures),
+                maxsize=settings.INGEST_CHUNK_QUEUE_SIZE,
+            ) as chunk_stream:
+                chunk_count = await self._embed_and_upsert_chunks(
+                    db=db, chunk_stream=chunk_stream, model_id=model_id
+                )
+            logging.info(f"批量处理共生成 {chunk_count} 个文本块 (chunks)")
+        except Exception as e:
+            # 向量化 / 上传失败时整批都无法确认完成，全部标记为失败（可以逐个从断点重试）
+            logging.error(f"批量处理文件时发生严重错误: {e}", exc_info=True)
+            await db.rollback()
+            for target, _ in sources:
+                failures.setdefault(target.file_id, e)
+
+        for target, _ in sources:
+            error = failures.get(target.file_id)
+            if error is None:
+                await self._complete_target(db, target)
+            else:
+                # 失败前可能已有部分文本块上传：把已编号的文本块记入清单，删除文件时才能按 ID 找到这些向量
+                # （清单中尚未上传的 ID 删除时会被忽略）。共享流不记录断点，重试时相同编号的向量会被覆盖
+                await crud_knowledge_file_part.update_part_status(
+                    db,
+                    file_id=target.file_id,
+                    part_no=target.part_no,
+                    status="FAILED",
+                    error_message=f"{type(error).__name__}: {error}",
+                    chunk_manifest=pack_manifest(target.manifest),
+                )
+            await self._finalize_file_if_done(db, target.file_id)
+
+    def _iter_target_chunks(
+        self,
+        sources: List[Tuple[_IndexTarget, str]],
+        text_splitter: RecursiveCharacterTextSplitter,
+        failures: Dict[UUID, BaseException],
+    ) -> Iterator[Tuple[_IndexTarget, Document]]:
+        """依次切分多个文件，产出 (分片, 文本块)；解析失败的文件记入 failures 后跳过"""
+        for target, file_path in sources:
+            try:
+                for chunk in self._iter_chunks(file_path, text_splitter):
+                    yield target, chunk
+            except Exception as e:
+                logging.error(f"解析文件 {file_path} 失败: {e}", exc_info=True)
+                failures[target.file_id] = e
+
+    async def _complete_target(self, db: AsyncSession, target: _IndexTarget):
+        """分片的所有文本块都已上传：写入词法索引段，并把分片标记为 INDEXED（附带文本块清单）"""
+        chunk_count = len(target.manifest)
+        # 空白页组成的分片没有文本块，不需要段
+        if chunk_count:
+            lexical_index_store.write_segment(str(target.companion_id), target.lexical_builder)
+        await crud_knowledge_file_part.update_part_status(
+            db,
+            file_id=target.file_id,
+            part_no=target.part_no,
+            status="INDEXED",
+            chunk_count=chunk_count,
+            chunk_manifest=pack_manifest(target.manifest),
+        )
+
+    async def _mark_part_cancelled(self, file_id: UUID, part_no: int, target: Optional[_IndexTarget] = None):
+        async with AsyncSessionLocal() as db:
+            await crud_knowledge_file_part.update_part_status(
+                db,
+                file_id=file_id,
+                part_no=part_no,
+                status="FAILED",
+                error_message="CancelledError: job timed out or the worker was stopped",
+                chunk_manifest=pack_manifest(target.manifest) if target else None,
+            )
+            await self._finalize_file_if_done(db, file_id)
+
+    async def _finalize_file_if_done(self, db: AsyncSession, file_id: UUID):
+        """
+        所有分片都结束后，把结果汇总到 KnowledgeFile 的状态上。
+        每个分片都是先提交自己的状态再汇总，所以最后提交的分片一定能看到全部结果；
+        并发完成时可能有多个分片同时汇总，写入的结果相同，不影响正确性。
+        """
+        summary = await crud_knowledge_file_part.get_parts_summary(db, file_id=file_id)
+        if not summary.total or summary.unfinished:
+            return
+
+        if summary.failed:
+            await crud_knowledge_file.update_status(
+                db,
+                file_id=file_id,
+                status="FAILED",
+                error_message=f"{summary.failed}/{summary.total} 个分片处理失败: {summary.error_message}",
+            )
+        elif not summary.chunk_count:
+            await crud_knowledge_file.update_status(
+                db,
+                file_id=file_id,
+                status="FAILED",
+                error_message="ValueError: Document is empty or could not be split into chunks.",
+            )
+        else:
+            # 替换文件时，新内容全部就绪后再清理旧分片，替换过程中检索不会出现空窗
+            await self._retire_superseded_parts(db, file_id)
+            # 全部成功后，更新数据库状态为 INDEXED
+            await crud_knowledge_file.update_status(db, file_id=file_id, status="INDEXED")
+            logging.info(f"文件 {file_id} 的 {summary.total} 个分片全部处理并索引成功 ({summary.chunk_count} 个文本块)!")
+
+    async def finalize_file(self, file_id: UUID):
+        """在独立会话中重新汇总文件状态（供定期对账任务处理停滞的文件）"""
+        async with AsyncSessionLocal() as db:
+            await self._finalize_file_if_done(db, file_id)
+
+    async def retire_superseded_parts(self, file_id: UUID):
+        """在独立会话中清理已完成替换的文件残留的旧分片（供定期对账任务补做）"""
+        async with AsyncSessionLocal() as db:
+            await self._retire_superseded_parts(db, file_id)
+
+    async def _retire_superseded_parts(self, db: AsyncSession, file_id: UUID):
+        """
+        删除替换前的旧分片：旧清单中不再被新分片引用的向量从 Pinecone 删除，
+        再删除旧分片的记录和词法索引段。失败时只记录日志并保留旧分片，
+        下一次替换会因此退回完整重建，不会遗留无主的向量。
+        """
+        old_manifests = await crud_knowledge_file_part.get_part_manifests(db, file_id=file_id, superseded=True)
+        if not old_manifests:
+            return
+        try:
+            kept = vector_numbers(
+                await crud_knowledge_file_part.get_part_manifests(db, file_id=file_id, superseded=False)
+            )
+            vanished = sorted(vector_numbers(old_manifests) - kept)
+            db_file = await crud_knowledge_file.get_file_by_id(db, file_id=file_id)
+            companion = await crud_companion.get_companion_by_id(db, db_file.companion_id, include_deleted=True)
+            for namespace in companion_namespaces(companion):
+                await delete_ids([f"{file_id}_{number}" for number in vanished], namespace)
+
+            part_nos = await crud_knowledge_file_part.delete_superseded_parts(db, file_id=file_id)
+            lexical_index_store.delete_segment(str(file_id), part_nos=part_nos)
+            logging.info(f"文件 {file_id} 替换完成：沿用 {len(kept)} 个向量，删除 {len(vanished)} 个旧向量")
+        except Exception as e:
+            await db.rollback()
+            logging.error(f"清理文件 {file_id} 被替换的旧分片时出错: {e}", exc_info=True)
+
+    async def delete_vectors_by_file_id(
+        self,
+        file_id: str,
+        id_ranges: Optional[List[Tuple[int, int]]] = None,
+        namespaces: Sequence[str] = ("",),
+        raise_on_error: bool = False,
+    ):
+        """
+        删除 file_id 在 Pinecone 各命名空间中的全部向量以及它的词法索引段。
+        id_ranges 是由分片清单得到的向量编号区间，据此按 ID 分批删除；
+        为 None 时（早于清单的旧数据等）退回按前缀 / metadata filter 删除。
+        raise_on_error=True 时把错误抛给调用方（例如替换文件前必须先删干净旧向量）。
         """
         try:
-            # Pinecone 的 delete API 允许通过元数据过滤器来删除向量
-            # 这是最高效、最精准的方式
-            metadata_filter = {"file_id": {"$eq": file_id}}
-            
             logging.info(f"开始从 Pinecone 删除 file_id 为 '{file_id}' 的向量...")
-            
-            # 执行删除操作
-            delete_response = self.pinecone_index.delete(filter=metadata_filter)
-            
-            logging.info(f"Pinecone 向量删除任务完成。响应: {delete_response}")
+            await delete_file_vectors(file_id, id_ranges, namespaces)
+
+            if lexical_index_store.delete_segment(file_id):
+                logging.info(f"已删除 file_id 为 '{file_id}' 的词法索引段。")
             
         except Exception as e:
             logging.error(
                 f"从 Pinecone 删除 file_id '{file_id}' 的向量时发生严重错误: {e}", 
                 exc_info=True
-            )            
+            )
+            if raise_on_error:
+                raise
 
-    def _load_documents(self, file_path_str: str) -> List[Document]:
-        """根据文件扩展名选择合适的加载器来加载文档"""
+    def _plan_page_ranges(self, file_path_str: str) -> List[Tuple[int, Optional[int]]]:
+        """
+        PDF 每 INGEST_PAGES_PER_PART 页一个分片。其他格式按文本块序号拆分：
+        按文件大小估算文本块数，每 INGEST_CHUNKS_PER_PART 个一个分片，最后一个分片到文件末尾，
+        估算偏小时多出的文本块都落在最后一个分片中。
+        """
+        file_path = self._check_file(file_path_str)
+        if file_path.suffix.lower() != ".pdf":
+            chunks_per_part = min(settings.INGEST_CHUNKS_PER_PART, PART_ID_STRIDE // 2)
+            # 每个文本块至少向前推进 CHUNK_SIZE - CHUNK_OVERLAP 个字符，字符数不超过字节数
+            estimated_chunks = file_path.stat().st_size / (CHUNK_SIZE - CHUNK_OVERLAP)
+            part_count = max(1, math.ceil(estimated_chunks / chunks_per_part))
+            return [
+                (i * chunks_per_part, (i + 1) * chunks_per_part if i < part_count - 1 else None)
+                for i in range(part_count)
+            ]
+
+        page_count = count_pdf_pages(str(file_path))
+        pages_per_part = settings.INGEST_PAGES_PER_PART
+        ranges = [
+            (start, min(start + pages_per_part, page_count))
+            for start in range(0, page_count, pages_per_part)
+        ]
+        return ranges or [(0, 0)]
+
+    def _check_file(self, file_path_str: str) -> Path:
         file_path = Path(file_path_str)
         if not file_path.exists():
             raise FileNotFoundError(f"File not found at path: {file_path}")
+        if file_path.suffix.lower() not in SUPPORTED_EXTENSIONS:
+            raise ValueError(f"Unsupported file type for RAG: {file_path.suffix.lower()}")
+        return file_path
+
+    def _iter_documents(
+        self, file_path_str: str, start_page: int = 0, end_page: Optional[int] = None
+    ) -> Iterator[Document]:
+        """根据文件扩展名选择合适的加载器，逐页 (逐个 Document) 惰性加载；页码区间只对 PDF 生效"""
+        file_path = self._check_file(file_path_str)
 
         ext = file_path.suffix.lower()
+        if ext == ".pdf":
+            pages_per_task = settings.PDF_PAGES_PER_TASK
+            if end_page is None:
+                end_page = count_pdf_pages(str(file_path))
+            # 页数较多时按页码区间分发到进程池并行解析，结果仍按页序产出
+            parallel = pdf_parse_processes() > 1 and end_page - start_page > pages_per_task
+            return iter_pdf_pages(
+                str(file_path),
+                get_pdf_process_pool() if parallel else None,
+                pages_per_task=pages_per_task,
+                # 每个进程最多预取一个区间，限制乱序完成时缓存的页数
+                max_pending=pdf_parse_processes() * 2,
+                start_page=start_page,
+                end_page=end_page,
+            )
+
         if ext == ".txt":
             loader = TextLoader(str(file_path), encoding="utf-8")
-        elif ext == ".md":
-            loader = UnstructuredMarkdownLoader(str(file_path))
-        elif ext == ".pdf":
-            loader = PyPDFLoader(str(file_path))
         else:
-            raise ValueError(f"Unsupported file type for RAG: {ext}")
-        
-        return loader.load()
+            loader = UnstructuredMarkdownLoader(str(file_path))
+        return loader.lazy_load()
+
+    def _iter_chunks(
+        self,
+        file_path_str: str,
+        text_splitter: RecursiveCharacterTextSplitter,
+        start_page: int = 0,
+        end_page: Optional[int] = None,
+    ) -> Iterator[Document]:
+        """
+        逐页切分。split_documents 本来就是对每个 Document 独立切分的，
+        所以逐页处理得到的文本块与一次性切分完全一致。
+        非 PDF 文件的区间是文本块序号：切分整个文件后只产出 [start_page, end_page) 中的文本块。
+        """
+        chunks = (
+            chunk
+            for document in self._iter_documents(file_path_str, start_page, end_page)
+            for chunk in text_splitter.split_documents([document])
+        )
+        if Path(file_path_str).suffix.lower() != ".pdf":
+            chunks = itertools.islice(chunks, start_page, end_page)
+        yield from chunks
 
     async def _embed_and_upsert_chunks(
-        self, chunks: List[Document], companion_id: UUID, file_id: UUID, file_name: str
-    ):
-        """将文本块向量化并分批上传到 Pinecone"""
-        batch_size = 100  # Pinecone 推荐的批处理大小
-        
-        for i in range(0, len(chunks), batch_size):
-            batch_chunks = chunks[i : i + batch_size]
-            
-            # 提取批次的文本内容
-            texts = [chunk.page_content for chunk in batch_chunks]
-            
-            # 向量化
-            logging.info(f"正在为 {len(texts)} 个文本块生成向量 (Batch {i//batch_size + 1})...")
-            embeddings = self.embedding_model.encode(texts).tolist()
-            
-            # 准备上传到 Pinecone 的数据结构
-            vectors_to_upsert = []
-            for j, chunk in enumerate(batch_chunks):
-                # 为每个 chunk 创建一个唯一的、可追溯的 ID
-                vector_id = f"{file_id}_{i+j}" 
-                metadata = {
-                    "text": chunk.page_content,
-                    "companion_id": str(companion_id),
-                    "file_id": str(file_id),
-                    "file_name": file_name,
-                }
-                vectors_to_upsert.append({
-                    "id": vector_id,
-                    "values": embeddings[j],
-                    "metadata": metadata,
-                })
-            
-            # 上传到 Pinecone
-            logging.info(f"正在上传 {len(vectors_to_upsert)} 个向量到 Pinecone...")
-            self.pinecone_index.upsert(vectors=vectors_to_upsert)
\ No newline at end of file
+        self,
+        db: AsyncSession,
+        chunk_stream: BackgroundIterator,
+        resume_from: int = 0,
+        on_checkpoint: Optional[Callable[[int], Awaitable[None]]] = None,
+        model_id: Optional[str] = None,
+    ) -> int:
+        """
+        将 (分片, 文本块) 流向量化并分批上传到 Pinecone，返回处理的文本块总数；
+        每个文本块的 (向量编号, 内容摘要) 按文档顺序记入所属分片的清单。
+        流中可以混合多个文件的文本块，它们会被合并到同一批次中向量化和上传。
+
+        向量化与上传以流水线方式重叠执行：当前批次上传的同时，下一窗口已在向量化；
+        最多 INGEST_MAX_INFLIGHT_UPSERTS 个批次在途，超出时向量化阶段会等待，
+        进而让解析线程在有界队列处等待。
+
+        前 resume_from 个文本块已在之前的执行中上传，只加入词法索引段；
+        此后每当连续上传的前缀前移，就通过 on_checkpoint 记录新的断点（仅用于单个分片的流）。
+        向量 ID 由分片编号和文本块序号决定，重复上传同一个文本块只会覆盖，不会产生重复向量。
+
+        分片的 reuse_ids 中已有的文本块直接沿用旧向量，不再向量化和上传。
+        沿用的向量保留旧的元数据（包括 file_name），检索只用到其中的文本，不受影响。
+
+        model_id 是伙伴使用的 embedding 模型（None 为当前配置的模型），向量写入该模型的命名空间。
+        """
+        namespace = vector_namespace(model_id)
+        batch_size = settings.INGEST_UPSERT_BATCH_SIZE  # Pinecone 推荐的批处理大小
+        window_size = max(settings.INGEST_EMBED_WINDOW, batch_size)
+        chunk_count = 0
+        cache_hits = 0
+        embedded_count = 0
+        reused_count = 0
+        watermark = ContiguousWatermark(resume_from)
+        watermark_lock = asyncio.Lock()
+
+        async def embed_batches():
+            nonlocal chunk_count, cache_hits, embedded_count, reused_count
+            # 以 “窗口” 为单位向量化：窗口内按 token 长度分桶、按 token 预算组批，
+            # 结果还原为文档顺序后再切成固定大小的上传批次。
+            # 解析跟不上时，凑够一个上传批次就先处理，让第一批向量尽早落库。
+            async for window_chunks in chunk_stream.iter_batches(max_size=window_size, min_size=batch_size):
+                w = chunk_count
+                chunk_count += len(window_chunks)
+
+                pending = []
+                for k, (target, chunk) in enumerate(window_chunks):
+                    if len(target.manifest) >= PART_ID_STRIDE:
+                        # 再编号就会进入下一个分片的 ID 区间，与其向量（包括替换时的新分片）冲突
+                        raise ValueError(
+                            f"Part {target.part_no} of file {target.file_id} exceeds "
+                            f"{PART_ID_STRIDE} chunks; split the file into smaller files"
+                        )
+                    position = w + k
+                    digest = chunk_digest(chunk.page_content)
+                    number = target.reuse_ids.get(digest)
+                    if number is None:
+                        # 为每个 chunk 创建一个唯一的、可追溯的 ID（各分片使用互不重叠的编号区间）
+                        number = target.part_no * PART_ID_STRIDE + len(target.manifest)
+                        if position >= resume_from:
+                            pending.append((position, f"{target.file_id}_{number}", target, chunk))
+                    elif position >= resume_from:
+                        reused_count += 1
+                    target.manifest.append((number, digest))
+                    target.lexical_builder.add(f"{target.file_id}_{number}", chunk.page_content)
+
+                # 本窗口中需要推进断点的区间（断点之前的部分已在之前的执行中完成）
+                window_start, window_end = max(w, resume_from), chunk_count
+                if window_start >= window_end:
+                    continue
+                if not pending:
+                    # 整个窗口都沿用旧向量：没有要上传的内容，但断点仍需前移
+                    yield window_start, window_end, []
+                    continue
+
+                # 向量化（CPU 密集，在线程中执行，不阻塞事件循环和在途的上传）
+                texts = [chunk.page_content for _, _, _, chunk in pending]
+                logging.info(f"正在为 {len(texts)} 个文本块生成向量 (chunks {pending[0][0]}-{pending[-1][0]})...")
+                # 相同内容（同一模型下）命中缓存时直接复用，只对未命中的文本块编码
+                embeddings, hits = await embed_texts(db, texts, model_id)
+                cache_hits += hits
+                embedded_count += len(texts)
+
+                for i in range(0, len(pending), batch_size):
+                    # 准备上传到 Pinecone 的数据结构
+                    batch = pending[i : i + batch_size]
+                    vectors_to_upsert = [
+                        {
+                            "id": vector_id,
+                            "values": embeddings[i + j],
+                            "metadata": {
+                                "text": chunk.page_content,
+                                "companion_id": str(target.companion_id),
+                                "file_id": str(target.file_id),
+                                "file_name": target.file_name,
+                            },
+                        }
+                        for j, (_, vector_id, target, chunk) in enumerate(batch)
+                    ]
+                    # 各批次的断点区间首尾相接，覆盖整个窗口（包括其中沿用旧向量的文本块）
+                    start = window_start if i == 0 else batch[0][0]
+                    end = pending[i + batch_size][0] if i + batch_size < len(pending) else window_end
+                    yield start, end, vectors_to_upsert
+
+        async def upsert_batch(item):
+            start, end, vectors_to_upsert = item
+            if vectors_to_upsert:
+                # 上传到 Pinecone（同步网络调用，放到线程中执行）；限流 / 5xx / 网络错误自动退避重试
+                logging.info(f"正在上传 {len(vectors_to_upsert)} 个向量到 Pinecone...")
+                await retry_with_backoff(
+                    lambda: asyncio.to_thread(
+                        self.pinecone_index.upsert, vectors=vectors_to_upsert, namespace=namespace
+                    ),
+                    is_retryable=is_transient_pinecone_error,
+                    max_attempts=settings.PINECONE_MAX_ATTEMPTS,
+                    base_delay=settings.PINECONE_RETRY_BASE_DELAY,
+                    description=f"Pinecone upsert (chunks {start}-{end - 1})",
+                )
+            if on_checkpoint is not None:
+                # 批次可能乱序完成：只有连续完成的前缀才能作为断点
+                async with watermark_lock:
+                    before = watermark.value
+                    if watermark.mark_done(start, end) > before:
+                        await on_checkpoint(watermark.value)
+
+        await run_bounded_pipeline(
+            embed_batches(),
+            upsert_batch,
+            max_inflight=settings.INGEST_MAX_INFLIGHT_UPSERTS,
+        )
+        if reused_count:
+            logging.info(f"{reused_count} 个文本块内容未变，沿用已有向量")
+        if embedded_count:
+            logging.info(
+                f"向量缓存命中 {cache_hits}/{embedded_count} 个文本块 "
+                f"(命中率 {cache_hits / embedded_count:.1%})"
+            )
+        return chunk_count
@@ -0,0 +1,154 @@
+# app/services/knowledge_upload.py
+
+"""
+知识文件上传的公共部分：支持的文件类型、流式写盘（边写边计算 sha256、限制大小）、压缩包解包。
+
+本模块只依赖标准库和 aiofiles，API 进程导入它不会加载 LangChain / 模型等重依赖。
+"""
+
+import hashlib
+import lzma
+import os
+import zipfile
+import zlib
+from pathlib import Path, PurePosixPath
+from typing import IO, Iterator, Tuple
+
+import aiofiles
+
+# 上传文件的存放位置：uploads/{companion_id}/{file_id}/{file_name}
+UPLOAD_DIR = Path("uploads")
+
+SUPPORTED_EXTENSIONS = (".txt", ".md", ".pdf")
+ARCHIVE_EXTENSIONS = (".zip",)
+
+# ZIP 通用标志位第 11 位：文件名以 UTF-8 编码
+_ZIP_UTF8_FLAG = 0x800
+
+# 打开 / 解压压缩包成员时，损坏或不支持的成员会抛出的异常：
+# CRC 校验失败或文件头损坏 (BadZipFile)、加密成员 (RuntimeError)、不支持的压缩方式 (NotImplementedError)、
+# 压缩数据损坏 (zlib.error / LZMAError / bz2 的 OSError)、数据被截断 (EOFError)
+_MEMBER_ERRORS = (zipfile.BadZipFile, RuntimeError, NotImplementedError, zlib.error, lzma.LZMAError, OSError, EOFError)
+
+
+class ArchiveError(ValueError):
+    """压缩包无法读取或超出限制"""
+
+
+class UploadTooLarge(ValueError):
+    """上传的文件超过大小限制"""
+
+
+def is_supported(file_name: str) -> bool:
+    return Path(file_name).suffix.lower() in SUPPORTED_EXTENSIONS
+
+
+def is_archive(file_name: str) -> bool:
+    return Path(file_name).suffix.lower() in ARCHIVE_EXTENSIONS
+
+
+def _partial_path(target: Path) -> Path:
+    return target.with_name(target.name + ".uploading")
+
+
+async def save_upload(upload, target: Path, max_bytes: int, chunk_size: int) -> Tuple[int, str]:
+    """
+    把上传的文件（UploadFile 等提供 async read 的对象）分块异步写入 target，返回 (字节数, sha256)。
+    超过 max_bytes 时立即停止读取并抛出 UploadTooLarge；先写到临时文件，完成后原子地替换到位，
+    任何失败都不会在 target 留下写了一半的文件。
+    """
+    digest = hashlib.sha256()
+    size = 0
+    partial = _partial_path(target)
+    try:
+        async with aiofiles.open(partial, "wb") as out:
+            while chunk := await upload.read(chunk_size):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLarge(f"File exceeds the upload limit of {max_bytes} bytes")
+                digest.update(chunk)
+                await out.write(chunk)
+        os.replace(partial, target)
+    except BaseException:
+        partial.unlink(missing_ok=True)
+        raise
+    return size, digest.hexdigest()
+
+
+def copy_and_hash(source: IO[bytes], target: Path, max_bytes: int, chunk_size: int) -> Tuple[int, str]:
+    """save_upload 的同步版本，用于在线程中处理批量上传 / 压缩包成员"""
+    digest = hashlib.sha256()
+    size = 0
+    partial = _partial_path(target)
+    try:
+        with partial.open("wb") as out:
+            while chunk := source.read(chunk_size):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLarge(f"{target.name} exceeds the upload limit of {max_bytes} bytes")
+                digest.update(chunk)
+                out.write(chunk)
+        os.replace(partial, target)
+    except BaseException:
+        partial.unlink(missing_ok=True)
+        raise
+    return size, digest.hexdigest()
+
+
+def _member_name(info: zipfile.ZipInfo) -> str:
+    name = info.filename
+    if not info.flag_bits & _ZIP_UTF8_FLAG:
+        # 没有 UTF-8 标记的文件名会被 zipfile 按 cp437 解码；中文 Windows 打包的实际是 GBK
+        try:
+            name = name.encode("cp437").decode("gbk")
+        except (UnicodeEncodeError, UnicodeDecodeError):
+            pass
+    # 只保留文件名本身，丢弃目录部分（也就杜绝了 ../ 之类的路径穿越）
+    return PurePosixPath(name.replace("\\", "/")).name
+
+
+class _ArchiveMember:
+    """压缩包成员的只读包装：读取（解压）时的错误转换为 ArchiveError"""
+
+    def __init__(self, name: str, member: IO[bytes]):
+        self.name = name
+        self._member = member
+
+    def read(self, size: int = -1) -> bytes:
+        try:
+            return self._member.read(size)
+        except _MEMBER_ERRORS as e:
+            raise ArchiveError(f"Cannot read {self.name} from archive: {e}") from e
+
+
+def iter_archive_members(fileobj: IO[bytes], max_total_bytes: int) -> Iterator[Tuple[str, IO[bytes]]]:
+    """
+    逐个产出压缩包中受支持的文件 (文件名, 可读的文件对象)，跳过目录、隐藏文件和其他类型。
+    解压后的总大小超过 max_total_bytes 时抛出 ArchiveError（防止压缩炸弹）；
+    zipfile 读取每个成员时不会超过其声明的大小，所以按声明大小检查即可。
+    成员损坏、加密或使用了不支持的压缩方式时，打开或读取它都会抛出 ArchiveError。
+    """
+    try:
+        archive = zipfile.ZipFile(fileobj)
+    except zipfile.BadZipFile as e:
+        raise ArchiveError(f"Invalid zip archive: {e}") from e
+
+    with archive:
+        members = [
+            info for info in archive.infolist()
+            if not info.is_dir() and "__MACOSX" not in info.filename
+        ]
+        total = sum(info.file_size for info in members)
+        if total > max_total_bytes:
+            raise ArchiveError(f"Archive expands to {total} bytes, exceeding the limit of {max_total_bytes}")
+
+        for info in members:
+            name = _member_name(info)
+            if not name or name.startswith(".") or not is_supported(name):
+                continue
+            try:
+                member = archive.open(info)
+            except _MEMBER_ERRORS as e:
+                raise ArchiveError(f"Cannot read {name} from archive: {e}") from e
+            with member:
+                yield name, _ArchiveMember(name, member)
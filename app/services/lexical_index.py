@@ -0,0 +1,288 @@
+# app/services/lexical_index.py
+
+"""
+每个 companion 一份的本地 BM25 倒排索引。
+
+- 索引在 KnowledgeService 处理文件时按文件构建成一个“段”(segment)，
+  以 zlib 压缩的 JSON 形式保存在 LEXICAL_INDEX_DIR/<companion_id>/<file_id>.seg
+  （大文件拆成多个子任务时，第 n (n > 0) 个分片的段为 <file_id>.p<n>.seg）
+- 查询时把该 companion 下的所有段合并成内存中的倒排表并缓存（LRU，最多
+  LEXICAL_INDEX_CACHE_MAX_COMPANIONS 个 companion）；缓存每隔 LEXICAL_INDEX_REFRESH_SECONDS
+  检查一次段文件，有变化（新增 / 删除 / 覆盖）时重新加载
+- 分词器不依赖第三方库：中日韩字符输出单字 + 相邻二元组，
+  拉丁字母和数字按整词输出，从而能精确命中人名、编号等稀有词
+"""
+
+import json
+import logging
+import math
+import os
+import re
+import shutil
+import threading
+import time
+import zlib
+from collections import Counter, OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_SUFFIX = ".seg"
+SEGMENT_FORMAT_VERSION = 1
+
+# BM25 的标准参数
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# 中日韩统一表意文字 + 扩展 A 区 + 兼容区；其余“单词”由字母数字组成
+_TOKEN_PATTERN = re.compile(
+    r"[㐀-䶿一-鿿豈-﫿]+|[0-9a-z]+(?:[._-][0-9a-z]+)*"
+)
+_CJK_PATTERN = re.compile(r"[㐀-䶿一-鿿豈-﫿]")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    面向中英混合文本的分词：
+    - 中文连续片段输出单字和二元组（"知识库" -> 知, 识, 库, 知识, 识库）
+    - 英文 / 数字片段整体小写输出（"GPT-4o" -> "gpt-4o"）
+    """
+    tokens: List[str] = []
+    for run in _TOKEN_PATTERN.findall(text.lower()):
+        if _CJK_PATTERN.match(run):
+            tokens.extend(run)
+            tokens.extend(run[i : i + 2] for i in range(len(run) - 1))
+        else:
+            tokens.append(run)
+    return tokens
+
+
+def segment_name(file_id: str, part_no: int = 0) -> str:
+    # 分片 0 沿用单文件时的段名
+    stem = file_id if not part_no else f"{file_id}.p{part_no}"
+    return f"{stem}{SEGMENT_SUFFIX}"
+
+
+@dataclass
+class LexicalHit:
+    vector_id: str
+    text: str
+    score: float
+
+
+class LexicalSegmentBuilder:
+    """为单个文件（或文件的一个分片）累积文本块，生成可持久化的倒排段。"""
+
+    def __init__(self, file_id: str, file_name: str, part_no: int = 0):
+        self.file_id = file_id
+        self.file_name = file_name
+        self.part_no = part_no
+        self.ids: List[str] = []
+        self.texts: List[str] = []
+        self.lengths: List[int] = []
+        self.postings: Dict[str, List[int]] = {}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def segment_name(self) -> str:
+        return segment_name(self.file_id, self.part_no)
+
+    def add(self, vector_id: str, text: str) -> None:
+        doc = len(self.ids)
+        term_freqs = Counter(tokenize(text))
+        self.ids.append(vector_id)
+        self.texts.append(text)
+        self.lengths.append(sum(term_freqs.values()))
+        for term, tf in term_freqs.items():
+            # 扁平存储 [doc, tf, doc, tf, ...]，比嵌套列表更紧凑
+            self.postings.setdefault(term, []).extend((doc, tf))
+
+    def to_bytes(self) -> bytes:
+        payload = {
+            "v": SEGMENT_FORMAT_VERSION,
+            "file_id": self.file_id,
+            "file_name": self.file_name,
+            "ids": self.ids,
+            "texts": self.texts,
+            "lengths": self.lengths,
+            "postings": self.postings,
+        }
+        raw = json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
+        return zlib.compress(raw.encode("utf-8"), 6)
+
+
+class CompanionLexicalIndex:
+    """由一个 companion 的所有段合并而成的内存 BM25 索引（只读）。"""
+
+    def __init__(self, segments: List[dict]):
+        self.ids: List[str] = []
+        self.texts: List[str] = []
+        self.lengths: List[int] = []
+        self.postings: Dict[str, List[Tuple[int, int]]] = {}
+
+        for segment in segments:
+            offset = len(self.ids)
+            self.ids.extend(segment["ids"])
+            self.texts.extend(segment["texts"])
+            self.lengths.extend(segment["lengths"])
+            for term, flat in segment["postings"].items():
+                bucket = self.postings.setdefault(term, [])
+                bucket.extend((offset + flat[i], flat[i + 1]) for i in range(0, len(flat), 2))
+
+        self.doc_count = len(self.ids)
+        self.avg_length = (sum(self.lengths) / self.doc_count) if self.doc_count else 0.0
+
+    def search(self, query: str, top_k: int) -> List[LexicalHit]:
+        if not self.doc_count:
+            return []
+
+        scores: Dict[int, float] = {}
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            df = len(postings)
+            idf = math.log(1 + (self.doc_count - df + 0.5) / (df + 0.5))
+            for doc, tf in postings:
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[doc] / self.avg_length)
+                scores[doc] = scores.get(doc, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+
+        best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+        return [LexicalHit(self.ids[doc], self.texts[doc], score) for doc, score in best]
+
+
+class LexicalIndexStore:
+    """
+    管理磁盘上的段文件，并按 companion 缓存合并后的内存索引。
+    worker 负责写入，API 进程只读；两边通过共享目录交换数据。
+    """
+
+    def __init__(
+        self,
+        root: Optional[str] = None,
+        max_companions: Optional[int] = None,
+        refresh_seconds: Optional[float] = None,
+    ):
+        self.root = Path(root or settings.LEXICAL_INDEX_DIR)
+        self.max_companions = max_companions or settings.LEXICAL_INDEX_CACHE_MAX_COMPANIONS
+        self.refresh_seconds = settings.LEXICAL_INDEX_REFRESH_SECONDS if refresh_seconds is None else refresh_seconds
+        # companion_id -> (下次检查段文件的时间, 段文件签名, 索引)，按最近使用排序
+        self._cache: "OrderedDict[str, Tuple[float, tuple, CompanionLexicalIndex]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _companion_dir(self, companion_id: str) -> Path:
+        return self.root / str(companion_id)
+
+    def write_segment(self, companion_id: str, builder: LexicalSegmentBuilder) -> None:
+        """原子地写入（或覆盖）一个文件（分片）的段。"""
+        companion_dir = self._companion_dir(companion_id)
+        companion_dir.mkdir(parents=True, exist_ok=True)
+        target = companion_dir / builder.segment_name
+        tmp_path = target.with_suffix(".tmp")
+        tmp_path.write_bytes(builder.to_bytes())
+        os.replace(tmp_path, target)
+        self._expire(companion_id)
+        logger.info(f"词法索引段已写入: {target} ({len(builder)} 个文本块)")
+
+    def delete_segment(
+        self, file_id: str, companion_id: Optional[str] = None, part_nos: Optional[Iterable[int]] = None
+    ) -> bool:
+        """
+        删除某个文件的段：默认删除所有分片的段，指定 part_nos 时只删除这些分片的段；
+        不知道 companion_id 时在所有 companion 目录下查找。
+        """
+        if part_nos is not None:
+            patterns = [segment_name(file_id, part_no) for part_no in part_nos]
+        else:
+            patterns = [f"{file_id}{SEGMENT_SUFFIX}", f"{file_id}.p*{SEGMENT_SUFFIX}"]
+        if companion_id is not None:
+            companion_dir = self._companion_dir(companion_id)
+            candidates = [path for pattern in patterns for path in companion_dir.glob(pattern)]
+        elif self.root.exists():
+            candidates = [path for pattern in patterns for path in self.root.glob(f"*/{pattern}")]
+        else:
+            candidates = []
+
+        removed = False
+        for path in candidates:
+            try:
+                path.unlink()
+                removed = True
+            except FileNotFoundError:
+                pass
+        if removed:
+            self._expire(companion_id)
+        return removed
+
+    def delete_companion(self, companion_id: str) -> None:
+        shutil.rmtree(self._companion_dir(companion_id), ignore_errors=True)
+        with self._lock:
+            self._cache.pop(str(companion_id), None)
+
+    def _expire(self, companion_id: Optional[str] = None) -> None:
+        """本进程修改了段文件：下次查询时立即检查（不等刷新间隔），companion_id 为 None 时针对全部"""
+        with self._lock:
+            keys = [str(companion_id)] if companion_id is not None else list(self._cache)
+            for key in keys:
+                cached = self._cache.get(key)
+                if cached:
+                    self._cache[key] = (0.0, cached[1], cached[2])
+
+    def _signature(self, companion_dir: Path) -> tuple:
+        """用段文件名 + mtime + 大小作为缓存版本号，任何写入 / 删除都会让它变化。"""
+        try:
+            entries = list(os.scandir(companion_dir))
+        except FileNotFoundError:
+            return ()
+        signature = []
+        for entry in entries:
+            if entry.name.endswith(SEGMENT_SUFFIX):
+                stat = entry.stat()
+                signature.append((entry.name, stat.st_mtime_ns, stat.st_size))
+        return tuple(sorted(signature))
+
+    def get_index(self, companion_id: str) -> CompanionLexicalIndex:
+        key = str(companion_id)
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached and cached[0] > time.monotonic():
+                self._cache.move_to_end(key)
+                return cached[2]
+
+        companion_dir = self._companion_dir(key)
+        signature = self._signature(companion_dir)
+
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached and cached[1] == signature:
+                self._cache[key] = (time.monotonic() + self.refresh_seconds, signature, cached[2])
+                self._cache.move_to_end(key)
+                return cached[2]
+
+            segments = []
+            for name, _, _ in signature:
+                try:
+                    raw = zlib.decompress((companion_dir / name).read_bytes())
+                    segments.append(json.loads(raw))
+                except (OSError, ValueError, zlib.error) as e:
+                    # 段可能正在被删除或损坏，跳过它而不是让整个检索失败
+                    logger.warning(f"跳过无法读取的词法索引段 {companion_dir / name}: {e}")
+            index = CompanionLexicalIndex(segments)
+            self._cache[key] = (time.monotonic() + self.refresh_seconds, signature, index)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_companions:
+                self._cache.popitem(last=False)
+            return index
+
+    def search(self, companion_id: str, query: str, top_k: int) -> List[LexicalHit]:
+        return self.get_index(companion_id).search(query, top_k)
+
+
+# 进程级单例：构造很便宜（不读取任何文件），索引在首次查询时才加载
+lexical_index_store = LexicalIndexStore()
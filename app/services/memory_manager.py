@@ -5,13 +5,16 @@ from langchain.schema.messages import BaseMessage
 import redis.asyncio as redis
 import logging
 
+MEMORY_KEY_PREFIX = "chat_history"
+
+
 class MemoryManager:
     def __init__(self, redis_client: redis.Redis, companion_name: str, user_id: str, ai_prefix: str = "AI"):
         self.redis_client = redis_client
         self.companion_name = companion_name
         self.user_id = user_id
         self.ai_prefix = ai_prefix
-        self.memory_key = f"chat_history:{self.companion_name}:{self.user_id}"
+        self.memory_key = f"{MEMORY_KEY_PREFIX}:{self.companion_name}:{self.user_id}"
 
     async def get_memory(self, k: int = 30) -> ConversationBufferWindowMemory:
         memory = ConversationBufferWindowMemory(
@@ -37,4 +40,21 @@ class MemoryManager:
             logging.info(f"  -> [MemoryManager] Redis 记忆删除成功。")
         except Exception as e:
             logging.error(f"  -> [MemoryManager] ERROR: 从 Redis 删除记忆失败: {e}")
-            raise e    
\ No newline at end of file
+            raise e
+
+    @staticmethod
+    async def delete_companion_memories(redis_client: redis.Redis, companion_id: str, batch_size: int = 500) -> int:
+        """
+        删除一个伙伴与所有用户的对话记忆（ChatService 以伙伴 ID 作为 key 的第二段）。
+        用 SCAN 增量遍历而不是 KEYS，按批 UNLINK，避免阻塞 Redis；返回删除的 key 数。
+        """
+        deleted = 0
+        batch: List = []
+        async for key in redis_client.scan_iter(match=f"{MEMORY_KEY_PREFIX}:{companion_id}:*", count=batch_size):
+            batch.append(key)
+            if len(batch) >= batch_size:
+                deleted += await redis_client.unlink(*batch)
+                batch = []
+        if batch:
+            deleted += await redis_client.unlink(*batch)
+        return deleted
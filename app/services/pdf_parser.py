@@ -0,0 +1,107 @@
+# app/services/pdf_parser.py
+
+"""
+多进程 PDF 解析。
+
+pypdf 是纯 Python 实现，长篇（尤其是扫描版）PDF 单线程解析可能要几分钟。
+这里把页码区间分发到进程池中并行解析，再按页码顺序重新组装成 Document 流，
+交给切分器；同时在途的区间数有上限，内存占用不随页数增长。
+
+注意：子进程以 spawn 方式启动，会重新导入本模块，所以模块顶层只导入轻量依赖。
+"""
+
+import logging
+import multiprocessing
+import os
+import threading
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Iterator, List, Optional
+
+from langchain.schema import Document
+from pypdf import PdfReader
+
+logger = logging.getLogger(__name__)
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def count_pdf_pages(path: str) -> int:
+    return len(PdfReader(path).pages)
+
+
+def _parse_page_range(path: str, start: int, end: int) -> List[str]:
+    """在子进程中执行：提取 [start, end) 页的文本（与 PyPDFLoader 的提取方式一致）"""
+    reader = PdfReader(path)
+    return [reader.pages[i].extract_text() for i in range(start, end)]
+
+
+def pdf_parse_processes() -> int:
+    """解析进程数，由 PDF_PARSE_PROCESSES 决定（0 表示全部 CPU 核）"""
+    # 在函数内导入配置：spawn 出来的子进程只需要 _parse_page_range
+    from app.core.config import settings
+
+    return settings.PDF_PARSE_PROCESSES or (os.cpu_count() or 1)
+
+
+def get_pdf_process_pool() -> ProcessPoolExecutor:
+    """进程级共享的解析进程池，首次使用时创建"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                workers = pdf_parse_processes()
+                # worker 进程里已加载了 torch 等多线程库，fork 容易死锁，使用 spawn
+                _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+                logger.info(f"PDF 解析进程池已创建 (processes={workers})")
+    return _pool
+
+
+def shutdown_pdf_process_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=True, cancel_futures=True)
+            _pool = None
+
+
+def iter_pdf_pages(
+    path: str,
+    executor: Optional[Executor],
+    pages_per_task: int,
+    max_pending: int,
+    start_page: int = 0,
+    end_page: Optional[int] = None,
+) -> Iterator[Document]:
+    """
+    并行解析 [start_page, end_page) 页，按页码顺序逐页产出 Document。
+    最多 max_pending 个页码区间同时在途：前面的区间被消费后才会提交新的区间。
+    executor 为 None 时在当前线程中逐区间解析。
+    """
+    end_page = count_pdf_pages(path) if end_page is None else end_page
+    ranges = deque(
+        (start, min(start + pages_per_task, end_page))
+        for start in range(start_page, end_page, pages_per_task)
+    )
+
+    if executor is None:
+        for start, end in ranges:
+            for offset, text in enumerate(_parse_page_range(path, start, end)):
+                yield Document(page_content=text, metadata={"source": path, "page": start + offset})
+        return
+
+    pending = deque()
+    try:
+        while ranges or pending:
+            while ranges and len(pending) < max_pending:
+                start, end = ranges.popleft()
+                pending.append((start, executor.submit(_parse_page_range, path, start, end)))
+
+            start, future = pending.popleft()
+            for offset, text in enumerate(future.result()):
+                yield Document(page_content=text, metadata={"source": path, "page": start + offset})
+    finally:
+        # 消费端提前停止（例如任务失败）时，取消尚未开始的解析
+        for _, future in pending:
+            future.cancel()
@@ -1,14 +1,16 @@
 # app/services/rag_service.py
 
+import asyncio
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from uuid import UUID
-from pathlib import Path
-from typing import List
-
-from sentence_transformers import SentenceTransformer
-from pinecone import Pinecone
+from typing import Dict, List, Optional, Sequence, Tuple
 
 from app.core.config import settings
+from app.services.embedding import get_embedding_model, vector_namespace
+from app.services.vector_store import get_pinecone_index
+from app.services.lexical_index import lexical_index_store
+from app.services.vector_deletion import delete_files_vectors
 
 # 配置日志
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
@@ -19,82 +21,188 @@ class RAGService:
     """
 
     def __init__(self):
-        # --- 复用 KnowledgeService 中的初始化逻辑，确保一致性 ---
-        logging.info("Initializing RAGService...")
-        
-        # 1. 初始化嵌入模型 (Embedding Model)
-        # SentenceTransformer 会自动处理模型的下载和缓存。
-        model_cache_path = Path("./models_cache")
-        model_cache_path.mkdir(exist_ok=True)
-        logging.info("Loading embedding model BAAI/bge-large-zh-v1.5...")
-        self.embedding_model = SentenceTransformer(
-            'BAAI/bge-large-zh-v1.5', 
-            cache_folder=str(model_cache_path)
-        )
-        
-        # 2. 初始化 Pinecone 客户端
-        logging.info("Initializing Pinecone client...")
-        self.pinecone = Pinecone(api_key=settings.PINECONE_API_KEY)
-        self.pinecone_index_name = "ai-companion-index" # 与 KnowledgeService 保持一致
-        
-        if self.pinecone_index_name not in self.pinecone.list_indexes().names():
-            raise ValueError(f"Pinecone index '{self.pinecone_index_name}' does not exist.")
-        self.pinecone_index = self.pinecone.Index(self.pinecone_index_name)
-        logging.info("RAGService initialized successfully.")
-
-    def retrieve(self, query: str, companion_id: UUID, top_k: int = 3) -> List[str]:
+        # 嵌入模型和 Pinecone 索引都由共享的 provider 按需加载，
+        # 与 KnowledgeService 使用同一份模型权重；这里的构造几乎没有开销。
+        self.pinecone_index_name = settings.PINECONE_INDEX_NAME
+        # 已提交到 _dense_executor、线程还没有返回的向量检索数（包括已经超时放弃等待的）
+        self._dense_inflight = 0
+
+    @property
+    def embedding_model(self):
+        return get_embedding_model()
+
+    @property
+    def pinecone_index(self):
+        return get_pinecone_index()
+
+    async def retrieve(
+        self, query: str, companion_id: UUID, top_k: int = 3, embedding_model: Optional[str] = None
+    ) -> List[str]:
         """
-        根据用户问题和伙伴ID，从 Pinecone 检索相关的知识文本块。
-        
+        根据用户问题和伙伴ID，混合检索相关的知识文本块。
+
+        向量检索 (Pinecone) 与本地 BM25 词法检索各取一批候选，
+        再用 Reciprocal Rank Fusion 合并排序。向量检索失败或超时的时候，
+        直接使用本地词法检索的结果，保证在任何情况下都能快速返回。
+        两路检索都在线程中执行，等待期间事件循环可以继续服务其他连接。
+
         :param query: 用户的提问字符串。
         :param companion_id: 正在对话的伙伴的 UUID。
         :param top_k: 希望检索回的最相关文本块的数量。
+        :param embedding_model: 伙伴当前使用的嵌入模型 (Companion.embedding_model)，None 为默认模型；
+                                查询向量用同一个模型生成，并在该模型的命名空间中检索。
         :return: 一个包含相关知识文本的字符串列表。
         """
         logging.info(f"Retrieving knowledge for companion '{companion_id}' with query: '{query}'")
+        candidates = max(top_k, settings.RAG_FUSION_CANDIDATES)
 
-        # 1. 将用户问题向量化
-        query_vector = self.embedding_model.encode(query).tolist()
+        # 1. 向量检索放到专用线程池中执行，这样可以对它施加超时
+        dense_task = asyncio.create_task(
+            self._dense_search_with_timeout(query, companion_id, candidates, embedding_model)
+        )
 
-        # 2. 使用元数据过滤器，确保只检索属于特定 companion 的知识
-        #    这是实现多租户数据隔离的关键
-        metadata_filter = {"companion_id": {"$eq": str(companion_id)}}
+        # 2. 本地词法检索（首次查询或段文件变化时需要读取、解压段文件），与向量检索并行进行
+        try:
+            lexical_hits = await asyncio.to_thread(lexical_index_store.search, str(companion_id), query, candidates)
+        except Exception as e:
+            logging.error(f"Lexical search failed for companion '{companion_id}': {e}")
+            lexical_hits = []
 
-        # 3. 执行 Pinecone 查询
+        # 3. 等待向量检索结果；失败或超时时退化为纯词法检索
+        dense_hits = await dense_task
+
+        # 4. 融合两路结果
+        texts: Dict[str, str] = {}
+        for vector_id, text in dense_hits:
+            texts.setdefault(vector_id, text)
+        for hit in lexical_hits:
+            texts.setdefault(hit.vector_id, hit.text)
+
+        fused_ids = reciprocal_rank_fusion(
+            [[vector_id for vector_id, _ in dense_hits], [hit.vector_id for hit in lexical_hits]],
+            k=settings.RAG_RRF_K,
+        )
+        retrieved_texts = [texts[vector_id] for vector_id in fused_ids[:top_k]]
+        logging.info(
+            f"Retrieved {len(retrieved_texts)} text chunks "
+            f"(dense: {len(dense_hits)}, lexical: {len(lexical_hits)})."
+        )
+
+        return retrieved_texts
+
+    async def _dense_search_with_timeout(
+        self, query: str, companion_id: UUID, top_k: int, embedding_model: Optional[str] = None
+    ) -> List[tuple]:
+        """
+        在 _dense_executor 中执行向量检索，超过 RAG_DENSE_TIMEOUT_SECONDS 或失败时返回空列表。
+        超时后线程仍会执行到 Pinecone 返回为止：线程池被这些调用占满时直接跳过向量检索，
+        新的查询不会排在它们后面等待。
+        """
+        if self._dense_inflight >= DENSE_MAX_WORKERS:
+            logging.warning(
+                f"Dense retrieval skipped: {self._dense_inflight} Pinecone queries still running, "
+                f"using lexical results for companion '{companion_id}'."
+            )
+            return []
+
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(
+            _dense_executor, self._dense_search, query, companion_id, top_k, embedding_model
+        )
+        self._dense_inflight += 1
+
+        def on_done(done: asyncio.Future) -> None:
+            self._dense_inflight -= 1
+            # 超时放弃的查询，结果没有人读取；读取一下异常，避免 "exception was never retrieved" 日志
+            if not done.cancelled():
+                done.exception()
+
+        future.add_done_callback(on_done)
         try:
-            results = self.pinecone_index.query(
-                vector=query_vector,
-                filter=metadata_filter,
-                top_k=top_k,
-                include_metadata=True
+            # shield：超时只是不再等待，future 保留到线程真正结束，在途计数才准确
+            return await asyncio.wait_for(asyncio.shield(future), timeout=settings.RAG_DENSE_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            logging.warning(
+                f"Dense retrieval timed out after {settings.RAG_DENSE_TIMEOUT_SECONDS}s, "
+                f"falling back to lexical results for companion '{companion_id}'."
             )
         except Exception as e:
             logging.error(f"Pinecone query failed for companion '{companion_id}': {e}")
-            return [] # 查询失败时返回空列表，保证程序的健壮性
+        return []
 
-        # 4. 提取并返回检索到的文本内容
-        retrieved_texts = [match['metadata']['text'] for match in results.get('matches', [])]
-        logging.info(f"Retrieved {len(retrieved_texts)} text chunks from Pinecone.")
-        
-        return retrieved_texts
+    def _dense_search(
+        self, query: str, companion_id: UUID, top_k: int, embedding_model: Optional[str] = None
+    ) -> List[tuple]:
+        """向量检索，返回 (vector_id, text) 列表，按相似度降序。"""
+        # 1. 用伙伴的嵌入模型将用户问题向量化
+        query_vector = get_embedding_model(embedding_model).encode(query).tolist()
+
+        # 2. 使用元数据过滤器，确保只检索属于特定 companion 的知识
+        #    这是实现多租户数据隔离的关键
+        metadata_filter = {"companion_id": {"$eq": str(companion_id)}}
+
+        # 3. 执行 Pinecone 查询
+        results = self.pinecone_index.query(
+            vector=query_vector,
+            filter=metadata_filter,
+            top_k=top_k,
+            include_metadata=True,
+            namespace=vector_namespace(embedding_model),
+        )
+        return [(match['id'], match['metadata']['text']) for match in results.get('matches', [])]
 
-    async def delete_vectors_by_companion_id(self, companion_id: str):
+    async def delete_vectors_by_companion_id(
+        self,
+        companion_id: str,
+        file_id_ranges: Optional[Dict[str, Optional[List[Tuple[int, int]]]]] = None,
+        namespaces: Sequence[str] = ("",),
+    ):
         """
         根据 companion_id 从 Pinecone 删除所有相关的向量。
+        file_id_ranges 为 {file_id: 向量编号区间}（由分片清单得到）时合并成一个 ID 列表分批删除，
+        区间为 None 的文件退回按前缀 / filter 删除；不传时按 companion_id 的 metadata filter 删除。
+        namespaces 为伙伴向量所在的全部命名空间（见 embedding.companion_namespaces）。
         """
         logging.info(f"  -> [RAGService] 准备从 Pinecone 删除 companion_id='{companion_id}' 的向量...")
         try:
-            # Pinecone 的 delete API 支持通过 metadata filter 来批量删除
-            # 注意：Pinecone 的 delete 是同步操作，但我们可以在异步函数中调用它
-            self.pinecone_index.delete(filter={"companion_id": companion_id})
-            logging.info(f"  -> [RAGService] Pinecone 向量删除指令已发送。")
+            if file_id_ranges is None:
+                # 注意：Pinecone 的 delete 是同步操作，放到线程中执行
+                for namespace in namespaces:
+                    await asyncio.to_thread(
+                        self.pinecone_index.delete, filter={"companion_id": companion_id}, namespace=namespace
+                    )
+                logging.info(f"  -> [RAGService] Pinecone 向量删除指令已发送。")
+            else:
+                report = await delete_files_vectors(file_id_ranges, namespaces)
+                logging.info(
+                    f"  -> [RAGService] 已删除 {len(file_id_ranges)} 个文件的向量: 请求删除 {report.requested} 个, "
+                    f"抽样核验后仍存在 {report.remaining} 个"
+                )
+            lexical_index_store.delete_companion(companion_id)
+            logging.info(f"  -> [RAGService] 本地词法索引已删除。")
         except Exception as e:
             logging.error(f"  -> [RAGService] ERROR: 从 Pinecone 删除向量失败: {e}")
             # 抛出异常，以便上层可以捕获并回滚事务
             raise e    
 
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[str]:
+    """
+    Reciprocal Rank Fusion：score(d) = Σ 1 / (k + rank_i(d))。
+    只依赖名次，不需要把 BM25 分数和余弦相似度归一化到同一尺度。
+    """
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+# 向量检索专用的小线程池，用于给同步的 Pinecone 查询加超时
+DENSE_MAX_WORKERS = 4
+_dense_executor = ThreadPoolExecutor(max_workers=DENSE_MAX_WORKERS, thread_name_prefix="rag-dense")
+
 # --- 单例模式 ---
 # 创建一个 RAGService 的全局单例，方便在应用的其他地方复用。
-# 这样可以确保昂贵的模型和客户端连接只在应用启动时被初始化一次，
-# 从而大大提高后续请求的处理性能。
+# 构造本身不会加载模型或连接 Pinecone，昂贵的资源在应用启动阶段
+# (见 app.main) 或第一次检索时才初始化，且整个进程只初始化一次。
 rag_service = RAGService()
\ No newline at end of file
@@ -0,0 +1,214 @@
+# app/services/reindex_service.py
+
+"""
+embedding 模型迁移：把伙伴的知识库向量用新模型重新生成，写入新模型的 Pinecone 命名空间，
+全部完成后按伙伴原子地切换。由入库 worker 的 cron 任务 reindex_embeddings_task 定期执行，
+迁移通过 scripts/reindex_embeddings.py start 发起。
+
+- 迁移中的伙伴 companion.reindex_model 为目标模型。检索和入库在切换前始终使用伙伴当前的模型
+  (companion.embedding_model) 和它的命名空间，旧命名空间中的向量是完整的，迁移期间检索不受影响。
+- 逐个文件复制：按分片清单（没有清单时按 ID 前缀列出）得到向量 ID，从旧命名空间读取文本，
+  用目标模型生成向量后以相同的 ID 和 metadata 写入目标命名空间，完成后记录 file.reindexed_model。
+  文件在复制期间被替换或重试时（updated_at 变化）不记录，下次重新复制。
+- 文件内的进度保存在 Redis 中，任务中断后从上次写入的位置继续；单次执行有时间上限和速率上限。
+- 伙伴的全部文件都复制完、且没有正在入库的文件时，用一条 UPDATE 切换 embedding_model
+  （见 crud_companion.switch_embedding_model），之后删除旧命名空间中的向量。
+"""
+
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional
+
+import redis.asyncio as redis
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.crud import crud_companion, crud_knowledge_file, crud_knowledge_file_part
+from app.db.session import AsyncSessionLocal
+from app.models.companion import Companion
+from app.models.knowledge_file import KnowledgeFile
+from app.services.chunk_manifest import manifest_id_ranges
+from app.services.embedding import vector_namespace
+from app.services.embedding_cache import embed_texts
+from app.services.vector_deletion import (
+    PINECONE_FETCH_BATCH_SIZE,
+    call_pinecone,
+    delete_files_vectors,
+    file_vector_ids,
+    list_ids_by_prefix,
+)
+from app.services.vector_store import get_pinecone_index
+
+logger = logging.getLogger(__name__)
+
+PROGRESS_KEY = "reindex:progress"
+
+
+def _progress_field(model_id: str, file_id) -> str:
+    return f"{model_id}:{file_id}"
+
+
+class _Deadline(Exception):
+    """本次执行的时间用完"""
+
+
+class EmbeddingReindexer:
+    def __init__(self, redis_client: redis.Redis):
+        self.redis = redis_client
+        self.batch_size = min(settings.REINDEX_BATCH_SIZE, PINECONE_FETCH_BATCH_SIZE)
+        self.rate = settings.REINDEX_CHUNKS_PER_SECOND
+        self.deadline = 0.0
+        self._started = 0.0
+        self.copied_chunks = 0
+
+    async def run(self, time_budget: Optional[float] = None) -> Dict[str, int]:
+        """处理迁移中的伙伴，直到全部完成或用完 time_budget 秒，返回本次的统计"""
+        self._started = time.monotonic()
+        self.deadline = self._started + (time_budget or settings.REINDEX_TASK_SECONDS)
+        self.copied_chunks = 0
+        stats = {"companions": 0, "files": 0, "switched": 0}
+
+        async with AsyncSessionLocal() as db:
+            companions = await crud_companion.get_migrating_companions(db)
+        stats["companions"] = len(companions)
+        try:
+            for companion in companions:
+                stats["files"] += await self._migrate_companion(companion)
+                if await self._try_switch(companion):
+                    stats["switched"] += 1
+        except _Deadline:
+            logger.info("模型迁移本次执行时间已用完，下次从断点继续")
+
+        stats["chunks"] = self.copied_chunks
+        metrics.incr("reindex_chunks_copied", self.copied_chunks)
+        metrics.incr("reindex_files_copied", stats["files"])
+        metrics.incr("reindex_companions_switched", stats["switched"])
+        if companions:
+            logger.info(f"模型迁移进度: {stats}")
+        return stats
+
+    async def _migrate_companion(self, companion: Companion) -> int:
+        copied_files = 0
+        while True:
+            async with AsyncSessionLocal() as db:
+                files = await crud_knowledge_file.get_files_to_reindex(
+                    db, companion_id=companion.id, model_id=companion.reindex_model, limit=self.batch_size
+                )
+            if not files:
+                return copied_files
+            progressed = False
+            for db_file in files:
+                if await self._copy_file(companion, db_file):
+                    copied_files += 1
+                    progressed = True
+            if not progressed:
+                # 这一批文件都没能复制（复制期间被修改，或无法列出向量 ID），留给下次执行
+                return copied_files
+
+    async def _file_vector_ids(self, db_file: KnowledgeFile, namespace: str) -> Optional[List[str]]:
+        async with AsyncSessionLocal() as db:
+            manifests = await crud_knowledge_file_part.get_vector_manifests(db, file_ids=[db_file.id])
+        id_ranges = manifest_id_ranges(manifests.get(db_file.id))
+        if id_ranges is not None:
+            return list(file_vector_ids(str(db_file.id), id_ranges))
+        try:
+            vector_ids = await asyncio.to_thread(list_ids_by_prefix, f"{db_file.id}_", namespace)
+        except Exception as e:
+            # pod 索引不支持按前缀列出，又没有分片清单：需要重新处理该文件后才能迁移
+            logger.error(f"无法列出文件 {db_file.id} 的向量 ID，跳过迁移 (可重试该文件后再迁移): {e}")
+            return None
+        return sorted(vector_ids, key=lambda vector_id: int(vector_id.rsplit("_", 1)[1]))
+
+    async def _copy_file(self, companion: Companion, db_file: KnowledgeFile) -> bool:
+        target_model = companion.reindex_model
+        source_namespace = vector_namespace(companion.embedding_model)
+        target_namespace = vector_namespace(target_model)
+        vector_ids = await self._file_vector_ids(db_file, source_namespace)
+        if vector_ids is None:
+            return False
+
+        # 进度与文件的 updated_at 一起保存：文件在中断期间被修改过时从头复制
+        field = _progress_field(target_model, db_file.id)
+        version = db_file.updated_at.isoformat()
+        saved = await self.redis.hget(PROGRESS_KEY, field)
+        position = 0
+        if saved:
+            saved = saved.decode() if isinstance(saved, bytes) else saved
+            saved_version, _, saved_position = saved.rpartition("|")
+            if saved_version == version:
+                position = int(saved_position)
+        index = get_pinecone_index()
+        while position < len(vector_ids):
+            self._check_deadline()
+            batch = vector_ids[position : position + self.batch_size]
+            response = await call_pinecone(
+                index.fetch, f"Pinecone fetch ({len(batch)} ids)", ids=batch, namespace=source_namespace
+            )
+            # 部分向量可能不存在（分片失败时只写入了一部分），只复制存在的
+            found = [response.vectors[vector_id] for vector_id in batch if vector_id in (response.vectors or {})]
+            if found:
+                async with AsyncSessionLocal() as db:
+                    embeddings, _ = await embed_texts(
+                        db, [vector.metadata["text"] for vector in found], target_model
+                    )
+                vectors_to_upsert = [
+                    {"id": vector.id, "values": embedding, "metadata": dict(vector.metadata)}
+                    for vector, embedding in zip(found, embeddings)
+                ]
+                await call_pinecone(
+                    index.upsert,
+                    f"Pinecone upsert ({len(vectors_to_upsert)} vectors)",
+                    vectors=vectors_to_upsert,
+                    namespace=target_namespace,
+                )
+            position += len(batch)
+            await self.redis.hset(PROGRESS_KEY, field, f"{version}|{position}")
+            self.copied_chunks += len(found)
+            await self._throttle()
+
+        async with AsyncSessionLocal() as db:
+            marked = await crud_knowledge_file.mark_file_reindexed(
+                db, file_id=db_file.id, model_id=target_model, updated_at=db_file.updated_at
+            )
+        await self.redis.hdel(PROGRESS_KEY, field)
+        if not marked:
+            logger.info(f"文件 {db_file.id} 在复制期间被修改，下次重新复制")
+        return marked
+
+    async def _try_switch(self, companion: Companion) -> bool:
+        target_model = companion.reindex_model
+        old_namespace = vector_namespace(companion.embedding_model)
+        async with AsyncSessionLocal() as db:
+            switched = await crud_companion.switch_embedding_model(
+                db, companion_id=companion.id, model_id=target_model
+            )
+            if not switched:
+                return False
+            files = await crud_knowledge_file.get_files_by_companion(db=db, companion_id=companion.id)
+            manifests = await crud_knowledge_file_part.get_vector_manifests(
+                db, file_ids=[db_file.id for db_file in files]
+            )
+        logger.info(f"伙伴 {companion.id} 已切换到模型 {target_model}，开始删除旧命名空间中的向量")
+
+        # 切换后旧命名空间不再被读取，删除失败只会留下孤儿向量，由存储对账清理
+        try:
+            await delete_files_vectors(
+                {str(db_file.id): manifest_id_ranges(manifests.get(db_file.id)) for db_file in files},
+                [old_namespace],
+            )
+        except Exception as e:
+            logger.error(f"删除伙伴 {companion.id} 旧命名空间中的向量失败: {e}", exc_info=True)
+        return True
+
+    def _check_deadline(self) -> None:
+        if time.monotonic() >= self.deadline:
+            raise _Deadline()
+
+    async def _throttle(self) -> None:
+        """按 REINDEX_CHUNKS_PER_SECOND 限速：复制得比配额快时等待"""
+        if self.rate <= 0:
+            return
+        ahead = self.copied_chunks / self.rate - (time.monotonic() - self._started)
+        if ahead > 0:
+            await asyncio.sleep(min(ahead, max(0.0, self.deadline - time.monotonic())))
@@ -0,0 +1,325 @@
+# app/services/storage_reconciler.py
+
+"""
+定期对账：以 Postgres 中的 knowledge_files / companions 为准，清理各处泄漏的存储，
+并找回停滞的入库任务。由清理 worker 的 cron 任务 reconcile_storage_task 定期执行。
+
+- 入库：长时间没有进展的 PROCESSING 分片标记为 FAILED（保留断点，可重试），
+  长时间未开始的 PENDING 分片 / UPLOADED 文件重新入队，分片已全部结束却停在 PROCESSING 的文件重新汇总状态。
+  重新入队的任务可能与仍在排队的原任务（例如排队很久的批量任务）重复，任务 ID 不一定相同，
+  所以不依赖任务去重：拆分前用条件 UPDATE 认领文件（UPLOADED -> PROCESSING），处理分片前认领分片
+  （见 crud_knowledge_file.transition_status / crud_knowledge_file_part.claim_part），认领失败的任务直接跳过
+- 替换文件后没能清理掉的旧分片、软删除后没能清理完的伙伴：补做清理
+- Pinecone：逐个命名空间按 ID 前缀找出所属文件已不存在的向量并删除
+- uploads/：删除没有对应文件记录的目录，以及文件目录里残留的临时 / 旧文件
+- Redis：删除伙伴已不存在的 chat_history:{companion_id}:{user_id} 对话记忆
+
+后三项每次只扫描一段（Pinecone 分页 token、uploads 目录名、Redis SCAN 游标保存在 Redis 中），
+下次从上次停下的位置继续，扫完一轮后从头开始；单次执行的耗时与数据总量无关。
+每一项独立执行，一项失败不影响其他项。
+"""
+
+import asyncio
+import logging
+import shutil
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from uuid import UUID
+
+import redis.asyncio as redis
+
+from app.core.config import settings
+from app.core.job_queues import enqueue_task
+from app.core.metrics import metrics
+from app.crud import crud_companion, crud_knowledge_file, crud_knowledge_file_part
+from app.db.session import AsyncSessionLocal
+from app.services.knowledge_service import KnowledgeService
+from app.services.knowledge_upload import UPLOAD_DIR
+from app.services.memory_manager import MEMORY_KEY_PREFIX
+from app.services.vector_deletion import delete_ids
+from app.services.vector_store import get_pinecone_index
+
+logger = logging.getLogger(__name__)
+
+CURSOR_KEY = "reconcile:cursors"
+STALE_ERROR_MESSAGE = "WorkerLost: 分片长时间没有进展（worker 崩溃或任务丢失），可以重试"
+
+
+def _parse_uuid(value: str) -> Optional[UUID]:
+    try:
+        return UUID(value)
+    except ValueError:
+        return None
+
+
+def _older_than(path: Path, seconds: int) -> bool:
+    try:
+        return time.time() - path.stat().st_mtime > seconds
+    except FileNotFoundError:
+        return False
+
+
+def _remove_path(path: Path) -> None:
+    if path.is_dir():
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        path.unlink(missing_ok=True)
+
+
+class StorageReconciler:
+    def __init__(self, redis_client: redis.Redis, knowledge_service: KnowledgeService):
+        self.redis = redis_client
+        self.knowledge_service = knowledge_service
+        self.batch_size = settings.RECONCILE_BATCH_SIZE
+        self.max_pages = settings.RECONCILE_MAX_PAGES
+        self.grace_seconds = settings.RECONCILE_GRACE_SECONDS
+
+    async def run(self) -> Dict[str, int]:
+        """执行一轮对账，返回每一项处理的数量"""
+        report: Dict[str, int] = {}
+        for name, step in (
+            ("stale_ingestion", self.recover_stale_ingestion),
+            ("superseded_parts", self.retire_superseded_parts),
+            ("deleted_companions", self.purge_deleted_companions),
+            ("orphan_vectors", self.remove_orphan_vectors),
+            ("orphan_uploads", self.remove_orphan_uploads),
+            ("orphan_memory_keys", self.remove_orphan_memory_keys),
+        ):
+            try:
+                report[name] = await step()
+            except Exception as e:
+                logger.error(f"对账步骤 {name} 失败: {e}", exc_info=True)
+                report[name] = 0
+                metrics.incr(f"reconcile_errors:{name}")
+                continue
+            metrics.incr(f"reconcile_{name}", report[name])
+        logger.info(f"存储对账完成: {report}")
+        return report
+
+    # --- 游标 ---
+
+    async def _get_cursor(self, name: str) -> Optional[str]:
+        value = await self.redis.hget(CURSOR_KEY, name)
+        return value.decode() if isinstance(value, bytes) else value
+
+    async def _set_cursor(self, name: str, value: Optional[str]) -> None:
+        if value:
+            await self.redis.hset(CURSOR_KEY, name, value)
+        else:
+            await self.redis.hdel(CURSOR_KEY, name)
+
+    # --- 数据库中的停滞状态 ---
+
+    async def recover_stale_ingestion(self) -> int:
+        stale_after = settings.RECONCILE_STALE_SECONDS
+        async with AsyncSessionLocal() as db:
+            failed_file_ids = await crud_knowledge_file_part.fail_stale_parts(
+                db, older_than_seconds=stale_after, error_message=STALE_ERROR_MESSAGE
+            )
+            pending_parts = await crud_knowledge_file_part.get_stale_pending_parts(
+                db, older_than_seconds=stale_after, limit=self.batch_size
+            )
+            uploaded = await crud_knowledge_file.get_stale_files(
+                db, status="UPLOADED", older_than_seconds=self.grace_seconds, limit=self.batch_size
+            )
+            processing = await crud_knowledge_file.get_stale_files(
+                db, status="PROCESSING", older_than_seconds=stale_after, limit=self.batch_size
+            )
+            # 拆分阶段就中断的文件没有任何分片，需要重新拆分
+            without_parts = [
+                file_id
+                for file_id in processing
+                if not (await crud_knowledge_file_part.get_parts_summary(db, file_id=file_id)).total
+            ]
+
+        for file_id in dict.fromkeys(failed_file_ids + [f for f in processing if f not in without_parts]):
+            await self.knowledge_service.finalize_file(file_id)
+        for file_id, part_no in pending_parts:
+            await enqueue_task(self.redis, "process_file_part_task", file_id, part_no)
+        # 拆分阶段就中断的文件先退回 UPLOADED，才能被重新认领拆分（期间状态有变化说明已有任务接手）
+        requeue = list(uploaded)
+        async with AsyncSessionLocal() as db:
+            for file_id in without_parts:
+                if await crud_knowledge_file.transition_status(
+                    db,
+                    file_id=file_id,
+                    from_status="PROCESSING",
+                    to_status="UPLOADED",
+                    older_than_seconds=stale_after,
+                ):
+                    requeue.append(file_id)
+        # replace=True：如果之前有过分片，沿用其中未变化的向量并清理残留
+        for file_id in requeue:
+            await enqueue_task(self.redis, "process_file_task", file_id, replace=True)
+
+        recovered = len(failed_file_ids) + len(pending_parts) + len(uploaded) + len(processing)
+        if recovered:
+            logger.warning(
+                f"找回停滞的入库: {len(failed_file_ids)} 个文件的分片标记失败, {len(pending_parts)} 个分片重新入队, "
+                f"{len(requeue)} 个文件重新入队, {len(processing)} 个文件重新汇总"
+            )
+        return recovered
+
+    async def retire_superseded_parts(self) -> int:
+        async with AsyncSessionLocal() as db:
+            file_ids = await crud_knowledge_file_part.get_files_with_superseded_parts(db, limit=self.batch_size)
+        for file_id in file_ids:
+            await self.knowledge_service.retire_superseded_parts(file_id)
+        return len(file_ids)
+
+    async def purge_deleted_companions(self) -> int:
+        async with AsyncSessionLocal() as db:
+            companion_ids = await crud_companion.get_deleted_companion_ids(
+                db, older_than_seconds=self.grace_seconds, limit=self.batch_size
+            )
+        for companion_id in companion_ids:
+            await enqueue_task(self.redis, "cleanup_companion_task", companion_id)
+        return len(companion_ids)
+
+    # --- Pinecone ---
+
+    def _list_namespaces(self) -> List[str]:
+        """索引中的全部命名空间（模型迁移期间新旧模型各一个）；取不到时只处理默认命名空间"""
+        try:
+            namespaces = get_pinecone_index().describe_index_stats().namespaces or {}
+        except Exception as e:
+            logger.info(f"无法获取 Pinecone 命名空间列表，只对账默认命名空间: {e}")
+            return [""]
+        return sorted(set(namespaces) | {""})
+
+    def _list_vector_page(self, namespace: str, pagination_token: Optional[str]) -> Tuple[List[str], Optional[str]]:
+        response = get_pinecone_index().list_paginated(
+            limit=self.batch_size, pagination_token=pagination_token, namespace=namespace
+        )
+        ids = [item.id for item in response.vectors or []]
+        next_token = response.pagination.next if response.pagination else None
+        return ids, next_token
+
+    async def remove_orphan_vectors(self) -> int:
+        """
+        向量 ID 为 f"{file_id}_{编号}"：按页列出 ID，所属文件已不存在的向量即为孤儿。
+        文件记录总是先于向量写入，所以不会误删正在入库的文件的向量。
+        每个命名空间有各自的分页游标。
+        """
+        removed = 0
+        for namespace in await asyncio.to_thread(self._list_namespaces):
+            cursor_name = f"vectors:{namespace}" if namespace else "vectors"
+            token = await self._get_cursor(cursor_name)
+            for _ in range(self.max_pages):
+                try:
+                    ids, token = await asyncio.to_thread(self._list_vector_page, namespace, token)
+                except Exception as e:
+                    # pod 索引不支持按 ID 列出，只能跳过这一项
+                    logger.info(f"无法列出 Pinecone 向量 ID，跳过向量对账: {e}")
+                    return removed
+
+                ids_by_file: Dict[UUID, List[str]] = {}
+                for vector_id in ids:
+                    file_id = _parse_uuid(vector_id.rsplit("_", 1)[0])
+                    if file_id is not None:
+                        ids_by_file.setdefault(file_id, []).append(vector_id)
+                async with AsyncSessionLocal() as db:
+                    existing = await crud_knowledge_file.get_existing_file_ids(db, file_ids=list(ids_by_file))
+                orphans = [
+                    vector_id
+                    for file_id, file_ids in ids_by_file.items()
+                    if file_id not in existing
+                    for vector_id in file_ids
+                ]
+                if orphans:
+                    await delete_ids(orphans, namespace, verify=False)
+                    removed += len(orphans)
+                if not token:
+                    break
+
+            await self._set_cursor(cursor_name, token)
+        return removed
+
+    # --- uploads/ ---
+
+    async def remove_orphan_uploads(self) -> int:
+        """
+        按目录名顺序每次检查一批伙伴目录。没有文件记录的文件目录、文件目录中除当前文件外
+        超过宽限期的残留（.uploading / .replace-* 暂存文件、替换后未删掉的旧文件）都会被删除。
+        只处理修改时间早于宽限期的条目，避免与正在进行的上传冲突。
+        """
+        cursor = await self._get_cursor("uploads") or ""
+        companion_dirs = await asyncio.to_thread(self._next_companion_dirs, cursor)
+        removed = 0
+        for companion_dir in companion_dirs:
+            removed += await self._reconcile_companion_dir(companion_dir)
+        # 不足一批说明已经扫到末尾，下次从头开始
+        next_cursor = companion_dirs[-1].name if len(companion_dirs) == self.batch_size else None
+        await self._set_cursor("uploads", next_cursor)
+        return removed
+
+    def _next_companion_dirs(self, after: str) -> List[Path]:
+        if not UPLOAD_DIR.is_dir():
+            return []
+        names = sorted(entry.name for entry in UPLOAD_DIR.iterdir() if entry.is_dir() and entry.name > after)
+        return [UPLOAD_DIR / name for name in names[: self.batch_size]]
+
+    async def _reconcile_companion_dir(self, companion_dir: Path) -> int:
+        file_dirs = {
+            file_id: entry
+            for entry in companion_dir.iterdir()
+            if (file_id := _parse_uuid(entry.name)) is not None
+        }
+        async with AsyncSessionLocal() as db:
+            files = await crud_knowledge_file.get_files_by_ids(db, file_ids=list(file_dirs))
+        live_paths = {db_file.id: Path(db_file.file_path).name for db_file in files}
+
+        leftovers: List[Path] = []
+        for file_id, file_dir in file_dirs.items():
+            if file_id not in live_paths:
+                if _older_than(file_dir, self.grace_seconds):
+                    leftovers.append(file_dir)
+                continue
+            leftovers += [
+                entry
+                for entry in file_dir.iterdir()
+                if entry.name != live_paths[file_id] and _older_than(entry, self.grace_seconds)
+            ]
+
+        def remove():
+            for path in leftovers:
+                _remove_path(path)
+            try:
+                companion_dir.rmdir()  # 只有目录已空时才会成功
+            except OSError:
+                pass
+
+        await asyncio.to_thread(remove)
+        if leftovers:
+            logger.info(f"删除 {companion_dir} 下 {len(leftovers)} 个无主的上传文件 / 目录")
+        return len(leftovers)
+
+    # --- Redis 对话记忆 ---
+
+    async def remove_orphan_memory_keys(self) -> int:
+        """SCAN chat_history:* ，删除伙伴已不存在（或已软删除）的对话记忆"""
+        cursor = int(await self._get_cursor("memory") or 0)
+        removed = 0
+        for _ in range(self.max_pages):
+            cursor, keys = await self.redis.scan(
+                cursor=cursor, match=f"{MEMORY_KEY_PREFIX}:*", count=self.batch_size
+            )
+            keys_by_companion: Dict[UUID, List] = {}
+            for key in keys:
+                name = key.decode() if isinstance(key, bytes) else key
+                # 第二段不是 UUID 的旧格式 key 带有过期时间，交给 Redis 自然过期
+                companion_id = _parse_uuid(name.split(":")[1]) if name.count(":") >= 2 else None
+                if companion_id is not None:
+                    keys_by_companion.setdefault(companion_id, []).append(key)
+            if keys_by_companion:
+                async with AsyncSessionLocal() as db:
+                    live = await crud_companion.get_live_companion_ids(db, list(keys_by_companion))
+                orphans = [key for companion_id, ks in keys_by_companion.items() if companion_id not in live for key in ks]
+                if orphans:
+                    removed += await self.redis.unlink(*orphans)
+            if cursor == 0:
+                break
+
+        await self._set_cursor("memory", str(cursor) if cursor else None)
+        return removed
@@ -0,0 +1,178 @@
+# app/services/vector_deletion.py
+
+"""
+按向量 ID 删除 Pinecone 中的向量。
+
+入库时每个分片都记录了文本块清单（向量编号），删除文件时据此生成确定的向量 ID
+f"{file_id}_{编号}"，分批按 ID 删除：不依赖 metadata filter（大索引上很慢，
+serverless 索引不支持），并能报告删除了多少、抽样核验后还剩多少。
+
+没有完整清单的文件（早于清单的旧数据、处理未完成的分片）退回到按 ID 前缀列出后删除，
+索引不支持前缀列出时再退回 metadata filter 删除。
+
+同一个向量 ID 可能同时存在于多个命名空间（模型迁移期间，见 embedding.vector_namespace），
+调用方传入需要清理的全部命名空间。
+"""
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.services.chunk_manifest import iter_range_numbers
+from app.services.ingestion_pipeline import retry_with_backoff
+from app.services.vector_store import get_pinecone_index, is_transient_pinecone_error
+
+logger = logging.getLogger(__name__)
+
+PINECONE_DELETE_BATCH_SIZE = 1000
+# fetch 把 ID 放在查询串里，单次不宜过多
+PINECONE_FETCH_BATCH_SIZE = 100
+
+
+@dataclass
+class DeletionReport:
+    requested: int = 0  # 发出删除请求的向量 ID 数
+    batches: int = 0
+    verified: int = 0  # 删除后抽样核验的 ID 数
+    remaining: int = 0  # 核验时仍然存在的 ID 数
+    method: str = "ids"  # ids / prefix / filter
+
+    def merge(self, other: "DeletionReport") -> None:
+        self.requested += other.requested
+        self.batches += other.batches
+        self.verified += other.verified
+        self.remaining += other.remaining
+        if other.method != "ids":
+            self.method = other.method
+
+
+def file_vector_ids(file_id: str, id_ranges: Iterable[Tuple[int, int]]) -> Iterator[str]:
+    for number in iter_range_numbers(id_ranges):
+        yield f"{file_id}_{number}"
+
+
+async def call_pinecone(func, description: str, **kwargs):
+    return await retry_with_backoff(
+        lambda: asyncio.to_thread(func, **kwargs),
+        is_retryable=is_transient_pinecone_error,
+        max_attempts=settings.PINECONE_MAX_ATTEMPTS,
+        base_delay=settings.PINECONE_RETRY_BASE_DELAY,
+        description=description,
+    )
+
+
+def _sample(ids: List[str], size: int) -> List[str]:
+    """在全部 ID 中均匀抽取 size 个用于核验"""
+    if size <= 0:
+        return []
+    if len(ids) <= size:
+        return ids
+    step = len(ids) / size
+    return [ids[int(i * step)] for i in range(size)]
+
+
+async def _count_existing(ids: List[str], namespace: str) -> int:
+    index = get_pinecone_index()
+    existing = 0
+    for i in range(0, len(ids), PINECONE_FETCH_BATCH_SIZE):
+        batch = ids[i : i + PINECONE_FETCH_BATCH_SIZE]
+        response = await call_pinecone(
+            index.fetch, f"Pinecone fetch ({len(batch)} ids)", ids=batch, namespace=namespace
+        )
+        existing += len(response.vectors or {})
+    return existing
+
+
+async def delete_ids(vector_ids: List[str], namespace: str = "", verify: bool = True) -> DeletionReport:
+    """按 ID 分批删除（单次最多 1000 个），瞬时错误自动退避重试；verify=True 时删除后抽样核验"""
+    index = get_pinecone_index()
+    report = DeletionReport(requested=len(vector_ids))
+    for i in range(0, len(vector_ids), PINECONE_DELETE_BATCH_SIZE):
+        batch = vector_ids[i : i + PINECONE_DELETE_BATCH_SIZE]
+        await call_pinecone(index.delete, f"Pinecone delete ({len(batch)} ids)", ids=batch, namespace=namespace)
+        report.batches += 1
+
+    if verify:
+        sample = _sample(vector_ids, settings.PINECONE_DELETE_VERIFY_SAMPLE)
+        report.verified = len(sample)
+        report.remaining = await _count_existing(sample, namespace)
+    return report
+
+
+def list_ids_by_prefix(prefix: str, namespace: str = "") -> List[str]:
+    """按 ID 前缀列出向量 ID（只有 serverless 索引支持）"""
+    ids: List[str] = []
+    for page in get_pinecone_index().list(prefix=prefix, namespace=namespace):
+        ids.extend(page)
+    return ids
+
+
+async def _delete_without_manifest(file_id: str, namespace: str) -> DeletionReport:
+    try:
+        vector_ids = await asyncio.to_thread(list_ids_by_prefix, f"{file_id}_", namespace)
+    except Exception as e:
+        # pod 索引不支持按前缀列出 ID，只能按 metadata filter 删除（无法统计数量）
+        logger.info(f"按前缀列出 file_id '{file_id}' 的向量失败 ({e})，改用 metadata filter 删除")
+        index = get_pinecone_index()
+        await call_pinecone(
+            index.delete, "Pinecone delete (filter)", filter={"file_id": {"$eq": file_id}}, namespace=namespace
+        )
+        return DeletionReport(method="filter")
+
+    report = await delete_ids(vector_ids, namespace)
+    report.method = "prefix"
+    return report
+
+
+async def delete_files_vectors(
+    file_id_ranges: Dict[str, Optional[List[Tuple[int, int]]]], namespaces: Sequence[str] = ("",)
+) -> DeletionReport:
+    """
+    删除若干文件在 namespaces 中的全部向量。file_id_ranges 为 {file_id: 向量编号区间}
+    （见 chunk_manifest.manifest_id_ranges）：有区间的文件合并成一个 ID 列表分批删除，
+    区间为 None 的文件逐个退回前缀列出 / filter 删除。
+    """
+    started = time.perf_counter()
+    vector_ids = [
+        vector_id
+        for file_id, id_ranges in file_id_ranges.items()
+        if id_ranges is not None
+        for vector_id in file_vector_ids(file_id, id_ranges)
+    ]
+    report = DeletionReport()
+    for namespace in namespaces:
+        if vector_ids:
+            report.merge(await delete_ids(vector_ids, namespace))
+        for file_id, id_ranges in file_id_ranges.items():
+            if id_ranges is None:
+                report.merge(await _delete_without_manifest(file_id, namespace))
+
+    metrics.incr("vector_delete_files", len(file_id_ranges))
+    metrics.incr("vector_delete_requested", report.requested)
+    metrics.incr("vector_delete_batches", report.batches)
+    metrics.incr("vector_delete_verified", report.verified)
+    metrics.incr("vector_delete_remaining", report.remaining)
+    metrics.incr(f"vector_delete_method_{report.method}")
+    metrics.observe("vector_delete_seconds", time.perf_counter() - started)
+
+    message = (
+        f"{len(file_id_ranges)} 个文件的向量删除完成 (method={report.method}): 请求删除 {report.requested} 个, "
+        f"{report.batches} 批, 抽样核验 {report.verified} 个, 仍存在 {report.remaining} 个"
+    )
+    if report.remaining:
+        # Pinecone 的删除是最终一致的，刚删除时少量 ID 仍可读到不一定是失败
+        logger.warning(message)
+    else:
+        logger.info(message)
+    return report
+
+
+async def delete_file_vectors(
+    file_id: str, id_ranges: Optional[List[Tuple[int, int]]], namespaces: Sequence[str] = ("",)
+) -> DeletionReport:
+    """删除一个文件的全部向量；id_ranges 为 None 时退回前缀列出 / filter 删除"""
+    return await delete_files_vectors({file_id: id_ranges}, namespaces)
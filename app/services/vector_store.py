@@ -0,0 +1,48 @@
+# app/services/vector_store.py
+
+"""
+进程级共享的 Pinecone 客户端与索引句柄。
+
+与 embedding 模型一样按需初始化：导入本模块不会发起任何网络请求，
+第一次真正访问向量库时才会检查索引是否存在。
+"""
+
+import logging
+import threading
+
+import urllib3
+from pinecone import Pinecone
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+_pinecone_index = None
+_pinecone_lock = threading.Lock()
+
+# 限流与服务端暂时不可用，重试通常能成功
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+def get_pinecone_index():
+    """返回共享的 Pinecone Index 句柄，首次调用时连接并校验索引（线程安全）"""
+    global _pinecone_index
+    if _pinecone_index is None:
+        with _pinecone_lock:
+            if _pinecone_index is None:
+                logger.info("Initializing Pinecone client...")
+                pinecone = Pinecone(api_key=settings.PINECONE_API_KEY)
+                index_name = settings.PINECONE_INDEX_NAME
+                # 目前的策略是要求索引必须预先存在
+                if index_name not in pinecone.list_indexes().names():
+                    raise ValueError(f"Pinecone index '{index_name}' does not exist.")
+                _pinecone_index = pinecone.Index(index_name)
+    return _pinecone_index
+
+
+def is_transient_pinecone_error(exc: BaseException) -> bool:
+    """判断 Pinecone 调用的错误是否值得重试：限流 / 5xx / 连接与超时错误"""
+    status = getattr(exc, "status", None) or getattr(exc, "status_code", None)
+    if status is not None:
+        return int(status) in RETRYABLE_STATUS_CODES
+    return isinstance(exc, (ConnectionError, TimeoutError, urllib3.exceptions.HTTPError))
@@ -0,0 +1,199 @@
+# scripts/embedding_benchmark.py
+
+"""
+Embedding 后端工具：导出 / 精度校验 / 性能基准。
+
+用法（在项目根目录下执行）:
+    python scripts/embedding_benchmark.py export            # 导出并 int8 量化 ONNX 模型
+    python scripts/embedding_benchmark.py check             # 与 sentence-transformers 参考向量对比
+    python scripts/embedding_benchmark.py bench --threads 8 # 单条查询延迟 + 批量吞吐
+    python scripts/embedding_benchmark.py batching a.pdf b.pdf  # 定长批次 vs 按 token 预算分桶
+"""
+
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+
+# 将项目的根目录添加到 Python 的模块搜索路径中
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import numpy as np
+
+from app.core.config import settings
+from app.services.embedding import (
+    ONNX_FP32_FILE,
+    ONNX_INT8_FILE,
+    OnnxEmbeddingModel,
+    create_embedding_model,
+    encode_by_token_budget,
+    export_onnx_model,
+    onnx_model_dir,
+    token_lengths,
+)
+
+SAMPLE_QUERIES = [
+    "我明天要面试了，好紧张，怎么办？",
+    "公司的年假政策是怎样规定的？",
+    "项目代号 ZX-2049 由谁负责？",
+    "How do I reset my password?",
+    "请总结一下这份员工手册的报销流程。",
+    "bge-large-zh-v1.5 的向量维度是多少？",
+    "周末有什么适合放松的活动推荐吗",
+    "合同第 12 条关于违约金的约定是什么",
+]
+
+SAMPLE_PASSAGE = (
+    "员工因公出差产生的交通、住宿和餐饮费用，应在出差结束后十个工作日内提交报销申请，"
+    "并附上发票原件。单笔金额超过五千元的报销需要部门经理和财务总监共同审批。"
+)
+
+
+def _reference_model():
+    from sentence_transformers import SentenceTransformer
+
+    return SentenceTransformer(settings.EMBEDDING_MODEL_NAME, cache_folder=settings.MODEL_CACHE_DIR)
+
+
+def cmd_export(args):
+    path = export_onnx_model(args.model, quantize=not args.no_quantize)
+    print(f"ONNX 模型已导出: {path}")
+
+
+def cmd_check(args):
+    model_dir = onnx_model_dir()
+    reference = _reference_model()
+    texts = SAMPLE_QUERIES + [SAMPLE_PASSAGE] * 2
+    expected = reference.encode(texts, normalize_embeddings=True)
+
+    for model_file in (ONNX_FP32_FILE, ONNX_INT8_FILE):
+        if not (model_dir / model_file).exists():
+            print(f"[skip] {model_file} 不存在")
+            continue
+        candidate = OnnxEmbeddingModel(model_dir, model_file=model_file, num_threads=args.threads)
+        actual = candidate.encode(texts)
+        cosine = np.sum(expected * actual, axis=1)
+
+        # 检索关心的是排序是否一致：比较 query -> passage 的相似度排名
+        ref_rank = np.argsort(-(expected[:-2] @ expected[-1]))
+        new_rank = np.argsort(-(actual[:-2] @ actual[-1]))
+
+        print(
+            f"{model_file}: cosine(min/mean)={cosine.min():.4f}/{cosine.mean():.4f}, "
+            f"top-3 ranking identical={list(ref_rank[:3]) == list(new_rank[:3])}"
+        )
+        if cosine.min() < args.min_cosine:
+            print(f"  !! 最小余弦相似度低于阈值 {args.min_cosine}")
+            sys.exit(1)
+
+
+def _bench(name, model, repeat, batch):
+    model.encode(SAMPLE_QUERIES[0])  # 预热
+
+    latencies = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        model.encode(SAMPLE_QUERIES[i % len(SAMPLE_QUERIES)])
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+
+    passages = [SAMPLE_PASSAGE] * batch
+    start = time.perf_counter()
+    model.encode(passages)
+    throughput = batch / (time.perf_counter() - start)
+
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(
+        f"{name:<24} query p50={statistics.median(latencies):7.1f}ms p95={p95:7.1f}ms | "
+        f"ingest {throughput:6.1f} chunks/s"
+    )
+
+
+def cmd_bench(args):
+    model_dir = onnx_model_dir()
+    if not args.skip_reference:
+        _bench("sentence-transformers", _reference_model(), args.repeat, args.batch)
+    for model_file in (ONNX_FP32_FILE, ONNX_INT8_FILE):
+        if (model_dir / model_file).exists():
+            model = OnnxEmbeddingModel(model_dir, model_file=model_file, num_threads=args.threads)
+            _bench(f"onnx {model_file}", model, args.repeat, args.batch)
+
+
+def _load_pdf_chunks(paths):
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+    from langchain_community.document_loaders import PyPDFLoader
+
+    # 与 KnowledgeService 使用相同的切分参数
+    splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
+    texts = []
+    for path in paths:
+        texts.extend(chunk.page_content for chunk in splitter.split_documents(PyPDFLoader(path).load()))
+    return texts
+
+
+def cmd_batching(args):
+    model = create_embedding_model()
+    texts = _load_pdf_chunks(args.pdfs)
+    lengths = token_lengths(model, texts)
+    print(
+        f"{len(texts)} chunks, tokens min/median/max = "
+        f"{min(lengths)}/{int(statistics.median(lengths))}/{max(lengths)}"
+    )
+    model.encode(texts[:8])  # 预热
+
+    # 基线：与改造前一致，按文档顺序每 100 个文本块调用一次 encode
+    start = time.perf_counter()
+    baseline = np.concatenate([
+        np.asarray(model.encode(texts[i : i + 100], batch_size=args.fixed_batch_size))
+        for i in range(0, len(texts), 100)
+    ])
+    fixed_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    adaptive = np.concatenate([
+        encode_by_token_budget(model, texts[i : i + args.window], args.token_budget)
+        for i in range(0, len(texts), args.window)
+    ])
+    adaptive_seconds = time.perf_counter() - start
+
+    drift = float(np.max(np.abs(baseline - adaptive)))
+    print(f"fixed batches      : {len(texts) / fixed_seconds:7.1f} chunks/s")
+    print(f"token-budget batches: {len(texts) / adaptive_seconds:7.1f} chunks/s "
+          f"({fixed_seconds / adaptive_seconds:.2f}x), max |Δ| = {drift:.2e}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_export = sub.add_parser("export", help="导出 ONNX 模型并做 int8 动态量化")
+    p_export.add_argument("--model", default=settings.EMBEDDING_MODEL_NAME, help="默认为当前配置的模型")
+    p_export.add_argument("--no-quantize", action="store_true")
+    p_export.set_defaults(func=cmd_export)
+
+    p_check = sub.add_parser("check", help="与参考模型比较向量精度")
+    p_check.add_argument("--threads", type=int, default=settings.EMBEDDING_ONNX_THREADS)
+    p_check.add_argument("--min-cosine", type=float, default=0.98)
+    p_check.set_defaults(func=cmd_check)
+
+    p_bench = sub.add_parser("bench", help="延迟与吞吐基准测试")
+    p_bench.add_argument("--threads", type=int, default=settings.EMBEDDING_ONNX_THREADS)
+    p_bench.add_argument("--repeat", type=int, default=50)
+    p_bench.add_argument("--batch", type=int, default=64)
+    p_bench.add_argument("--skip-reference", action="store_true")
+    p_bench.set_defaults(func=cmd_bench)
+
+    p_batching = sub.add_parser("batching", help="用真实 PDF 对比定长批次与按 token 预算分桶的吞吐")
+    p_batching.add_argument("pdfs", nargs="+")
+    p_batching.add_argument("--window", type=int, default=settings.INGEST_EMBED_WINDOW)
+    p_batching.add_argument("--token-budget", type=int, default=settings.EMBEDDING_BATCH_TOKEN_BUDGET)
+    p_batching.add_argument("--fixed-batch-size", type=int, default=32)
+    p_batching.set_defaults(func=cmd_batching)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+# scripts/password_hash_benchmark.py
+
+"""
+登录风暴下的事件循环延迟：在事件循环中直接计算 bcrypt vs 放到密码哈希线程池。
+
+模拟 --logins 个并发登录（每个做一次 verify_password），同时用一个探针协程每 10ms 醒来一次，
+记录它实际醒来比预期晚了多少（即事件循环被阻塞的时间，对话流的每个 token 都要经历这段延迟）。
+
+用法（在项目根目录下执行）:
+    python scripts/password_hash_benchmark.py                  # 默认 50 个并发登录
+    python scripts/password_hash_benchmark.py --logins 200 --workers 4
+"""
+
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from pathlib import Path
+
+# 将项目的根目录添加到 Python 的模块搜索路径中
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from app.core.config import settings
+from app.core import security
+
+PROBE_INTERVAL = 0.01
+
+
+async def probe(lags: list, stop: asyncio.Event) -> None:
+    while not stop.is_set():
+        expected = time.perf_counter() + PROBE_INTERVAL
+        await asyncio.sleep(PROBE_INTERVAL)
+        lags.append(max(0.0, time.perf_counter() - expected))
+
+
+async def inline_login(password: str, hashed: str) -> bool:
+    # 改造前的做法：在异步函数中直接调用同步的 bcrypt
+    return security.verify_password(password, hashed)
+
+
+async def pooled_login(password: str, hashed: str) -> bool:
+    try:
+        return await security.verify_password_async(password, hashed)
+    except security.PasswordHashingBusy:
+        return False
+
+
+async def run_storm(login, logins: int, hashed: str) -> dict:
+    lags: list = []
+    stop = asyncio.Event()
+    probe_task = asyncio.create_task(probe(lags, stop))
+    await asyncio.sleep(PROBE_INTERVAL * 5)
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(login("correct horse battery staple", hashed) for _ in range(logins)))
+    elapsed = time.perf_counter() - started
+
+    stop.set()
+    await probe_task
+    lags.sort()
+    return {
+        "elapsed": elapsed,
+        "accepted": sum(results),
+        "lag_p50": statistics.median(lags) * 1000,
+        "lag_p99": lags[int(len(lags) * 0.99) - 1] * 1000 if len(lags) >= 100 else lags[-1] * 1000,
+        "lag_max": lags[-1] * 1000,
+    }
+
+
+def report(name: str, result: dict, logins: int) -> None:
+    print(
+        f"{name:<8} {result['elapsed']:7.2f}s  {logins / result['elapsed']:7.1f} 登录/s  "
+        f"成功 {result['accepted']}/{logins}  "
+        f"循环延迟 p50 {result['lag_p50']:7.1f}ms  p99 {result['lag_p99']:7.1f}ms  max {result['lag_max']:7.1f}ms"
+    )
+
+
+async def main_async(args) -> None:
+    settings.PASSWORD_HASH_WORKERS = args.workers
+    settings.PASSWORD_HASH_MAX_QUEUE = args.max_queue
+    hashed = security.get_password_hash("correct horse battery staple")
+
+    started = time.perf_counter()
+    security.verify_password("correct horse battery staple", hashed)
+    print(f"单次 verify_password: {(time.perf_counter() - started) * 1000:.1f}ms")
+    print(f"{args.logins} 个并发登录, 线程池 {args.workers} 个线程, 排队上限 {args.max_queue}\n")
+
+    report("inline", await run_storm(inline_login, args.logins, hashed), args.logins)
+    report("pool", await run_storm(pooled_login, args.logins, hashed), args.logins)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logins", type=int, default=50)
+    parser.add_argument("--workers", type=int, default=settings.PASSWORD_HASH_WORKERS)
+    parser.add_argument("--max-queue", type=int, default=settings.PASSWORD_HASH_MAX_QUEUE)
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+# scripts/reindex_embeddings.py
+
+"""
+embedding 模型迁移工具（见 app/services/reindex_service.py）。
+
+用法（在项目根目录下执行）:
+    python scripts/reindex_embeddings.py start "BAAI/bge-m3@onnx"   # 把所有伙伴标记为迁移到该模型
+    python scripts/reindex_embeddings.py status                       # 每个迁移中伙伴的复制进度
+    python scripts/reindex_embeddings.py run --seconds 600            # 在前台推进迁移（不等 cron）
+
+模型标识为 "模型名@后端"。start 之后由入库 worker 的 cron 任务按 REINDEX_CHUNKS_PER_SECOND
+限速复制，每个伙伴复制完成后自动切换。迁移开始后新建的伙伴仍使用旧模型，再执行一次 start
+即可把它们加入迁移。所有伙伴切换完成后，再把 EMBEDDING_MODEL_NAME /
+EMBEDDING_BACKEND 改为新模型：新创建的伙伴才会使用它（已切换的伙伴记录了自己的模型，不受影响）。
+"""
+
+import argparse
+import asyncio
+import sys
+from pathlib import Path
+
+# 将项目的根目录添加到 Python 的模块搜索路径中
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import redis.asyncio as redis
+
+from app.core.config import settings
+from app.core.snapshot_cache import configure_snapshot_caches
+from app.crud import crud_companion
+from app.db import base  # noqa: F401  注册全部模型
+from app.db.session import AsyncSessionLocal
+from app.services.embedding import embedding_model_id, vector_namespace
+from app.services.reindex_service import PROGRESS_KEY, EmbeddingReindexer
+
+
+async def cmd_start(args) -> None:
+    if "@" not in args.model:
+        sys.exit("模型标识应为 \"模型名@后端\"，例如 BAAI/bge-m3@onnx")
+    redis_client = redis.from_url(settings.REDIS_URL, encoding="utf-8")
+    # 让 API 进程中缓存的伙伴快照失效（快照里有 reindex_model）
+    configure_snapshot_caches(redis_client)
+    try:
+        async with AsyncSessionLocal() as db:
+            count = await crud_companion.start_embedding_migration(
+                db, model_id=args.model, default_model_id=embedding_model_id()
+            )
+    finally:
+        await redis_client.aclose()
+    print(f"{count} 个伙伴开始迁移到 {args.model} (命名空间 '{vector_namespace(args.model)}')")
+
+
+async def cmd_status(args) -> None:
+    async with AsyncSessionLocal() as db:
+        progress = await crud_companion.get_embedding_migration_progress(db)
+    redis_client = redis.from_url(settings.REDIS_URL, encoding="utf-8")
+    try:
+        partial = await redis_client.hlen(PROGRESS_KEY)
+    finally:
+        await redis_client.aclose()
+
+    if not progress:
+        print("没有迁移中的伙伴")
+        return
+    copied_total = sum(copied for _, _, copied, _ in progress)
+    files_total = sum(total for _, _, _, total in progress)
+    for companion_id, model_id, copied, total in progress:
+        print(f"{companion_id}  {model_id}  {copied}/{total} 个文件")
+    print(f"合计: {len(progress)} 个伙伴, {copied_total}/{files_total} 个文件, {partial} 个文件复制到一半")
+
+
+async def cmd_run(args) -> None:
+    redis_client = redis.from_url(settings.REDIS_URL, encoding="utf-8")
+    configure_snapshot_caches(redis_client)
+    try:
+        stats = await EmbeddingReindexer(redis_client).run(time_budget=args.seconds)
+    finally:
+        await redis_client.aclose()
+    print(stats)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_start = sub.add_parser("start", help="把所有伙伴标记为迁移到指定模型")
+    p_start.add_argument("model", help='目标模型标识 "模型名@后端"')
+    p_start.set_defaults(func=cmd_start)
+
+    p_status = sub.add_parser("status", help="查看迁移进度")
+    p_status.set_defaults(func=cmd_status)
+
+    p_run = sub.add_parser("run", help="在前台推进迁移")
+    p_run.add_argument("--seconds", type=float, default=settings.REINDEX_TASK_SECONDS)
+    p_run.set_defaults(func=cmd_run)
+
+    args = parser.parse_args()
+    asyncio.run(args.func(args))
+
+
+if __name__ == "__main__":
+    main()
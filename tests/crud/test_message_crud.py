@@ -0,0 +1,132 @@
+# tests/crud/test_message_crud.py
+
+import uuid
+from datetime import datetime, timedelta
+from uuid import UUID
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.pagination import decode_cursor, page_cursors
+from app.crud import crud_message
+from app.models.message import Message
+
+
+async def _add_messages(db: AsyncSession, companion_id: UUID, user_id: UUID, contents, start: datetime):
+    messages = [
+        Message(
+            id=uuid.uuid4(),
+            content=content,
+            role="user",
+            companion_id=companion_id,
+            user_id=user_id,
+            created_at=start + timedelta(seconds=i // 2),  # 每两条时间相同，靠 id 区分先后
+        )
+        for i, content in enumerate(contents)
+    ]
+    # 提交后属性会过期，先按 (created_at, id) 排好顺序记下内容
+    contents = [message.content for message in sorted(messages, key=lambda m: (m.created_at, m.id))]
+    db.add_all(messages)
+    await db.commit()
+    return contents
+
+
+async def _page(db, companion_id, user_id, limit, before=None, after=None):
+    """模拟 read_messages：解析游标、取一页并生成下一步的游标"""
+    before_key = decode_cursor(before, (datetime, UUID)) if before else None
+    after_key = decode_cursor(after, (datetime, UUID)) if after else None
+    messages, has_more = await crud_message.get_messages_page(
+        db=db, companion_id=companion_id, user_id=user_id, limit=limit, before=before_key, after=after_key
+    )
+    cursors = page_cursors(
+        messages,
+        lambda message: (message.created_at, message.id),
+        has_more=has_more,
+        before=before_key is not None,
+        after=after_key is not None,
+    )
+    return [message.content for message in messages], cursors
+
+
+@pytest.mark.asyncio
+async def test_get_messages_page_walks_both_directions(db_session: AsyncSession):
+    companion_id, user_id = uuid.uuid4(), uuid.uuid4()
+    contents = await _add_messages(
+        db_session, companion_id, user_id, [f"m{i}" for i in range(7)], datetime(2026, 10, 19, 12, 0, 0)
+    )
+    # 其他用户 / 其他伙伴的消息不会出现在结果里
+    await _add_messages(db_session, companion_id, uuid.uuid4(), ["other user"], datetime(2026, 10, 19, 12, 0, 1))
+    await _add_messages(db_session, uuid.uuid4(), user_id, ["other companion"], datetime(2026, 10, 19, 12, 0, 1))
+
+    # 最新一页：只有更早的游标
+    page, (before, after) = await _page(db_session, companion_id, user_id, 3)
+    assert page == contents[4:]
+    assert before is not None and after is None
+
+    # 向更早翻页，直到没有更早的记录；每一页都有指向更新记录的游标
+    older = [page]
+    while before:
+        page, (before, after) = await _page(db_session, companion_id, user_id, 3, before=before)
+        older.insert(0, page)
+        assert after is not None
+    assert older == [contents[:1], contents[1:4], contents[4:]]
+
+    # 从最早一页的 after_cursor 向更新翻页，直到没有更新的记录；每一页都有指向更早记录的游标
+    newer = []
+    while after:
+        page, (before, after) = await _page(db_session, companion_id, user_id, 3, after=after)
+        newer.append(page)
+        assert before is not None
+    assert newer == [contents[1:4], contents[4:]]
+
+
+def _word_similarity(query, content):
+    """SQLite 中代替 pg_trgm 的 word_similarity：包含搜索词时按长度给分"""
+    return len(query) / len(content) if query.lower() in content.lower() else 0.0
+
+
+@pytest.mark.asyncio
+async def test_search_messages_escapes_wildcards_and_pages_by_rank(db_session: AsyncSession, monkeypatch):
+    monkeypatch.setattr(crud_message.settings, "MESSAGE_SEARCH_BACKEND", "trgm")
+    connection = await db_session.connection()
+    await connection.run_sync(
+        lambda sync_connection: sync_connection.connection.dbapi_connection.create_function(
+            "word_similarity", 2, _word_similarity
+        )
+    )
+    companion_id, user_id = uuid.uuid4(), uuid.uuid4()
+    await _add_messages(
+        db_session,
+        companion_id,
+        user_id,
+        # 最后两条时间、相关度都相同，只能靠 id 区分先后
+        ["100% sure", "1000 sure", "a_b", "axb", "a_b again", "a_b a_b", "a_b", "a_b"],
+        datetime(2026, 10, 19, 12, 0, 0),
+    )
+
+    # % 和 _ 按字面匹配，而不是 LIKE 通配符
+    hits, has_more = await crud_message.search_messages(
+        db=db_session, companion_id=companion_id, user_id=user_id, query="100%"
+    )
+    assert [message.content for message, _ in hits] == ["100% sure"]
+    assert not has_more
+
+    # 逐页取完，结果与一次取完相同：相关度降序，相同时新的在前
+    everything, _ = await crud_message.search_messages(
+        db=db_session, companion_id=companion_id, user_id=user_id, query="a_b", limit=100
+    )
+    assert "axb" not in [message.content for message, _ in everything]
+    keys = [(rank, message.created_at, message.id) for message, rank in everything]
+    assert len(keys) == 5
+    assert keys == sorted(keys, reverse=True)
+
+    paged, after = [], None
+    while True:
+        hits, has_more = await crud_message.search_messages(
+            db=db_session, companion_id=companion_id, user_id=user_id, query="a_b", limit=2, after=after
+        )
+        paged += [(rank, message.created_at, message.id) for message, rank in hits]
+        if not has_more:
+            break
+        after = paged[-1]
+    assert paged == keys
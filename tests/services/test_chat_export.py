@@ -0,0 +1,88 @@
+# tests/services/test_chat_export.py
+
+import gzip
+import json
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+import pytest_asyncio
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from app.models.message import Message
+from app.services import chat_export
+
+
+async def _export(user_id, companion_id=None, fmt="ndjson", compress=False) -> bytes:
+    return b"".join([chunk async for chunk in chat_export.iter_export(user_id, companion_id, fmt, compress)])
+
+
+@pytest_asyncio.fixture
+async def conversations(db_session: AsyncSession, monkeypatch):
+    """两个用户的聊天记录：user 与两个伙伴各有几条，other_user 与同一个伙伴也有记录"""
+    user_id, other_user_id = uuid.uuid4(), uuid.uuid4()
+    companion_ids = sorted([uuid.uuid4(), uuid.uuid4()])
+    start = datetime(2026, 10, 19, 12, 0, 0)
+    rows = [
+        (user_id, companion_ids[1], "你好，\"引号\" 与换行\n都要转义"),
+        (user_id, companion_ids[0], "first"),
+        (other_user_id, companion_ids[0], "someone else"),
+        (user_id, companion_ids[0], "second"),
+        (user_id, companion_ids[1], "再见"),
+    ]
+    messages = [
+        Message(
+            id=uuid.uuid4(),
+            content=content,
+            role="user",
+            companion_id=companion_id,
+            user_id=owner,
+            created_at=start + timedelta(seconds=i),
+        )
+        for i, (owner, companion_id, content) in enumerate(rows)
+    ]
+    db_session.add_all(messages)
+    await db_session.commit()
+
+    # 导出使用自己的会话；指向测试数据库，并把分块调小，让内容跨越多个块
+    monkeypatch.setattr(
+        chat_export, "AsyncSessionLocal", sessionmaker(bind=db_session.bind, class_=AsyncSession)
+    )
+    monkeypatch.setattr(chat_export, "EXPORT_CHUNK_BYTES", 64)
+    return user_id, other_user_id, companion_ids
+
+
+@pytest.mark.asyncio
+async def test_export_ndjson_contains_only_the_callers_messages_in_order(conversations):
+    user_id, _, companion_ids = conversations
+
+    lines = (await _export(user_id)).decode().splitlines()
+    exported = [json.loads(line) for line in lines]
+
+    # 按伙伴、时间正序
+    assert [m["content"] for m in exported] == ["first", "second", "你好，\"引号\" 与换行\n都要转义", "再见"]
+    assert [m["companion_id"] for m in exported] == [str(companion_ids[0])] * 2 + [str(companion_ids[1])] * 2
+
+    only_first = [json.loads(line) for line in (await _export(user_id, companion_ids[0])).decode().splitlines()]
+    assert [m["content"] for m in only_first] == ["first", "second"]
+
+
+@pytest.mark.asyncio
+async def test_export_json_is_a_valid_array_even_when_empty(conversations):
+    user_id, other_user_id, companion_ids = conversations
+
+    exported = json.loads(await _export(user_id, fmt="json"))
+    assert [m["content"] for m in exported] == ["first", "second", "你好，\"引号\" 与换行\n都要转义", "再见"]
+    assert json.loads(await _export(other_user_id, companion_ids[1], fmt="json")) == []
+    assert json.loads(await _export(uuid.uuid4(), fmt="json")) == []
+
+
+@pytest.mark.asyncio
+async def test_export_gzip_decompresses_to_the_plain_export(conversations):
+    user_id, other_user_id, _ = conversations
+
+    for fmt in ("ndjson", "json"):
+        assert gzip.decompress(await _export(user_id, fmt=fmt, compress=True)) == await _export(user_id, fmt=fmt)
+    assert json.loads(gzip.decompress(await _export(uuid.uuid4(), fmt="json", compress=True))) == []
+    assert gzip.decompress(await _export(other_user_id, compress=True)).decode().count("\n") == 1
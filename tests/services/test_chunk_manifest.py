@@ -0,0 +1,38 @@
+# tests/services/test_chunk_manifest.py
+
+from app.services.chunk_manifest import (
+    build_reuse_map,
+    chunk_digest,
+    iter_range_numbers,
+    manifest_id_ranges,
+    pack_manifest,
+    unpack_manifest,
+    vector_numbers,
+)
+
+
+def test_manifest_round_trip():
+    entries = [(0, chunk_digest("第一段")), (100001, chunk_digest("第二段"))]
+    blob = pack_manifest(entries)
+    assert len(blob) == 16 * len(entries)
+    assert unpack_manifest(blob) == entries
+
+
+def test_reuse_map_and_vanished_vectors():
+    old = pack_manifest([(0, chunk_digest("保留")), (1, chunk_digest("删除")), (2, chunk_digest("保留"))])
+    reuse = build_reuse_map([old])
+    assert reuse[chunk_digest("保留")] == 0
+
+    # 新版本：沿用 “保留” 的向量 0，新增一个文本块
+    new = pack_manifest([(0, chunk_digest("保留")), (100000, chunk_digest("新增"))])
+    assert vector_numbers([old]) - vector_numbers([new]) == {1, 2}
+
+
+def test_manifest_id_ranges_compress_all_parts():
+    part0 = pack_manifest([(i, chunk_digest(str(i))) for i in range(3)])
+    part1 = pack_manifest([(100000, chunk_digest("a")), (100001, chunk_digest("b")), (2, chunk_digest("2"))])
+    ranges = manifest_id_ranges([part0, part1])
+    assert ranges == [(0, 3), (100000, 100002)]
+    assert list(iter_range_numbers(ranges)) == [0, 1, 2, 100000, 100001]
+    # 没有完整清单时由调用方退回其他删除方式
+    assert manifest_id_ranges(None) is None
@@ -0,0 +1,132 @@
+# tests/services/test_companion_cleanup.py
+
+import fnmatch
+import uuid
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import pytest
+
+from app.services import companion_cleanup
+from app.services.chunk_manifest import pack_manifest
+
+
+class MemoryRedis:
+    """只实现 delete_companion_memories 用到的 SCAN / UNLINK"""
+
+    def __init__(self, keys):
+        self.keys = set(keys)
+
+    async def scan_iter(self, match, count=None):
+        for key in sorted(self.keys):
+            if fnmatch.fnmatchcase(key, match):
+                yield key
+
+    async def unlink(self, *keys):
+        removed = self.keys & set(keys)
+        self.keys -= removed
+        return len(removed)
+
+
+class FakeSession:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class FakeRagService:
+    def __init__(self):
+        self.calls = []
+
+    async def delete_vectors_by_companion_id(self, companion_id, file_id_ranges=None, namespaces=("",)):
+        self.calls.append((companion_id, file_id_ranges, list(namespaces)))
+
+
+@pytest.fixture
+def fakes(monkeypatch, tmp_path):
+    companion_id = uuid.uuid4()
+    other_companion_id = uuid.uuid4()
+    companion = SimpleNamespace(
+        id=companion_id, deleted_at=datetime.now(timezone.utc), embedding_model=None, reindex_model="bge-small"
+    )
+    files = []
+    for name in ("a.txt", "b.pdf"):
+        file_id = uuid.uuid4()
+        file_path = tmp_path / str(companion_id) / str(file_id) / name
+        file_path.parent.mkdir(parents=True)
+        file_path.write_bytes(b"data")
+        files.append(SimpleNamespace(id=file_id, file_path=str(file_path)))
+    state = SimpleNamespace(
+        companion=companion,
+        files=files,
+        deleted=[],
+        rag=FakeRagService(),
+        redis=MemoryRedis(
+            [
+                f"chat_history:{companion_id}:user-1",
+                f"chat_history:{companion_id}:user-2",
+                f"chat_history:{other_companion_id}:user-1",
+            ]
+        ),
+        companion_dir=tmp_path / str(companion_id),
+    )
+
+    async def get_companion_by_id(db, companion_id, include_deleted=False):
+        assert include_deleted
+        return state.companion if companion_id == state.companion.id else None
+
+    async def get_files_by_companion(db, *, companion_id):
+        return state.files
+
+    async def get_vector_manifests(db, *, file_ids):
+        # 第二个文件有分片尚未完成，没有完整清单
+        return {files[0].id: [pack_manifest([(0, b"\0" * 8), (1, b"\0" * 8)]), pack_manifest([(2, b"\0" * 8)])]}
+
+    async def delete_files_by_companion(db, *, companion_id):
+        state.deleted.append(("files", companion_id))
+
+    async def delete_companion(db, *, db_companion):
+        state.deleted.append(("companion", db_companion.id))
+
+    monkeypatch.setattr(companion_cleanup, "AsyncSessionLocal", FakeSession)
+    monkeypatch.setattr(companion_cleanup, "rag_service", state.rag)
+    monkeypatch.setattr(companion_cleanup.crud_companion, "get_companion_by_id", get_companion_by_id)
+    monkeypatch.setattr(companion_cleanup.crud_companion, "delete_companion", delete_companion)
+    monkeypatch.setattr(companion_cleanup.crud_knowledge_file, "get_files_by_companion", get_files_by_companion)
+    monkeypatch.setattr(companion_cleanup.crud_knowledge_file, "delete_files_by_companion", delete_files_by_companion)
+    monkeypatch.setattr(companion_cleanup.crud_knowledge_file_part, "get_vector_manifests", get_vector_manifests)
+    return state
+
+
+@pytest.mark.asyncio
+async def test_purge_companion_removes_vectors_memories_uploads_and_rows(fakes):
+    companion_id = fakes.companion.id
+
+    assert await companion_cleanup.purge_companion(companion_id, fakes.redis) is True
+
+    assert fakes.rag.calls == [
+        (
+            str(companion_id),
+            {str(fakes.files[0].id): [(0, 3)], str(fakes.files[1].id): None},
+            ["", "bge-small"],
+        )
+    ]
+    assert all(key.split(":")[1] != str(companion_id) for key in fakes.redis.keys)
+    assert len(fakes.redis.keys) == 1
+    assert not fakes.companion_dir.exists()
+    assert fakes.deleted == [("files", companion_id), ("companion", companion_id)]
+
+
+@pytest.mark.asyncio
+async def test_purge_companion_skips_live_or_missing_companion(fakes):
+    fakes.companion.deleted_at = None
+
+    assert await companion_cleanup.purge_companion(fakes.companion.id, fakes.redis) is False
+    assert await companion_cleanup.purge_companion(uuid.uuid4(), fakes.redis) is False
+
+    assert fakes.rag.calls == []
+    assert len(fakes.redis.keys) == 3
+    assert fakes.companion_dir.exists()
+    assert fakes.deleted == []
@@ -0,0 +1,59 @@
+# tests/services/test_embedding.py
+
+import numpy as np
+import pytest
+
+from types import SimpleNamespace
+
+from app.core.config import settings
+from app.services.embedding import (
+    companion_namespaces,
+    create_embedding_model,
+    encode_by_token_budget,
+    vector_namespace,
+)
+
+
+class FakeModel:
+    """没有 tokenizer 的假模型：按字符数估计长度，向量的第一维就是文本长度。"""
+
+    max_seq_length = 512
+
+    def __init__(self):
+        self.batches = []
+
+    def encode(self, texts, batch_size=32):
+        self.batches.append(list(texts))
+        return np.array([[len(text), 1.0] for text in texts], dtype=np.float32)
+
+
+def test_encode_by_token_budget_restores_input_order():
+    texts = ["a" * n for n in (50, 3, 400, 7, 120, 3, 60)]
+    model = FakeModel()
+
+    embeddings = encode_by_token_budget(model, texts, token_budget=400)
+
+    assert embeddings[:, 0].tolist() == [len(text) for text in texts]
+    for batch in model.batches:
+        # 每个批次都满足 token 预算（单条超长文本独占一个批次）
+        assert len(batch) == 1 or len(batch) * max(len(t) for t in batch) <= 400
+    # 短文本应该被合并到同一个批次中
+    assert any(len(batch) > 2 for batch in model.batches)
+
+
+def test_companion_namespaces_during_migration():
+    assert vector_namespace(None) == ""
+    assert vector_namespace("BAAI/bge-m3@onnx") == "BAAI-bge-m3-onnx"
+
+    companion = SimpleNamespace(embedding_model=None, reindex_model=None)
+    assert companion_namespaces(companion) == [""]
+    companion.reindex_model = "BAAI/bge-m3@onnx"
+    assert companion_namespaces(companion) == ["", "BAAI-bge-m3-onnx"]
+
+
+def test_missing_onnx_model_fails_fast_instead_of_exporting(monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, "MODEL_CACHE_DIR", str(tmp_path))
+
+    with pytest.raises(RuntimeError, match="embedding_benchmark.py export --model BAAI/bge-m3"):
+        create_embedding_model("BAAI/bge-m3", "onnx")
+    assert not (tmp_path / "onnx").exists()
@@ -0,0 +1,98 @@
+# tests/services/test_ingestion_pipeline.py
+
+import asyncio
+
+import pytest
+
+from app.services.ingestion_pipeline import (
+    BackgroundIterator,
+    ContiguousWatermark,
+    retry_with_backoff,
+    run_bounded_pipeline,
+)
+
+
+@pytest.mark.asyncio
+async def test_pipeline_consumes_everything_with_bounded_inflight():
+    consumed = []
+    inflight = 0
+    peak = 0
+
+    async def produce():
+        for i in range(10):
+            yield i
+
+    async def consume(item):
+        nonlocal inflight, peak
+        inflight += 1
+        peak = max(peak, inflight)
+        await asyncio.sleep(0.001)
+        consumed.append(item)
+        inflight -= 1
+
+    await run_bounded_pipeline(produce(), consume, max_inflight=3)
+
+    assert sorted(consumed) == list(range(10))
+    assert peak <= 3
+
+
+@pytest.mark.asyncio
+async def test_pipeline_propagates_consumer_errors():
+    async def produce():
+        for i in range(100):
+            yield i
+
+    async def consume(item):
+        if item == 5:
+            raise RuntimeError("upsert failed")
+
+    with pytest.raises(RuntimeError, match="upsert failed"):
+        await run_bounded_pipeline(produce(), consume, max_inflight=2)
+
+
+@pytest.mark.asyncio
+async def test_background_iterator_batches_and_propagates_errors():
+    def chunks():
+        yield from range(7)
+        raise ValueError("broken page")
+
+    batches = []
+    with pytest.raises(ValueError, match="broken page"):
+        async with BackgroundIterator(chunks, maxsize=2) as stream:
+            async for batch in stream.iter_batches(max_size=3):
+                batches.append(batch)
+
+    assert [item for batch in batches for item in batch] == list(range(7))
+    assert all(len(batch) <= 3 for batch in batches)
+
+
+def test_watermark_only_advances_over_contiguous_batches():
+    watermark = ContiguousWatermark(start=100)
+    assert watermark.mark_done(200, 300) == 100
+    assert watermark.mark_done(100, 200) == 300
+    assert watermark.mark_done(300, 350) == 350
+
+
+@pytest.mark.asyncio
+async def test_retry_with_backoff_retries_only_transient_errors():
+    calls = 0
+
+    async def flaky():
+        nonlocal calls
+        calls += 1
+        if calls < 3:
+            raise ConnectionError("reset by peer")
+        return "ok"
+
+    result = await retry_with_backoff(
+        flaky, is_retryable=lambda e: isinstance(e, ConnectionError), max_attempts=5, base_delay=0.001
+    )
+    assert result == "ok" and calls == 3
+
+    async def broken():
+        raise ValueError("bad vector dimension")
+
+    with pytest.raises(ValueError):
+        await retry_with_backoff(
+            broken, is_retryable=lambda e: isinstance(e, ConnectionError), max_attempts=5, base_delay=0.001
+        )
@@ -0,0 +1,20 @@
+# tests/services/test_job_queues.py
+
+from uuid import uuid4
+
+from app.core.job_queues import CLEANUP_QUEUE, INGEST_QUEUE, TASK_QUEUES, task_job_id
+
+
+def test_job_ids_are_derived_from_business_ids():
+    file_id, other_id = uuid4(), uuid4()
+    assert task_job_id("process_file_task", file_id) == f"process_file:{file_id}"
+    assert task_job_id("process_file_task", file_id) == task_job_id("process_file_task", file_id)
+    assert task_job_id("process_file_part_task", file_id, 3) == f"process_file_part:{file_id}:3"
+    # 替换文件内容时带上内容哈希：不同内容的任务互不去重
+    assert task_job_id("process_file_task", file_id, job_suffix="abc") == f"process_file:{file_id}:abc"
+    # 批量任务与文件顺序无关
+    assert task_job_id("process_file_batch_task", [file_id, other_id]) == task_job_id(
+        "process_file_batch_task", [other_id, file_id]
+    )
+    assert TASK_QUEUES["process_file_part_task"] == INGEST_QUEUE
+    assert TASK_QUEUES["cleanup_pinecone_task"] == CLEANUP_QUEUE
@@ -0,0 +1,73 @@
+# tests/services/test_knowledge_upload.py
+
+import io
+import zipfile
+
+import pytest
+
+from app.services.knowledge_upload import ArchiveError, iter_archive_members
+
+
+def _zip(entries):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for name, data in entries:
+            archive.writestr(name, data)
+    buffer.seek(0)
+    return buffer
+
+
+def test_archive_members_are_filtered_and_flattened():
+    archive = _zip([
+        ("faq/常见问题.md", "# 问答"),
+        ("../../etc/passwd.txt", "root"),
+        ("__MACOSX/faq/._常见问题.md", "junk"),
+        ("image.png", b"\x89PNG"),
+        ("faq/", ""),
+    ])
+    members = [(name, member.read()) for name, member in iter_archive_members(archive, max_total_bytes=1024)]
+    assert members == [("常见问题.md", "# 问答".encode()), ("passwd.txt", b"root")]
+
+
+def test_archive_over_size_limit_is_rejected():
+    archive = _zip([("big.txt", "x" * 2048)])
+    with pytest.raises(ArchiveError):
+        list(iter_archive_members(archive, max_total_bytes=1024))
+
+
+def test_invalid_archive_is_rejected():
+    with pytest.raises(ArchiveError):
+        list(iter_archive_members(io.BytesIO(b"not a zip"), max_total_bytes=1024))
+
+
+
+def _corrupt(archive: io.BytesIO, original: bytes, replacement: bytes) -> io.BytesIO:
+    data = archive.getvalue()
+    assert data.count(original) == 1
+    return io.BytesIO(data.replace(original, replacement))
+
+
+def _patch_central_header(archive: io.BytesIO, offset: int, value: bytes) -> io.BytesIO:
+    """改写中央目录中第一个成员的字段（zipfile 按中央目录判断是否加密、用哪种压缩方式）"""
+    data = bytearray(archive.getvalue())
+    start = data.index(b"PK\x01\x02") + offset
+    data[start : start + len(value)] = value
+    return io.BytesIO(bytes(data))
+
+
+@pytest.mark.parametrize(
+    "archive",
+    [
+        # 数据被改动，CRC 校验失败
+        _corrupt(_zip([("a.txt", "hello world")]), b"hello world", b"hello there"),
+        # 标记为加密的成员
+        _patch_central_header(_zip([("a.txt", "hello")]), 8, b"\x01\x00"),
+        # 不支持的压缩方式
+        _patch_central_header(_zip([("a.txt", "hello")]), 10, b"\x63\x00"),
+    ],
+    ids=["crc", "encrypted", "compression"],
+)
+def test_unreadable_archive_member_is_rejected(archive):
+    with pytest.raises(ArchiveError):
+        for _, member in iter_archive_members(archive, max_total_bytes=1024):
+            member.read()
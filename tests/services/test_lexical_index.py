@@ -0,0 +1,64 @@
+# tests/services/test_lexical_index.py
+
+from app.services.lexical_index import LexicalIndexStore, LexicalSegmentBuilder, tokenize
+from app.services.rag_service import reciprocal_rank_fusion
+
+
+def test_tokenize_mixed_chinese_and_latin():
+    tokens = tokenize("知识库 GPT-4o 版本 2024")
+    assert "知识" in tokens and "识库" in tokens and "知" in tokens
+    assert "gpt-4o" in tokens
+    assert "2024" in tokens
+
+
+def test_segment_round_trip_and_bm25_ranking(tmp_path):
+    store = LexicalIndexStore(root=str(tmp_path))
+    builder = LexicalSegmentBuilder(file_id="f1", file_name="handbook.txt")
+    builder.add("f1_0", "公司的年假政策：员工每年享有十天带薪年假。")
+    builder.add("f1_1", "项目代号 ZX-2049 由张三负责。")
+    builder.add("f1_2", "报销流程需要经理审批。")
+    store.write_segment("c1", builder)
+
+    hits = store.search("c1", "ZX-2049 是谁负责的", top_k=2)
+    assert hits[0].vector_id == "f1_1"
+
+    assert store.delete_segment("f1")
+    assert store.search("c1", "ZX-2049", top_k=2) == []
+
+
+def test_delete_segment_removes_all_parts_of_a_file(tmp_path):
+    store = LexicalIndexStore(root=str(tmp_path))
+    for part_no in (0, 1, 2):
+        builder = LexicalSegmentBuilder(file_id="f1", file_name="book.pdf", part_no=part_no)
+        builder.add(f"f1_{part_no * 100000}", f"第 {part_no} 部分 chapter{part_no}")
+        store.write_segment("c1", builder)
+
+    assert {hit.vector_id for hit in store.search("c1", "chapter1 chapter2", top_k=5)} >= {"f1_100000", "f1_200000"}
+
+    assert store.delete_segment("f1")
+    assert list(tmp_path.glob("c1/*")) == []
+
+
+def test_index_cache_is_bounded_and_refreshed_after_interval(tmp_path):
+    writer = LexicalIndexStore(root=str(tmp_path))
+    reader = LexicalIndexStore(root=str(tmp_path), max_companions=2, refresh_seconds=60)
+    for companion_id in ("c1", "c2", "c3"):
+        builder = LexicalSegmentBuilder(file_id=f"{companion_id}-f", file_name="a.txt")
+        builder.add(f"{companion_id}-f_0", f"{companion_id} 年假政策")
+        writer.write_segment(companion_id, builder)
+        reader.search(companion_id, "年假", top_k=1)
+    assert list(reader._cache) == ["c2", "c3"]
+
+    # 另一个进程（writer）写入的新段：刷新间隔内沿用缓存，过期后重新加载
+    builder = LexicalSegmentBuilder(file_id="c3-g", file_name="b.txt")
+    builder.add("c3-g_0", "报销流程")
+    writer.write_segment("c3", builder)
+    assert reader.search("c3", "报销", top_k=1) == []
+    reader._expire("c3")
+    assert reader.search("c3", "报销", top_k=1)[0].vector_id == "c3-g_0"
+
+
+def test_reciprocal_rank_fusion_prefers_documents_in_both_lists():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["c", "d"]])
+    assert fused[0] == "c"
+    assert set(fused) == {"a", "b", "c", "d"}
@@ -0,0 +1,79 @@
+# tests/services/test_pagination.py
+
+import base64
+import json
+from datetime import datetime
+from uuid import UUID, uuid4
+
+import pytest
+
+from app.core.pagination import decode_cursor, encode_cursor, page_cursors
+
+
+def _raw_cursor(value):
+    return base64.urlsafe_b64encode(json.dumps(value).encode()).rstrip(b"=").decode()
+
+
+def test_cursor_round_trip():
+    values = (datetime(2026, 10, 19, 16, 12, 8, 437215), uuid4(), 0.25, "x")
+    cursor = encode_cursor(values)
+    assert "=" not in cursor
+    assert decode_cursor(cursor, (datetime, UUID, float, str)) == values
+    # 整数相关度（例如 0）也能作为 float 还原
+    assert decode_cursor(encode_cursor([0]), (float,)) == (0.0,)
+
+
+@pytest.mark.parametrize(
+    "cursor",
+    [
+        "",
+        "not-a-cursor",
+        encode_cursor([1]),
+        encode_cursor([{"a": 1}, 2]),
+        # 长度正确但类型不对：不能进入查询
+        _raw_cursor([{"dt": 5}, {"uuid": str(uuid4())}]),
+        _raw_cursor([{"dt": "2026-10-19T16:12:08"}, {"uuid": 7}]),
+        _raw_cursor([1, 2]),
+        _raw_cursor(["2026-10-19T16:12:08", str(uuid4())]),
+        _raw_cursor([{"dt": "yesterday"}, {"uuid": str(uuid4())}]),
+    ],
+)
+def test_invalid_cursor_is_rejected(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor, (datetime, UUID))
+
+
+@pytest.mark.parametrize(
+    "rank",
+    [True, "0.5", None],
+)
+def test_invalid_search_cursor_is_rejected(rank):
+    cursor = _raw_cursor([rank, {"dt": "2026-10-19T16:12:08"}, {"uuid": str(uuid4())}])
+    with pytest.raises(ValueError):
+        decode_cursor(cursor, (float, datetime, UUID))
+
+
+@pytest.mark.parametrize(
+    "has_more, before, after, expected",
+    [
+        # 最新一页：只能向更早翻
+        (True, False, False, (True, False)),
+        (False, False, False, (False, False)),
+        # 向更早翻页：更新的一侧一定还有记录
+        (True, True, False, (True, True)),
+        (False, True, False, (False, True)),
+        # 向更新翻页：更早的一侧一定还有记录
+        (True, False, True, (True, True)),
+        (False, False, True, (True, False)),
+    ],
+)
+def test_page_cursors(has_more, before, after, expected):
+    items = [1, 2, 3]
+    before_cursor, after_cursor = page_cursors(items, lambda item: [item], has_more=has_more, before=before, after=after)
+
+    assert (before_cursor is not None, after_cursor is not None) == expected
+    if before_cursor:
+        assert decode_cursor(before_cursor, (int,)) == (1,)
+    if after_cursor:
+        assert decode_cursor(after_cursor, (int,)) == (3,)
+    assert page_cursors([], lambda item: [item], has_more=True, after=True) == (None, None)
@@ -0,0 +1,25 @@
+# tests/services/test_password_hashing.py
+
+import asyncio
+
+import pytest
+
+from app.core import security
+from app.core.config import settings
+
+
+@pytest.mark.asyncio
+async def test_password_hashing_rejects_when_queue_is_full(monkeypatch):
+    monkeypatch.setattr(settings, "PASSWORD_HASH_WORKERS", 1)
+    monkeypatch.setattr(settings, "PASSWORD_HASH_MAX_QUEUE", 1)
+    hashed = security.get_password_hash("secret")
+
+    results = await asyncio.gather(
+        *(security.verify_password_async("secret", hashed) for _ in range(3)), return_exceptions=True
+    )
+
+    assert results.count(True) == 2
+    assert sum(isinstance(result, security.PasswordHashingBusy) for result in results) == 1
+    # 全部结束后名额都已释放
+    await asyncio.sleep(0)
+    assert await security.verify_password_async("wrong", hashed) is False
@@ -0,0 +1,22 @@
+# tests/services/test_pdf_parser.py
+
+from concurrent.futures import ThreadPoolExecutor
+
+from app.services import pdf_parser
+
+
+def test_iter_pdf_pages_yields_pages_in_order(monkeypatch):
+    submitted = []
+
+    def fake_parse(path, start, end):
+        submitted.append((start, end))
+        return [f"page {i}" for i in range(start, end)]
+
+    monkeypatch.setattr(pdf_parser, "_parse_page_range", fake_parse)
+
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        pages = list(pdf_parser.iter_pdf_pages("doc.pdf", executor, pages_per_task=4, max_pending=2, end_page=10))
+
+    assert [page.page_content for page in pages] == [f"page {i}" for i in range(10)]
+    assert [page.metadata["page"] for page in pages] == list(range(10))
+    assert sorted(submitted) == [(0, 4), (4, 8), (8, 10)]
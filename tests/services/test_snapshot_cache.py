@@ -0,0 +1,122 @@
+# tests/services/test_snapshot_cache.py
+
+from typing import Optional
+
+import pytest
+from pydantic import BaseModel
+
+from app.core.snapshot_cache import SnapshotCache
+
+
+class Item(BaseModel):
+    id: str
+    name: str
+
+
+class MemoryRedis:
+    """只实现 SnapshotCache 用到的几个命令"""
+
+    def __init__(self):
+        self.data = {}
+        self.published = []
+
+    async def mget(self, *keys):
+        return [self.data.get(key) for key in keys]
+
+    async def set(self, key, value, ex=None):
+        self.data[key] = value
+
+    def pipeline(self, transaction=True):
+        return MemoryPipeline(self)
+
+
+class MemoryPipeline:
+    def __init__(self, redis):
+        self.redis = redis
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def incr(self, key):
+        self.redis.data[key] = int(self.redis.data.get(key) or 0) + 1
+
+    def expire(self, key, seconds):
+        pass
+
+    def delete(self, key):
+        self.redis.data.pop(key, None)
+
+    def publish(self, channel, message):
+        self.redis.published.append((channel, message))
+
+    async def execute(self):
+        pass
+
+
+def make_cache(redis) -> SnapshotCache:
+    cache = SnapshotCache("test_item", Item, max_entries=2, local_ttl=60, redis_ttl=60)
+    cache.configure(redis)
+    cache.listening = True
+    return cache
+
+
+@pytest.mark.asyncio
+async def test_read_through_and_invalidation():
+    redis = MemoryRedis()
+    cache = make_cache(redis)
+    rows = {"a": Item(id="a", name="v1")}
+    loads = []
+
+    async def load(key) -> Optional[Item]:
+        loads.append(key)
+        return rows.get(key)
+
+    assert (await cache.get("a", lambda: load("a"))).name == "v1"
+    assert (await cache.get("a", lambda: load("a"))).name == "v1"
+    assert loads == ["a"]
+
+    # 其他进程（没有本地条目）从 Redis 一级命中
+    other = make_cache(redis)
+    assert (await other.get("a", lambda: load("a"))).name == "v1"
+    assert loads == ["a"]
+
+    rows["a"] = Item(id="a", name="v2")
+    await cache.invalidate("a")
+    assert redis.published == [(cache.channel, "a")]
+    assert (await cache.get("a", lambda: load("a"))).name == "v2"
+    assert loads == ["a", "a"]
+
+
+@pytest.mark.asyncio
+async def test_stale_fill_after_invalidation_is_ignored():
+    redis = MemoryRedis()
+    cache = make_cache(redis)
+
+    async def stale_load():
+        # 回填期间伙伴被修改：版本号已经变了，按旧版本号写入的条目不会被读到
+        await cache.invalidate("a")
+        return Item(id="a", name="stale")
+
+    await cache.get("a", stale_load)
+
+    async def fresh_load():
+        return Item(id="a", name="fresh")
+
+    assert (await cache.get("a", fresh_load)).name == "fresh"
+
+
+@pytest.mark.asyncio
+async def test_unconfigured_cache_reads_through():
+    cache = SnapshotCache("test_plain", Item, max_entries=2, local_ttl=60, redis_ttl=60)
+    calls = []
+
+    async def load():
+        calls.append(1)
+        return Item(id="a", name="v1")
+
+    await cache.get("a", load)
+    await cache.get("a", load)
+    assert len(calls) == 2
@@ -0,0 +1,151 @@
+# tests/services/test_storage_reconciler.py
+
+import os
+import time
+import uuid
+from types import SimpleNamespace
+
+import pytest
+
+from app.services import storage_reconciler
+from app.services.storage_reconciler import StorageReconciler
+
+
+class MemoryRedis:
+    """只实现游标读写用到的 hash 命令"""
+
+    def __init__(self):
+        self.hashes = {}
+
+    async def hget(self, key, field):
+        return self.hashes.get(key, {}).get(field)
+
+    async def hset(self, key, field, value):
+        self.hashes.setdefault(key, {})[field] = value
+
+    async def hdel(self, key, field):
+        self.hashes.get(key, {}).pop(field, None)
+
+
+class FakeSession:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class FakeIndex:
+    """按命名空间保存向量 ID，list_paginated 每页返回 limit 个"""
+
+    def __init__(self, ids_by_namespace):
+        self.ids_by_namespace = ids_by_namespace
+
+    def describe_index_stats(self):
+        return SimpleNamespace(namespaces={ns: {} for ns in self.ids_by_namespace if ns})
+
+    def list_paginated(self, limit, pagination_token, namespace):
+        ids = self.ids_by_namespace.get(namespace, [])
+        start = int(pagination_token or 0)
+        end = start + limit
+        return SimpleNamespace(
+            vectors=[SimpleNamespace(id=vector_id) for vector_id in ids[start:end]],
+            pagination=SimpleNamespace(next=str(end)) if end < len(ids) else None,
+        )
+
+
+def _age(path, seconds):
+    stamp = time.time() - seconds
+    os.utime(path, (stamp, stamp))
+
+
+@pytest.fixture
+def reconciler(monkeypatch):
+    monkeypatch.setattr(storage_reconciler, "AsyncSessionLocal", FakeSession)
+    service = StorageReconciler(MemoryRedis(), knowledge_service=None)
+    service.batch_size = 10
+    service.max_pages = 10
+    service.grace_seconds = 3600
+    return service
+
+
+@pytest.mark.asyncio
+async def test_remove_orphan_uploads_respects_grace_period_and_live_path(reconciler, monkeypatch, tmp_path):
+    companion_dir = tmp_path / str(uuid.uuid4())
+    live_id, old_orphan_id, new_orphan_id = uuid.uuid4(), uuid.uuid4(), uuid.uuid4()
+
+    live_dir = companion_dir / str(live_id)
+    live_dir.mkdir(parents=True)
+    live_file = live_dir / "current.pdf"
+    replaced_file = live_dir / "previous.pdf"
+    staging_file = live_dir / ".replace-abc"
+    for path in (live_file, replaced_file, staging_file):
+        path.write_bytes(b"data")
+    _age(live_file, 7200)
+    _age(replaced_file, 7200)
+    _age(staging_file, 10)  # 仍在进行中的替换
+
+    old_orphan_dir = companion_dir / str(old_orphan_id)
+    old_orphan_dir.mkdir()
+    (old_orphan_dir / "lost.pdf").write_bytes(b"data")
+    _age(old_orphan_dir, 7200)
+    new_orphan_dir = companion_dir / str(new_orphan_id)
+    new_orphan_dir.mkdir()
+    (new_orphan_dir / "uploading.pdf.uploading").write_bytes(b"data")  # 上传中，文件记录还没提交
+
+    async def get_files_by_ids(db, *, file_ids):
+        assert set(file_ids) == {live_id, old_orphan_id, new_orphan_id}
+        return [SimpleNamespace(id=live_id, file_path=str(live_file))]
+
+    monkeypatch.setattr(storage_reconciler, "UPLOAD_DIR", tmp_path)
+    monkeypatch.setattr(storage_reconciler.crud_knowledge_file, "get_files_by_ids", get_files_by_ids)
+
+    removed = await reconciler.remove_orphan_uploads()
+
+    assert removed == 2
+    assert live_file.exists()
+    assert staging_file.exists()
+    assert not replaced_file.exists()
+    assert not old_orphan_dir.exists()
+    assert new_orphan_dir.exists()
+    # 不足一批，说明已扫到末尾，游标清空
+    assert await reconciler._get_cursor("uploads") is None
+
+
+@pytest.mark.asyncio
+async def test_remove_orphan_vectors_deletes_only_vectors_of_missing_files(reconciler, monkeypatch):
+    live_id, orphan_id, other_orphan_id = uuid.uuid4(), uuid.uuid4(), uuid.uuid4()
+    index = FakeIndex(
+        {
+            "": [f"{live_id}_0", f"{orphan_id}_0", f"{orphan_id}_1", "legacy-vector"],
+            "model-b": [f"{live_id}_0", f"{other_orphan_id}_3"],
+        }
+    )
+    deleted = []
+
+    async def get_existing_file_ids(db, *, file_ids):
+        return {file_id for file_id in file_ids if file_id == live_id}
+
+    async def delete_ids(ids, namespace, verify=True):
+        deleted.append((namespace, sorted(ids)))
+
+    monkeypatch.setattr(storage_reconciler, "get_pinecone_index", lambda: index)
+    monkeypatch.setattr(storage_reconciler, "delete_ids", delete_ids)
+    monkeypatch.setattr(storage_reconciler.crud_knowledge_file, "get_existing_file_ids", get_existing_file_ids)
+    reconciler.batch_size = 3
+    reconciler.max_pages = 1
+
+    # 第一轮每个命名空间只看一页，默认命名空间还剩一页，游标指向下一页
+    assert await reconciler.remove_orphan_vectors() == 3
+    assert deleted == [
+        ("", sorted([f"{orphan_id}_0", f"{orphan_id}_1"])),
+        ("model-b", [f"{other_orphan_id}_3"]),
+    ]
+    assert await reconciler._get_cursor("vectors") == "3"
+    assert await reconciler._get_cursor("vectors:model-b") is None
+
+    # 第二轮从游标处继续：剩下的是非 UUID 前缀的向量，不会被删除，然后游标清空
+    deleted.clear()
+    assert await reconciler.remove_orphan_vectors() == 1
+    assert deleted == [("model-b", [f"{other_orphan_id}_3"])]
+    assert await reconciler._get_cursor("vectors") is None
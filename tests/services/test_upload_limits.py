@@ -0,0 +1,111 @@
+# tests/services/test_upload_limits.py
+
+import hashlib
+import io
+
+import pytest
+
+from app.core.upload_limit import RequestBodyLimitMiddleware
+from app.services.knowledge_upload import UploadTooLarge, save_upload
+
+
+class FakeUpload:
+    def __init__(self, data: bytes):
+        self._buffer = io.BytesIO(data)
+
+    async def read(self, size: int = -1) -> bytes:
+        return self._buffer.read(size)
+
+
+@pytest.mark.asyncio
+async def test_save_upload_streams_and_hashes(tmp_path):
+    data = b"knowledge " * 1000
+    target = tmp_path / "doc.txt"
+
+    size, digest = await save_upload(FakeUpload(data), target, max_bytes=len(data), chunk_size=64)
+
+    assert size == len(data)
+    assert digest == hashlib.sha256(data).hexdigest()
+    assert target.read_bytes() == data
+
+
+@pytest.mark.asyncio
+async def test_save_upload_rejects_oversized_files_without_leftovers(tmp_path):
+    target = tmp_path / "big.txt"
+    with pytest.raises(UploadTooLarge):
+        await save_upload(FakeUpload(b"x" * 1000), target, max_bytes=100, chunk_size=64)
+    assert list(tmp_path.iterdir()) == []
+
+
+async def _call(middleware, headers, chunks):
+    messages = [{"type": "http.request", "body": chunk, "more_body": i < len(chunks) - 1} for i, chunk in enumerate(chunks)]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": "POST", "path": "/upload", "headers": headers}
+    await middleware(scope, receive, send)
+    return sent
+
+
+@pytest.mark.asyncio
+async def test_body_limit_rejects_by_content_length_and_by_streamed_bytes():
+    app_calls = []
+
+    async def app(scope, receive, send):
+        app_calls.append(scope)
+        while (await receive()).get("more_body"):
+            pass
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+    middleware = RequestBodyLimitMiddleware(app, limit_for=lambda scope: 10)
+
+    sent = await _call(middleware, [(b"content-length", b"100")], [b"x" * 100])
+    assert sent[0]["status"] == 413 and app_calls == []
+
+    sent = await _call(middleware, [], [b"x" * 6, b"x" * 6])
+    assert sent[0]["status"] == 413
+
+    sent = await _call(middleware, [], [b"x" * 5])
+    assert sent[0]["status"] == 200
+
+
+@pytest.mark.asyncio
+async def test_body_limit_returns_413_for_chunked_multipart_upload():
+    import httpx
+    from fastapi import FastAPI, File, UploadFile
+
+    app = FastAPI()
+    app.add_middleware(RequestBodyLimitMiddleware, limit_for=lambda scope: 1000)
+
+    @app.post("/upload")
+    async def upload(file: UploadFile = File(...)):
+        return {"size": len(await file.read())}
+
+    boundary = "limit-test"
+
+    def multipart(data: bytes):
+        # 没有 Content-Length：以分块传输的方式发送
+        async def body():
+            yield (
+                f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"a.txt\"\r\n"
+                "Content-Type: text/plain\r\n\r\n"
+            ).encode()
+            for i in range(0, len(data), 256):
+                yield data[i : i + 256]
+            yield f"\r\n--{boundary}--\r\n".encode()
+
+        return body()
+
+    headers = {"content-type": f"multipart/form-data; boundary={boundary}"}
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        response = await client.post("/upload", content=multipart(b"x" * 5000), headers=headers)
+        assert response.status_code == 413
+
+        response = await client.post("/upload", content=multipart(b"x" * 500), headers=headers)
+        assert response.status_code == 200 and response.json() == {"size": 500}